@@ -0,0 +1,205 @@
+import asyncio
+import json
+import random
+import itertools
+import re
+from types import SimpleNamespace
+from typing import Dict, Optional
+
+from aiohttp import web
+
+# =========================
+# Gemini / Webhook の代役
+# =========================
+class FakeUpstream:
+    """
+    ローカルで動く Gemini generateContent と Discord Webhook の代役
+    ネットワークに出ずに on_message を端から端まで動かすためのもの
+
+    Gemini 側は障害も起こせる（実行中に属性を書き換えてよい）
+      gemini_fail_rate   : この割合のリクエストを gemini_fail_status で返す
+      gemini_max_inflight: 同時リクエストがこれを超えたら 429（0 で無制限）
+      gemini_hang_rate   : この割合のリクエストは gemini_hang 秒待ってから応答する
+      gemini_retry_after : 429/503 に付ける Retry-After（None で付けない）
+    生成時間は gemini_latency（最初の断片まで）＋ 断片（gemini_chunk_size 文字）ごとの
+    gemini_chunk_latency。通常版は全部待ってから、ストリーム版（/gemini/stream, SSE）は断片ごとに返す
+    Webhook 側は ?wait=true で送られたメッセージを覚え、編集・削除を受け付ける（messages に今の本文）
+    """
+    def __init__(
+        self, gemini_latency: float = 0.0, webhook_latency: float = 0.0,
+        gemini_fail_rate: float = 0.0, gemini_fail_status: int = 503,
+        gemini_max_inflight: int = 0, gemini_hang_rate: float = 0.0, gemini_hang: float = 60.0,
+        gemini_retry_after: Optional[float] = None, seed: Optional[int] = None,
+        gemini_chunk_latency: float = 0.0, gemini_chunk_size: int = 32
+    ):
+        self.gemini_latency = gemini_latency
+        self.gemini_chunk_latency = gemini_chunk_latency
+        self.gemini_chunk_size = gemini_chunk_size
+        self.webhook_latency = webhook_latency
+        self.gemini_fail_rate = gemini_fail_rate
+        self.gemini_fail_status = gemini_fail_status
+        self.gemini_max_inflight = gemini_max_inflight
+        self.gemini_hang_rate = gemini_hang_rate
+        self.gemini_hang = gemini_hang
+        self.gemini_retry_after = gemini_retry_after
+        self.random = random.Random(seed)
+        self.gemini_calls = 0
+        self.gemini_errors = 0
+        self.gemini_output_chars = 0  # 生成した文字数（生成時間はこれに比例する）
+        self.gemini_inflight = 0
+        self.gemini_peak_inflight = 0
+        self.webhook_calls = 0
+        self.webhook_edits = 0
+        self.webhook_deletes = 0
+        self.messages: Dict[int, str] = {}  # Webhook メッセージID → 本文
+        self._message_ids = itertools.count(1)
+        self.port = None
+        self._runner = None
+
+    @property
+    def gemini_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/gemini"
+
+    @property
+    def gemini_stream_url(self) -> str:
+        return f"http://127.0.0.1:{self.port}/gemini/stream"
+
+    def webhook_url(self, name: str) -> str:
+        return f"http://127.0.0.1:{self.port}/webhooks/{name}"
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_post("/gemini", self.handle_gemini)
+        app.router.add_post("/gemini/stream", self.handle_gemini_stream)
+        app.router.add_post("/webhooks/{name}", self.handle_webhook)
+        app.router.add_patch("/webhooks/{name}/messages/{id}", self.handle_webhook_edit)
+        app.router.add_delete("/webhooks/{name}/messages/{id}", self.handle_webhook_delete)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, "127.0.0.1", 0)
+        await site.start()
+        self.port = site._server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        if self._runner:
+            await self._runner.cleanup()
+
+    async def handle_gemini(self, request: web.Request) -> web.StreamResponse:
+        return await self._track_gemini(self._handle_gemini(request, stream=False))
+
+    async def handle_gemini_stream(self, request: web.Request) -> web.StreamResponse:
+        return await self._track_gemini(self._handle_gemini(request, stream=True))
+
+    async def _track_gemini(self, handler) -> web.StreamResponse:
+        self.gemini_calls += 1
+        self.gemini_inflight += 1
+        self.gemini_peak_inflight = max(self.gemini_peak_inflight, self.gemini_inflight)
+        try:
+            return await handler
+        finally:
+            self.gemini_inflight -= 1
+
+    async def _handle_gemini(self, request: web.Request, stream: bool) -> web.StreamResponse:
+        body = await request.json()
+        if self.gemini_max_inflight and self.gemini_inflight > self.gemini_max_inflight:
+            return self._gemini_error(429)
+        if self.gemini_fail_rate and self.random.random() < self.gemini_fail_rate:
+            return self._gemini_error(self.gemini_fail_status)
+        if self.gemini_hang_rate and self.random.random() < self.gemini_hang_rate:
+            await asyncio.sleep(self.gemini_hang)
+        if self.gemini_latency:
+            await asyncio.sleep(self.gemini_latency)
+        text = self._gemini_text(body["contents"][0]["parts"][0]["text"])
+        self.gemini_output_chars += len(text)
+        size = max(1, self.gemini_chunk_size)
+        chunks = [text[i:i + size] for i in range(0, len(text), size)]
+        if not stream:
+            if self.gemini_chunk_latency:
+                await asyncio.sleep(self.gemini_chunk_latency * len(chunks))
+            return web.json_response({"candidates": [{"content": {"parts": [{"text": text}]}}]})
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        try:
+            for chunk in chunks:
+                if self.gemini_chunk_latency:
+                    await asyncio.sleep(self.gemini_chunk_latency)
+                event = {"candidates": [{"content": {"parts": [{"text": chunk}]}}]}
+                await response.write(f"data: {json.dumps(event, ensure_ascii=False)}\r\n\r\n".encode("utf-8"))
+            await response.write_eof()
+        except ConnectionResetError:
+            pass  # クライアントが途中で切った（タイムアウト・読むのをやめた）
+        return response
+
+    def _gemini_text(self, prompt: str) -> str:
+        batch = re.search(r"Messages \(JSON keyed by id\):\n(.*?)\n\n", prompt, re.S)
+        if batch:
+            messages = json.loads(batch.group(1))
+            result = {key: self._translate(item["message"]) for key, item in messages.items()}
+        else:
+            message = re.search(r"Message: (.*?)\n\n", prompt, re.S)
+            result = self._translate(message.group(1) if message else "")
+        return json.dumps(result, ensure_ascii=False)
+
+    def _gemini_error(self, status: int) -> web.Response:
+        self.gemini_errors += 1
+        headers = {}
+        if self.gemini_retry_after is not None and status in (429, 503):
+            headers["Retry-After"] = str(self.gemini_retry_after)
+        return web.json_response({"error": {"code": status}}, status=status, headers=headers)
+
+    async def handle_webhook(self, request: web.Request) -> web.Response:
+        self.webhook_calls += 1
+        if self.webhook_latency:
+            await asyncio.sleep(self.webhook_latency)
+        payload = await request.json()
+        if request.query.get("wait") != "true":
+            return web.Response(status=204)
+        message_id = next(self._message_ids)
+        self.messages[message_id] = payload["content"]
+        return web.json_response({"id": str(message_id), "content": payload["content"]})
+
+    async def handle_webhook_edit(self, request: web.Request) -> web.Response:
+        self.webhook_edits += 1
+        message_id = int(request.match_info["id"])
+        payload = await request.json()
+        if message_id not in self.messages:
+            return web.json_response({"message": "Unknown Message"}, status=404)
+        self.messages[message_id] = payload["content"]
+        return web.json_response({"id": str(message_id), "content": payload["content"]})
+
+    async def handle_webhook_delete(self, request: web.Request) -> web.Response:
+        self.webhook_deletes += 1
+        if self.messages.pop(int(request.match_info["id"]), None) is None:
+            return web.json_response({"message": "Unknown Message"}, status=404)
+        return web.Response(status=204)
+
+    def _translate(self, message: str) -> dict:
+        return {lang: f"[{lang}] {message}" for lang in ("ja", "en", "ko", "zh")}
+
+# =========================
+# Webhook 送信の差し替え
+# =========================
+class LocalWebhook:
+    """discord.Webhook の send / edit_message / delete_message と同じ呼び方でローカルの代役へ送る"""
+    def __init__(self, session, url: str):
+        self.session = session
+        self.url = url
+
+    async def send(
+        self, content: str, username: str = None, avatar_url: str = None, wait: bool = False, **kwargs
+    ):
+        payload = {"content": content, "username": username, "avatar_url": avatar_url}
+        params = {"wait": "true"} if wait else None
+        async with self.session.post(self.url, json=payload, params=params) as resp:
+            resp.raise_for_status()
+            if wait:
+                return SimpleNamespace(id=int((await resp.json())["id"]))
+
+    async def edit_message(self, message_id: int, content: str = None, **kwargs):
+        async with self.session.patch(f"{self.url}/messages/{message_id}", json={"content": content}) as resp:
+            resp.raise_for_status()
+
+    async def delete_message(self, message_id: int, **kwargs):
+        async with self.session.delete(f"{self.url}/messages/{message_id}") as resp:
+            resp.raise_for_status()
@@ -0,0 +1,435 @@
+"""
+翻訳・学習のホットパスのオフラインベンチマーク
+
+    python -m bench.run --sizes 1000,10000,100000 --out results.json
+    python -m bench.run --suites lookup --sizes 1000000 --compare old.json
+
+ネットワークには出ない（Gemini と Webhook はローカルの aiohttp サーバーで代役）。
+結果は JSON で出力し、--compare で以前の結果との比を表示する。
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from types import SimpleNamespace
+from typing import Callable, Dict, Iterable, List
+
+from bench.synthetic import make_lang_dict, make_logs, make_messages
+from cogs import lang_index, pipeline
+from cogs.lang_store import LangDictStore
+from cogs.model import JsonAIModel
+from cogs.persistence import atomic_write_json
+from cogs.translate_log import TranslateLogWriter, read_log_since
+
+CASES = ["hit", "fuzzy", "miss"]
+SUITES = ["lookup", "log", "train", "e2e"]
+SRC_LANG = "en"
+EDIT_SENTENCES = 4  # 編集ケースのメッセージの文数（最後の1文だけ書き換える）
+MESSAGE_IDS = itertools.count(1)
+
+# =========================
+# 計測
+# =========================
+def percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+def summarize(latencies: List[float], elapsed: float, **fields) -> dict:
+    """latencies と全体時間（秒）から p50/p99 とスループットを出す"""
+    values = sorted(latencies)
+    result = dict(fields)
+    result.update({
+        "n": len(values),
+        "p50_ms": round(percentile(values, 0.50) * 1000, 4),
+        "p99_ms": round(percentile(values, 0.99) * 1000, 4),
+        "max_ms": round((values[-1] if values else 0.0) * 1000, 4),
+        "throughput_per_s": round(len(values) / elapsed, 2) if elapsed > 0 else None,
+    })
+    return result
+
+def time_calls(fn: Callable, inputs: Iterable) -> tuple:
+    latencies = []
+    started = time.perf_counter()
+    for item in inputs:
+        t0 = time.perf_counter()
+        fn(item)
+        latencies.append(time.perf_counter() - t0)
+    return latencies, time.perf_counter() - started
+
+def report(result: dict):
+    label = " ".join(str(result[k]) for k in ("suite", "target", "case", "entries") if k in result)
+    print(
+        f"{label:<60} p50={result['p50_ms']:.3f}ms p99={result['p99_ms']:.3f}ms "
+        f"throughput={result['throughput_per_s']}/s",
+        file=sys.stderr
+    )
+
+def make_store(workdir: str, lang_dict: dict) -> tuple:
+    """一時ディレクトリ上の辞書ストア（索引の構築時間も返す）"""
+    store = LangDictStore(os.path.join(workdir, "lang_dict.json"))
+    t0 = time.perf_counter()
+    store.replace(lang_dict)
+    return store, time.perf_counter() - t0
+
+# =========================
+# 辞書引き
+# =========================
+def bench_lookup(size: int, args, workdir: str) -> List[dict]:
+    lang_dict = make_lang_dict(size, args.seed)
+    store, build_time = make_store(workdir, lang_dict)
+    results = [summarize([build_time], build_time, suite="lookup", target="index.build", case="build", entries=size)]
+
+    targets = [("JsonAIModel.translate_text", JsonAIModel(store).translate_text)]
+    try:
+        from cogs.translate import ModelTranslator
+        targets.append(("ModelTranslator.translate", ModelTranslator(store).translate))
+    except ImportError as e:
+        results.append({"suite": "lookup", "target": "ModelTranslator.translate", "skipped": str(e)})
+
+    for case in CASES:
+        messages = make_messages(lang_dict, args.messages, case, SRC_LANG, args.seed + 1)
+        for name, fn in targets:
+            latencies, elapsed = time_calls(lambda text: fn(text, SRC_LANG), messages)
+            results.append(summarize(latencies, elapsed, suite="lookup", target=name, case=case, entries=size))
+    return results
+
+# =========================
+# ログ書き込み
+# =========================
+async def _bench_log_writer(path: str, records: List[dict]) -> tuple:
+    writer = TranslateLogWriter(path)
+    writer.start()
+    latencies = []
+    started = time.perf_counter()
+    for record in records:
+        t0 = time.perf_counter()
+        writer.write(record)
+        latencies.append(time.perf_counter() - t0)
+    await writer.close()  # 全件がディスクに書かれるまで
+    return latencies, time.perf_counter() - started
+
+def bench_log(args, workdir: str) -> List[dict]:
+    records = make_logs({"entries": {}}, args.log_records, seed=args.seed)
+    path = os.path.join(workdir, "logs", "translate_logs.jsonl")
+    latencies, elapsed = asyncio.run(_bench_log_writer(path, records))
+    # write() は on_message から見える待ち時間、throughput は書き切るまでを含む
+    return [summarize(latencies, elapsed, suite="log", target="TranslateLogWriter.write", case="append")]
+
+# =========================
+# 学習
+# =========================
+def bench_train(size: int, args, workdir: str) -> List[dict]:
+    """
+    TrainJson.train_lang_dict と同じ手順（trainer.train → store.commit）で、
+    伸びていくログを batch_size 件ずつ読み進める1回ごとの学習時間を測る
+    """
+    lang_dict = make_lang_dict(size, args.seed)
+    store, _ = make_store(workdir, lang_dict)
+    trainer = store.make_trainer()
+    path = os.path.join(workdir, f"train_{size}.jsonl")
+    with open(path, "w", encoding="utf-8") as f:
+        for record in make_logs(lang_dict, args.log_records, seed=args.seed + 2):
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    latencies, records = [], 0
+    offset = 0
+    started = time.perf_counter()
+    while True:
+        t0 = time.perf_counter()
+        logs, offset = read_log_since(path, offset, args.train_batch)
+        if not logs:
+            break
+        store.commit(trainer.train(logs))
+        latencies.append(time.perf_counter() - t0)
+        records += len(logs)
+    elapsed = time.perf_counter() - started
+
+    result = summarize(latencies, elapsed, suite="train", target="train_lang_dict", case="pass", entries=size)
+    result["records"] = records
+    result["records_per_s"] = round(records / elapsed, 2) if elapsed > 0 else None
+    result["entries_after"] = len(store.entries)
+    return [result]
+
+# =========================
+# on_message 端から端まで
+# =========================
+def fake_message(channel_id: str, content: str, author_id: int = 1):
+    author = SimpleNamespace(
+        id=author_id, bot=False, display_name=f"bench{author_id}",
+        display_avatar=SimpleNamespace(url="http://127.0.0.1/avatar.png")
+    )
+    return SimpleNamespace(
+        id=next(MESSAGE_IDS), author=author, channel=SimpleNamespace(id=int(channel_id)), content=content
+    )
+
+async def deliver(cog, message):
+    """on_message と同じく待ち行列に入れ、ワーカーが送り終える（または捨てる）まで待つ"""
+    unit = cog.enqueue_message(message)
+    if unit is not None:
+        await unit.done
+
+async def _bench_e2e(size: int, args, workdir: str) -> List[dict]:
+    from bench.fake_servers import FakeUpstream, LocalWebhook
+    from cogs.gemini import GeminiClient
+    from cogs.pipeline import PipelineScheduler
+    from cogs.translate import TranslateCog
+    from cogs.webhook_fanout import WEBHOOK_PERIOD, SlidingWindow, WebhookFanout
+
+    class LocalFanout(WebhookFanout):
+        def get_webhook(self, url: str):
+            webhook = self._webhooks.get(url)
+            if webhook is None:
+                webhook = LocalWebhook(self.session, url)
+                self._webhooks[url] = webhook
+                self._buckets[url] = SlidingWindow(self.limit, self.period)
+            return webhook
+
+    upstream = FakeUpstream(
+        args.gemini_latency / 1000, args.webhook_latency / 1000,
+        gemini_fail_rate=args.gemini_fail_rate, gemini_max_inflight=args.gemini_max_inflight,
+        gemini_hang_rate=args.gemini_hang_rate, seed=args.seed,
+        gemini_chunk_latency=args.gemini_chunk_latency / 1000
+    )
+    await upstream.start()
+
+    lang_dict = make_lang_dict(size, args.seed)
+    store, _ = make_store(workdir, lang_dict)
+    bot = SimpleNamespace(lang_store=store)
+    cog = TranslateCog(bot)
+    cog.gemini = GeminiClient(
+        cog.session, api_url=upstream.gemini_url, api_key="bench", metrics=cog.metrics,
+        hedge_delay=args.gemini_hedge_delay / 1000, stream_url=upstream.gemini_stream_url
+    )
+    cog.fanout = LocalFanout(
+        cog.session, limit=max(1, int(args.webhook_rate * WEBHOOK_PERIOD)), period=WEBHOOK_PERIOD
+    )
+    cog.scheduler = PipelineScheduler(
+        cog.process_unit, workers=args.pipeline_workers, max_queue=args.queue_size or args.messages,
+        shed_policy=args.shed_policy, coalesce_window=args.coalesce_window, metrics=cog.metrics
+    )
+    for i, lang in enumerate(["en", "ja", "ko", "zh"]):
+        cog.links.set(str(100 + i), lang, upstream.webhook_url(lang))
+    src_channel = "100"
+    await cog.cog_load()
+
+    results = []
+    try:
+        for case in CASES:
+            messages = [
+                fake_message(src_channel, text)
+                for text in make_messages(lang_dict, args.messages, case, SRC_LANG, args.seed + 3)
+            ]
+            # 逐次（1件ずつの待ち時間）
+            latencies = []
+            started = time.perf_counter()
+            for message in messages:
+                t0 = time.perf_counter()
+                await deliver(cog, message)
+                latencies.append(time.perf_counter() - t0)
+            elapsed = time.perf_counter() - started
+            results.append(summarize(latencies, elapsed, suite="e2e", target="on_message", case=case, entries=size))
+
+            # 同時（全件を一度に流したときのスループット）
+            # 作者は --authors 人で順番に（1人なら連投がまとめられる）
+            messages = [
+                fake_message(src_channel, f"{text} {i}" if case == "miss" else text, 1 + i % args.authors)
+                for i, text in enumerate(make_messages(lang_dict, args.messages, case, SRC_LANG, args.seed + 4))
+            ]
+
+            async def timed(message):
+                t0 = time.perf_counter()
+                await deliver(cog, message)
+                return time.perf_counter() - t0
+
+            shed = pipeline_counts(cog.metrics)
+            started = time.perf_counter()
+            latencies = await asyncio.gather(*(timed(m) for m in messages))
+            elapsed = time.perf_counter() - started
+            after = pipeline_counts(cog.metrics)
+            results.append(summarize(
+                latencies, elapsed, suite="e2e", target="on_message", case=f"{case}_concurrent", entries=size,
+                **{key: after[key] - shed.get(key, 0) for key in after}
+            ))
+        results.append(await _bench_edit(cog, upstream, lang_dict, src_channel, size, args))
+    finally:
+        await cog.cog_unload()
+        await upstream.close()
+
+    for result in results:
+        result["gemini_calls"] = upstream.gemini_calls
+        result["gemini_errors"] = upstream.gemini_errors
+        result["webhook_calls"] = upstream.webhook_calls
+    return results
+
+async def _bench_edit(cog, upstream, lang_dict: dict, src_channel: str, size: int, args) -> dict:
+    """
+    辞書に無い文を並べたメッセージを送ってから最後の1文だけ書き換え、
+    編集の反映にかかる時間と Gemini に送った量（送信時との比）を測る
+    """
+    phrases = make_messages(lang_dict, args.messages * (EDIT_SENTENCES + 1), "miss", SRC_LANG, args.seed + 5)
+    messages, edits = [], []
+    for i in range(args.messages):
+        chunk = phrases[i * (EDIT_SENTENCES + 1):(i + 1) * (EDIT_SENTENCES + 1)]
+        messages.append(fake_message(src_channel, ". ".join(chunk[:EDIT_SENTENCES]) + "."))
+        edits.append(". ".join(chunk[:EDIT_SENTENCES - 1] + chunk[EDIT_SENTENCES:]) + ".")
+
+    calls, chars = upstream.gemini_calls, upstream.gemini_output_chars
+    for message in messages:
+        await deliver(cog, message)
+    send_calls, send_chars = upstream.gemini_calls - calls, upstream.gemini_output_chars - chars
+
+    calls, chars = upstream.gemini_calls, upstream.gemini_output_chars
+    latencies = []
+    started = time.perf_counter()
+    for message, text in zip(messages, edits):
+        payload = SimpleNamespace(message_id=message.id, channel_id=int(src_channel), data={"content": text})
+        t0 = time.perf_counter()
+        await cog.on_raw_message_edit(payload)
+        latencies.append(time.perf_counter() - t0)
+    elapsed = time.perf_counter() - started
+    return summarize(
+        latencies, elapsed, suite="e2e", target="on_message_edit", case="last_sentence", entries=size,
+        send_gemini_calls=send_calls, edit_gemini_calls=upstream.gemini_calls - calls,
+        send_gemini_chars=send_chars, edit_gemini_chars=upstream.gemini_output_chars - chars,
+        webhook_edits=upstream.webhook_edits
+    )
+
+def pipeline_counts(metrics) -> Dict[str, int]:
+    """まとめられた・捨てられた・辞書だけで訳したメッセージ数"""
+    counts = {}
+    for name, label in (("pipeline_messages_total", "result"), ("pipeline_shed_total", "action")):
+        for labels, counter in metrics.children(name):
+            counts[labels[label]] = int(counter.value)
+    return {key: counts.get(key, 0) for key in ("coalesced", "dropped", "dictionary_only")}
+
+def bench_e2e(size: int, args, workdir: str) -> List[dict]:
+    # TranslateCog は data/ 以下の相対パスを使うので一時ディレクトリで動かす
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        return asyncio.run(_bench_e2e(size, args, workdir))
+    except ImportError as e:
+        return [{"suite": "e2e", "target": "on_message", "entries": size, "skipped": str(e)}]
+    finally:
+        os.chdir(cwd)
+
+# =========================
+# 比較
+# =========================
+def result_key(result: dict) -> tuple:
+    return tuple(result.get(k) for k in ("suite", "target", "case", "entries"))
+
+def compare(baseline: dict, current: dict):
+    """以前の結果と同じキーの p50/p99 を比べる（>1 なら遅くなった）"""
+    old = {result_key(r): r for r in baseline.get("results", []) if "skipped" not in r}
+    print(f"\ncompared with {baseline.get('meta', {}).get('revision')}", file=sys.stderr)
+    for result in current["results"]:
+        before = old.get(result_key(result))
+        if before is None or "skipped" in result:
+            continue
+        ratios = []
+        for field in ("p50_ms", "p99_ms"):
+            if before[field]:
+                ratios.append(f"{field}={result[field] / before[field]:.2f}x")
+        label = " ".join(str(k) for k in result_key(result))
+        print(f"{label:<60} {' '.join(ratios)}", file=sys.stderr)
+
+# =========================
+# エントリポイント
+# =========================
+def git_revision() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL, text=True
+        ).strip()
+    except Exception:
+        return "unknown"
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmarks for TranslateBot")
+    parser.add_argument("--sizes", default="1000,10000,100000",
+                        help="comma separated dictionary sizes (up to 1000000)")
+    parser.add_argument("--suites", default=",".join(SUITES), help=f"comma separated: {','.join(SUITES)}")
+    parser.add_argument("--messages", type=int, default=500, help="messages per case")
+    parser.add_argument("--log-records", type=int, default=20000, help="log records for log/train suites")
+    parser.add_argument("--train-batch", type=int, default=5000, help="records per training pass")
+    parser.add_argument("--gemini-latency", type=float, default=0.0, help="fake Gemini latency (ms)")
+    parser.add_argument("--gemini-chunk-latency", type=float, default=0.0,
+                        help="fake Gemini generation time per 32-character chunk (ms)")
+    parser.add_argument("--gemini-fail-rate", type=float, default=0.0, help="fraction of fake Gemini calls answered 503")
+    parser.add_argument("--gemini-max-inflight", type=int, default=0,
+                        help="fake Gemini answers 429 above this many concurrent calls (0: unlimited)")
+    parser.add_argument("--gemini-hang-rate", type=float, default=0.0,
+                        help="fraction of fake Gemini calls that hang past the client timeout")
+    parser.add_argument("--gemini-hedge-delay", type=float, default=0.0, help="hedge Gemini calls after this (ms, 0: off)")
+    parser.add_argument("--webhook-latency", type=float, default=0.0, help="fake webhook latency (ms)")
+    parser.add_argument("--webhook-rate", type=float, default=1e6,
+                        help="per-webhook rate limit (2.5 reproduces Discord)")
+    parser.add_argument("--pipeline-workers", type=int, default=pipeline.PIPELINE_WORKERS)
+    parser.add_argument("--queue-size", type=int, default=0,
+                        help="per-channel queue limit (0: --messages, so the default run sheds nothing)")
+    parser.add_argument("--shed-policy", default=pipeline.PIPELINE_SHED_POLICY, choices=pipeline.SHED_POLICIES)
+    parser.add_argument("--coalesce-window", type=float, default=pipeline.PIPELINE_COALESCE_WINDOW,
+                        help="coalesce queued messages from the same author within this many seconds (0: off)")
+    parser.add_argument("--authors", type=int, default=1, help="distinct authors in the concurrent cases")
+    parser.add_argument("--fuzzy-backend", default=lang_index.FUZZY_BACKEND, choices=["bktree", "ngram"])
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="write JSON results here (default: stdout)")
+    parser.add_argument("--compare", help="previous JSON results to compare against")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    suites = [s for s in args.suites.split(",") if s]
+    lang_index.FUZZY_BACKEND = args.fuzzy_backend
+
+    results: List[Dict] = []
+    with tempfile.TemporaryDirectory(prefix="translatebot-bench-") as workdir:
+        if "log" in suites:
+            results += bench_log(args, workdir)
+        for size in sizes:
+            if "lookup" in suites:
+                results += bench_lookup(size, args, workdir)
+            if "train" in suites:
+                results += bench_train(size, args, workdir)
+            if "e2e" in suites:
+                e2e_dir = os.path.join(workdir, f"e2e_{size}")
+                os.makedirs(e2e_dir)
+                results += bench_e2e(size, args, e2e_dir)
+
+    for result in results:
+        if "skipped" in result:
+            print(f"{result['suite']} {result['target']}: skipped ({result['skipped']})", file=sys.stderr)
+        else:
+            report(result)
+
+    output = {
+        "meta": {
+            "revision": git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "timestamp": int(time.time()),
+            "args": vars(args),
+        },
+        "results": results,
+    }
+    if args.out:
+        atomic_write_json(args.out, output)
+    else:
+        print(json.dumps(output, ensure_ascii=False, indent=2))
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            compare(json.load(f), output)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+import random
+import string
+from typing import Dict, List
+
+LANGS = ["ja", "en", "ko", "zh"]
+
+# 言語ごとの文字集合（それらしい長さ・字種の合成フレーズを作る）
+ALPHABETS = {
+    "ja": [chr(c) for c in range(0x3041, 0x3097)],   # ひらがな
+    "en": list(string.ascii_lowercase),
+    "ko": [chr(c) for c in range(0xAC00, 0xAC00 + 400)],
+    "zh": [chr(c) for c in range(0x4E00, 0x4E00 + 400)],
+}
+LENGTHS = {"ja": (2, 12), "en": (3, 20), "ko": (2, 10), "zh": (2, 8)}
+
+# =========================
+# 合成データ
+# =========================
+def make_phrase(rng: random.Random, lang: str) -> str:
+    lo, hi = LENGTHS[lang]
+    return "".join(rng.choices(ALPHABETS[lang], k=rng.randint(lo, hi)))
+
+def make_lang_dict(size: int, seed: int = 0) -> dict:
+    """size 件のエントリを持つ version 2 形式の辞書"""
+    rng = random.Random(seed)
+    entries = {}
+    for i in range(size):
+        languages = {}
+        for lang in LANGS:
+            languages[lang] = [make_phrase(rng, lang) for _ in range(rng.choice((1, 1, 2)))]
+        entries[str(1001 + i)] = {
+            "context": {"tag": "synthetic", "emotion": {}, "usage": {}},
+            "confidence": round(rng.uniform(0.3, 1.0), 2),
+            "languages": languages
+        }
+    return {"meta": {"version": 2, "description": "synthetic"}, "entries": entries}
+
+def mutate(rng: random.Random, text: str) -> str:
+    """1文字だけ置き換え／削除した近似文（長い文なら ratio はしきい値を超える）"""
+    if len(text) < 4:
+        return text + text[-1]
+    i = rng.randrange(len(text))
+    if rng.random() < 0.5:
+        return text[:i] + text[i + 1:]
+    return text[:i] + rng.choice(text) + text[i + 1:]
+
+def make_messages(lang_dict: dict, count: int, kind: str, src_lang: str = "en", seed: int = 1) -> List[str]:
+    """
+    kind:
+      "hit"   : 辞書のフレーズそのもの
+      "fuzzy" : 辞書のフレーズを少しだけ変えたもの
+      "miss"  : 辞書にないフレーズ
+    """
+    rng = random.Random(seed)
+    phrases = [
+        texts[0] for entry in lang_dict["entries"].values()
+        for lang, texts in entry["languages"].items() if lang == src_lang
+    ]
+    messages = []
+    for _ in range(count):
+        if kind == "hit":
+            messages.append(rng.choice(phrases))
+        elif kind == "fuzzy":
+            messages.append(mutate(rng, rng.choice(phrases)))
+        else:
+            # 字種をずらして辞書と一致しないようにする
+            messages.append("~" + make_phrase(rng, src_lang) + "~")
+    return messages
+
+def make_logs(lang_dict: dict, count: int, hit_rate: float = 0.5, seed: int = 2) -> List[Dict]:
+    """translate.py が書く形式のログレコード"""
+    rng = random.Random(seed)
+    entries = list(lang_dict["entries"].values())
+    logs = []
+    for i in range(count):
+        if entries and rng.random() < hit_rate:
+            entry = rng.choice(entries)
+            word = {lang: texts[0] for lang, texts in entry["languages"].items()}
+        else:
+            word = {lang: make_phrase(rng, lang) for lang in LANGS}
+        logs.append({"timestamp": 1700000000 + i, "time": "2023:11:14", "word": word})
+    return logs
@@ -3,8 +3,11 @@ from discord.ext import commands
 import traceback
 import asyncio
 import aiohttp
+import time
 from datetime import datetime
 
+PROCESS_STARTED = time.perf_counter()
+
 # =========================
 # UniversalBot 基本設定
 # =========================
@@ -24,35 +27,170 @@ INTENTS.members = True
 # ログ送信ユーティリティ
 # =========================
 
+LOG_QUEUE_SIZE = 1000     # 溜めておけるログの上限（超えた分は捨てて数える）
+LOG_BATCH_SIZE = 10       # Webhook 1回あたりの embed 数の上限（Discordの制限）
+LOG_BATCH_CHARS = 5900    # 1回あたりの embed の合計文字数（Discordの上限 6000 から dropped の footer 分を引く）
+LOG_DESCRIPTION_LIMIT = 4096  # embed の description の上限（Discordの制限）
+LOG_BATCH_WINDOW = 1.0    # まとめて送るために待つ秒数
+LOG_MAX_RETRIES = 5
+
+LOG_COLORS = {
+    "INFO": 0x3498db,
+    "WARNING": 0xf1c40f,
+    "ERROR": 0xe74c3c,
+    "CRITICAL": 0x8e44ad
+}
+
+
+class LogSender:
+    """
+    管理Webhookへのログ送信をバックグラウンドで行う
+    - ClientSession は1つを使い回す
+    - キューは上限付き（溢れた分は dropped に数える）
+    - 最大10件・合計 LOG_BATCH_CHARS 文字までの embed を1リクエストにまとめる
+    - 429 は retry_after だけ待って再送
+    - それ以外で拒否されたら1件ずつ送り直す（送れなかったものは dropped に数える）
+    - 終了時はキューを送り切ってから閉じる
+    """
+
+    def __init__(self, url: str):
+        self.url = url
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.dropped = 0
+        self.session = None
+        self._task = None
+        self._closing = False
+        self._reported_dropped = 0
+        self._carry = None  # 前のまとめに入りきらなかった embed
+
+    async def start(self):
+        if self._task is None:
+            self.session = aiohttp.ClientSession()
+            self._task = asyncio.create_task(self._run())
+
+    def submit(self, embed: dict):
+        if self._closing or self.queue.qsize() >= LOG_QUEUE_SIZE:
+            self.dropped += 1
+            return
+        self.queue.put_nowait(embed)
+
+    async def close(self, timeout: float = 10.0):
+        if self._task is None:
+            return
+        self._closing = True
+        self.queue.put_nowait(None)  # 終了の目印
+        try:
+            await asyncio.wait_for(self._task, timeout)
+        except asyncio.TimeoutError:
+            self._task.cancel()
+        self._task = None
+        await self.session.close()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            if self._carry is not None:
+                embed, self._carry = self._carry, None
+            else:
+                embed = await self.queue.get()
+            if embed is None:
+                return
+            batch = [embed]
+            size = embed_size(embed)
+            closing = False
+            deadline = loop.time() + LOG_BATCH_WINDOW
+            while len(batch) < LOG_BATCH_SIZE:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    embed = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if embed is None:
+                    closing = True
+                    break
+                if size + embed_size(embed) > LOG_BATCH_CHARS:
+                    self._carry = embed  # 次のまとめの先頭にする
+                    break
+                batch.append(embed)
+                size += embed_size(embed)
+            if self.dropped != self._reported_dropped:
+                # 溢れて捨てたログがあれば件数を添える
+                self._reported_dropped = self.dropped
+                batch[-1] = dict(batch[-1], footer={"text": f"dropped log events: {self.dropped}"})
+            if not await self._post(batch) and len(batch) > 1:
+                # まとめて拒否された（400 など）。1件ずつ送って、送れるものだけでも届ける
+                for embed in batch:
+                    await self._post([embed])
+            if closing:
+                if self._carry is not None:
+                    await self._post([self._carry])
+                return
+
+    async def _post(self, embeds: list) -> bool:
+        """
+        embeds を送る。429 以外で拒否されたら False（1件だけなら dropped に数える）
+        応答が無いまま再送し尽くしたときは全件を dropped に数えて True（分けて送り直しても同じ）
+        """
+        payload = {
+            "username": BOT_NAME,
+            "embeds": embeds
+        }
+        for attempt in range(LOG_MAX_RETRIES):
+            try:
+                async with self.session.post(self.url, json=payload) as resp:
+                    if 200 <= resp.status < 300:
+                        return True
+                    if resp.status != 429:
+                        print(f"Webhook log rejected ({resp.status}):", (await resp.text())[:200])
+                        if len(embeds) == 1:
+                            self.dropped += 1
+                        return False
+                    try:
+                        retry_after = float((await resp.json()).get("retry_after", 1.0))
+                    except Exception:
+                        retry_after = float(resp.headers.get("Retry-After", 1.0))
+            except Exception as e:
+                # Webhookが死んでもBot本体は止めない
+                print("Webhook log failed:", e)
+                retry_after = 2 ** attempt
+            await asyncio.sleep(retry_after)
+        print(f"Webhook log dropped after {LOG_MAX_RETRIES} attempts")
+        self.dropped += len(embeds)
+        return True
+
+
+def embed_size(embed: dict) -> int:
+    """Discord が合計 6000 文字に数える部分の長さ"""
+    return (
+        len(embed.get("title", "")) + len(embed.get("description", ""))
+        + len(embed.get("footer", {}).get("text", ""))
+    )
+
+
+def truncate_description(text: str) -> str:
+    """description の上限に収める（トレースバックは末尾に例外があるので後ろを残す）"""
+    if len(text) <= LOG_DESCRIPTION_LIMIT:
+        return text
+    return "…\n" + text[-(LOG_DESCRIPTION_LIMIT - 2):]
+
+
+log_sender = LogSender(LOG_WEBHOOK_URL)
+
+
 async def send_log(title: str, description: str, level: str = "INFO"):
     """
-    管理Webhookにログを送信する
+    管理Webhookにログを送信する（キューに積むだけで待たない）
     level: INFO / WARNING / ERROR / CRITICAL
     """
     embed = {
         "title": f"[{level}] {title}",
-        "description": description,
-        "color": {
-            "INFO": 0x3498db,
-            "WARNING": 0xf1c40f,
-            "ERROR": 0xe74c3c,
-            "CRITICAL": 0x8e44ad
-        }.get(level, 0x95a5a6),
+        "description": truncate_description(description),
+        "color": LOG_COLORS.get(level, 0x95a5a6),
         "timestamp": datetime.utcnow().isoformat()
     }
-
-    payload = {
-        "username": BOT_NAME,
-        "embeds": [embed]
-    }
-
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(LOG_WEBHOOK_URL, json=payload):
-                pass
-    except Exception as e:
-        # Webhookが死んでもBot本体は止めない
-        print("Webhook log failed:", e)
+    log_sender.submit(embed)
 
 
 # =========================
@@ -70,17 +208,28 @@ class UniversalBot(commands.Bot):
 
     async def setup_hook(self):
         """
-        起動時にCogをロード
+        起動時にCogをロード（所要時間を Startup ログに載せる）
         """
+        await log_sender.start()
+        started = time.perf_counter()
         try:
             # 将来ここにCogを追加していく
-            await self.load_extension("cogs. translate")
-            await self.load_extension("cogs.trainjson")
+            await self.load_extension("cogs.translate")
+            await self.load_extension("cogs.train_json")
+            await self.load_extension("cogs.stats")
+            now = time.perf_counter()
+            store = getattr(self, "lang_store", None)
+            status = "full" if store is None or store.loaded else "snapshot (loading in background)"
             await send_log(
                 "Startup",
-                "Core cogs loaded successfully.",
+                f"Core cogs loaded successfully in {now - started:.2f}s"
+                f" ({now - PROCESS_STARTED:.2f}s since process start).\n"
+                f"Dictionary: {status}",
                 "INFO"
             )
+            if store is not None and not store.loaded:
+                # 参照を持っておかないとタスクが途中でGCされることがある
+                self.dictionary_task = asyncio.create_task(self.report_dictionary_loaded(store))
         except Exception as e:
             await send_log(
                 "Startup Error",
@@ -88,6 +237,24 @@ class UniversalBot(commands.Bot):
                 "CRITICAL"
             )
 
+    async def report_dictionary_loaded(self, store):
+        """スナップショットで起動したとき、辞書全体が揃うまでの時間を記録"""
+        try:
+            await store.wait_loaded()
+        except Exception:
+            return  # 失敗は読み込み側で処理済み
+        await send_log(
+            "Dictionary Loaded",
+            f"{len(store.entries)} entries and fuzzy indexes ready"
+            f" {time.perf_counter() - PROCESS_STARTED:.2f}s after process start.",
+            "INFO"
+        )
+
+    async def close(self):
+        await super().close()
+        # 残っているログを送り切ってから終了
+        await log_sender.close()
+
     async def on_ready(self):
         await send_log(
             "Bot Ready",
@@ -0,0 +1,187 @@
+import json
+import os
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from cogs.persistence import DebouncedSaver
+
+# =========================
+# 設定
+# =========================
+DATA_DIR = "data"
+CHANNEL_LINK_PATH = f"{DATA_DIR}/channel_links.json"
+DEFAULT_GROUP = "default"  # group を持たない既存のリンクもここに入る（同じサーバーの中だけでつながる）
+SAVE_DELAY = 1.0
+
+def load_json(path, default):
+    if not os.path.exists(path):
+        return default
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+# =========================
+# 送信先
+# =========================
+class Route(NamedTuple):
+    channel_id: str
+    lang: str
+    webhook: str
+
+# =========================
+# リンク表
+# =========================
+class ChannelLinks:
+    """
+    channel_links.json（チャンネルID → {lang, webhook, group, guild, owner, shared}）の持ち主
+    グループはサーバーごとに分かれ、(owner, group) が同じチャンネル同士だけを連携する
+      - guild: チャンネルのサーバー。owner: グループを持つサーバー（省略時は guild）
+      - 別サーバーのグループに入れるのは、owner 側がそのサーバーを shared に入れたときだけ（share）
+      - guild を記録する前の古いリンクは、サーバーが分かるまで古いリンク同士でつながる（assign_guilds）
+    送信元チャンネル → 送信先 Route のリストはリンクが変わるたびに作り直しておく
+    （メッセージごとの経路探索はグループの大きさで済む）
+    """
+    def __init__(self, path: str = CHANNEL_LINK_PATH):
+        self.path = path
+        self.links: Dict[str, dict] = load_json(path, {})
+        # リンクはその場で書き換わるので、保存する写しはリンクごとにコピーする
+        self.saver = DebouncedSaver(
+            path, lambda: {cid: dict(link) for cid, link in self.links.items()}, SAVE_DELAY
+        )
+        self._routes: Dict[str, List[Route]] = {}
+        self.rebuild()
+
+    # =========================
+    # 参照
+    # =========================
+    def __contains__(self, channel_id: str) -> bool:
+        return channel_id in self.links
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.links)
+
+    def __len__(self) -> int:
+        return len(self.links)
+
+    def get(self, channel_id: str) -> Optional[dict]:
+        return self.links.get(channel_id)
+
+    def group_of(self, channel_id: str) -> str:
+        return self.links[channel_id].get("group") or DEFAULT_GROUP
+
+    def group_key(self, channel_id: str) -> Optional[Tuple[Optional[str], str]]:
+        """
+        (グループを持つサーバー, グループ名)。別サーバーのグループで共有が取り消されていれば None
+        """
+        link = self.links[channel_id]
+        guild = link.get("guild")
+        owner = link.get("owner") or guild
+        group = self.group_of(channel_id)
+        if owner != guild and not self.is_shared(owner, group, guild):
+            return None
+        return owner, group
+
+    def is_shared(self, owner: str, group: str, guild: str) -> bool:
+        """owner のサーバーのグループ group に guild のチャンネルが入ってよいか"""
+        return any(
+            guild in link.get("shared", ())
+            for cid, link in self.links.items()
+            if link.get("guild") == owner and not link.get("owner") and self.group_of(cid) == group
+        )
+
+    def routes(self, channel_id: str) -> List[Route]:
+        """送信元チャンネルから送る先（同じグループの別言語チャンネル）"""
+        return self._routes.get(channel_id, [])
+
+    def groups(self) -> Dict[Tuple[Optional[str], str], List[str]]:
+        """(グループを持つサーバー, グループ名) → チャンネルID（登録順）"""
+        groups: Dict[Tuple[Optional[str], str], List[str]] = {}
+        for cid in self.links:
+            key = self.group_key(cid)
+            if key is not None:
+                groups.setdefault(key, []).append(cid)
+        return groups
+
+    # =========================
+    # 更新
+    # =========================
+    def set(
+        self, channel_id: str, lang: str, webhook: str, group: Optional[str] = None,
+        guild: Optional[str] = None, owner: Optional[str] = None
+    ) -> Optional[dict]:
+        """
+        リンクを追加・上書き（group 省略時は今のグループのまま／新規は DEFAULT_GROUP）
+        guild: チャンネルのサーバー。owner: 別サーバーのグループに入るときだけ、そのサーバー
+        （入ってよいかは呼び出し側が is_shared で確かめる）
+        戻り値は上書き前のリンク
+        """
+        old = self.links.get(channel_id) or {}
+        link = {"lang": lang, "webhook": webhook, "group": group or old.get("group") or DEFAULT_GROUP}
+        guild = guild or old.get("guild")
+        if guild:
+            link["guild"] = guild
+        if group is None and owner is None:
+            owner = old.get("owner")
+        if owner and owner != guild:
+            link["owner"] = owner
+        elif old.get("shared") and link["group"] == self.group_of(channel_id):
+            link["shared"] = old["shared"]
+        self.links[channel_id] = link
+        self._changed()
+        return old or None
+
+    def share(self, guild: str, group: str, other: str, allow: bool = True) -> bool:
+        """
+        guild のグループ group に別サーバー other のチャンネルが入るのを許可・取り消す
+        （取り消すと other のチャンネルには送らなくなる）。グループが無ければ False
+        """
+        members = [
+            cid for cid, link in self.links.items()
+            if link.get("guild") == guild and not link.get("owner") and self.group_of(cid) == group
+        ]
+        if not members:
+            return False
+        for cid in members:
+            shared = [g for g in self.links[cid].get("shared", []) if g != other]
+            if allow:
+                shared.append(other)
+            if shared:
+                self.links[cid]["shared"] = shared
+            else:
+                self.links[cid].pop("shared", None)
+        self._changed()
+        return True
+
+    def assign_guilds(self, guilds: Iterable[Tuple[str, str]]):
+        """guild を記録する前の古いリンクに (チャンネルID, サーバーID) を記録する"""
+        changed = False
+        for channel_id, guild in guilds:
+            link = self.links.get(channel_id)
+            if link is not None and not link.get("guild"):
+                link["guild"] = guild
+                changed = True
+        if changed:
+            self._changed()
+
+    def remove(self, channel_id: str) -> Optional[dict]:
+        old = self.links.pop(channel_id, None)
+        if old is not None:
+            self._changed()
+        return old
+
+    def _changed(self):
+        self.rebuild()
+        self.saver.mark_dirty()
+
+    def rebuild(self):
+        """グループごとに送信先の表を作り直す（自分と同じ言語のチャンネルには送らない）"""
+        routes: Dict[str, List[Route]] = {}
+        for members in self.groups().values():
+            group_routes = [
+                Route(cid, self.links[cid]["lang"], self.links[cid]["webhook"]) for cid in members
+            ]
+            for cid in members:
+                lang = self.links[cid]["lang"]
+                routes[cid] = [route for route in group_routes if route.lang != lang]
+        self._routes = routes
+
+    async def flush(self):
+        await self.saver.flush()
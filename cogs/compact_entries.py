@@ -0,0 +1,401 @@
+import copy
+import json
+import sys
+from array import array
+from collections.abc import MutableMapping
+from typing import Dict, Iterator, List, Optional, Set
+
+from cogs.trainer import LangDictTrainer
+
+# =========================
+# 設定
+# =========================
+NAN = float("nan")
+
+# CompactEntry.has のビット（どのキーを持っているか）
+HAS_LANGUAGES = 1
+HAS_CONTEXT = 2
+HAS_CONFIDENCE = 4
+HAS_DISTANCE = 8
+HAS_PROBABILITY = 16
+HAS_LAST_MODIFIED = 32
+
+# =========================
+# フレーズ表
+# =========================
+class PhraseTable:
+    """
+    meaning_distance のキー（"lang:text"）⇔ 整数ID
+    キー文字列は sys.intern して辞書全体で1つだけ持つ
+    """
+    def __init__(self):
+        self.keys: List[str] = []
+        self._ids: Dict[str, int] = {}
+
+    def key_id(self, key: str) -> int:
+        pid = self._ids.get(key)
+        if pid is None:
+            pid = len(self.keys)
+            key = sys.intern(key)
+            self.keys.append(key)
+            self._ids[key] = pid
+        return pid
+
+    def ids(self, keys) -> array:
+        """キーの並びをIDの配列に（既知のキーだけなら dict を引くだけ）"""
+        get = self._ids.get
+        ids = [get(k) for k in keys]
+        if None in ids:
+            ids = [self.key_id(k) for k in keys]
+        return array("I", ids)
+
+    def key(self, pid: int) -> str:
+        return self.keys[pid]
+
+# =========================
+# エントリ
+# =========================
+class CompactEntry:
+    """
+    1エントリ分（読み出し専用の dict 風）
+    confidence / probability は CompactEntries の列に row 番目として持ち、
+    languages は (lang, (text, ...)) のタプル、meaning_distance は
+    フレーズIDと距離の配列の組で持つ
+    """
+    __slots__ = (
+        "table", "row", "has", "layout", "languages", "context",
+        "distance_ids", "distance_values", "last_modified", "extra"
+    )
+
+    def __init__(self, table: "CompactEntries", row: int):
+        self.table = table
+        self.row = row
+        self.has = 0
+        self.layout = 0  # CompactEntries.layouts の番号（キーの並び順）
+        self.languages: tuple = ()
+        self.context = None
+        self.distance_ids: Optional[array] = None
+        self.distance_values: Optional[array] = None
+        self.last_modified = None
+        self.extra: Optional[dict] = None
+
+    def get(self, key: str, default=None):
+        value = self.table.field(self, key)
+        return default if value is NotImplemented else value
+
+    def __getitem__(self, key: str):
+        value = self.table.field(self, key)
+        if value is NotImplemented:
+            raise KeyError(key)
+        return value
+
+    def __setitem__(self, key: str, value):
+        # その場で詰め直すと、保存中の写し（FrozenEntries）が持つ同じオブジェクトまで書き換わる
+        raise TypeError(
+            "CompactEntry is read-only; replace the entry through CompactEntries "
+            "(entries[id] = {...}) or use checkout()"
+        )
+
+    def __contains__(self, key: str) -> bool:
+        return self.table.field(self, key) is not NotImplemented
+
+    def keys(self) -> List[str]:
+        return list(self.to_dict())
+
+    def items(self):
+        return self.to_dict().items()
+
+    def to_dict(self) -> dict:
+        """元の JSON スキーマの dict に戻す"""
+        return self.table.unpack(self)
+
+    def __eq__(self, other) -> bool:
+        if isinstance(other, CompactEntry):
+            other = other.to_dict()
+        return self.to_dict() == other
+
+    __hash__ = None
+
+# =========================
+# エントリ集合
+# =========================
+class CompactEntries(MutableMapping):
+    """
+    lang_dict["entries"] の省メモリ版（{id: エントリ} と同じ使い方ができる）
+      - 訳文・meaning_distance のキーは PhraseTable で共有
+      - confidence と言語別 probability は array('d') の列（欠けは NaN / has で区別）
+      - 同じ内容の context は1つのオブジェクトを共有（書き換えずに置き換えること）
+      - キーの並び順はエントリ間で共有するタプルの番号で持つ
+    JSON に戻すと元と同じ内容・同じ並びになる（float 以外の値は extra にそのまま残す）。
+    学習で書き換えるエントリは checkout で dict として取り出し、
+    commit_checkouts でまとめて詰め直す。
+    エントリを書き換えるときは CompactEntry を作り直して置き換える（freeze した写しが古いほうを持っている）
+    """
+    def __init__(self, entries: Optional[Dict[str, dict]] = None):
+        self.phrases = PhraseTable()
+        self.confidence = array("d")
+        self.probability: Dict[str, array] = {}
+        self._entries: Dict[str, CompactEntry] = {}
+        self._free: List[int] = []
+        self._contexts: Dict[str, object] = {}
+        self.layouts: List[tuple] = [((), ())]  # (キーの並び, probability の言語の並び)
+        self._layout_ids: Dict[tuple, int] = {((), ()): 0}
+        self._checked_out: Dict[str, dict] = {}
+        for eid, entry in (entries or {}).items():
+            self[eid] = entry
+
+    # =========================
+    # dict としての操作
+    # =========================
+    def __getitem__(self, entry_id: str):
+        entry = self._checked_out.get(entry_id)
+        if entry is not None:
+            return entry
+        return self._entries[entry_id]
+
+    def get(self, entry_id: str, default=None):
+        entry = self._checked_out.get(entry_id)
+        if entry is not None:
+            return entry
+        return self._entries.get(entry_id, default)
+
+    def __setitem__(self, entry_id: str, entry):
+        if isinstance(entry, CompactEntry):
+            entry = entry.to_dict()
+        self._checked_out.pop(entry_id, None)
+        old = self._entries.get(entry_id)
+        item = CompactEntry(self, old.row if old is not None else self._new_row())
+        self.pack_into(item, entry)
+        self._entries[entry_id] = item
+
+    def __delitem__(self, entry_id: str):
+        item = self._entries.pop(entry_id)
+        self._checked_out.pop(entry_id, None)
+        self._clear_row(item.row)
+        self._free.append(item.row)
+
+    def __contains__(self, entry_id) -> bool:
+        return entry_id in self._entries
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._entries)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def to_dict(self) -> Dict[str, dict]:
+        """保存用に元の JSON スキーマへ戻す"""
+        checked_out = self._checked_out
+        return {
+            eid: checked_out[eid] if eid in checked_out else self.unpack(item)
+            for eid, item in self._entries.items()
+        }
+
+    def language_rows(self) -> List[tuple]:
+        """[(エントリID, ((lang, (text, ...)), ...)), ...]（スナップショット用。languages のタプルは共有）"""
+        rows = []
+        checked_out = self._checked_out
+        for eid, item in self._entries.items():
+            if eid in checked_out or not item.has & HAS_LANGUAGES:
+                languages = self[eid].get("languages") or {}
+                rows.append((eid, tuple((lang, tuple(texts)) for lang, texts in languages.items())))
+            else:
+                rows.append((eid, item.languages))
+        return rows
+
+    # =========================
+    # 学習用
+    # =========================
+    def checkout(self, entry_id: str) -> dict:
+        """書き換え用に dict として取り出す（commit_checkouts まで）"""
+        entry = self._checked_out.get(entry_id)
+        if entry is None:
+            entry = self.unpack(self._entries[entry_id])
+            self._checked_out[entry_id] = entry
+        return entry
+
+    def commit_checkouts(self) -> Set[str]:
+        """取り出したエントリを詰め直す"""
+        checked_out, self._checked_out = self._checked_out, {}
+        for eid, entry in checked_out.items():
+            item = CompactEntry(self, self._entries[eid].row)
+            self.pack_into(item, entry)
+            self._entries[eid] = item
+        return set(checked_out)
+
+    def freeze(self) -> "FrozenEntries":
+        """今の内容の写し（イベントループ上で取り、スレッド上で to_dict などを呼ぶ）"""
+        return FrozenEntries(self)
+
+    # =========================
+    # 詰める／戻す
+    # =========================
+    def _new_row(self) -> int:
+        if self._free:
+            return self._free.pop()
+        row = len(self.confidence)
+        self.confidence.append(0.0)
+        for column in self.probability.values():
+            column.append(NAN)
+        return row
+
+    def _clear_row(self, row: int):
+        self.confidence[row] = 0.0
+        for column in self.probability.values():
+            column[row] = NAN
+
+    def _probability_column(self, lang: str) -> array:
+        column = self.probability.get(lang)
+        if column is None:
+            column = array("d", [NAN]) * len(self.confidence)
+            self.probability[sys.intern(lang)] = column
+        return column
+
+    def _share_context(self, context):
+        if not isinstance(context, dict):
+            return context
+        key = json.dumps(context, ensure_ascii=False)
+        return self._contexts.setdefault(key, context)
+
+    def pack_into(self, item: CompactEntry, entry: dict):
+        row = item.row
+        self._clear_row(row)
+        item.has = 0
+        item.languages = ()
+        item.context = None
+        item.distance_ids = item.distance_values = None
+        item.last_modified = None
+        extra = None
+
+        for key, value in entry.items():
+            if key == "languages" and isinstance(value, dict) and all(
+                isinstance(texts, list) and all(isinstance(t, str) for t in texts)
+                for texts in value.values()
+            ):
+                item.languages = tuple(
+                    (sys.intern(lang), tuple(sys.intern(t) for t in texts))
+                    for lang, texts in value.items()
+                )
+                item.has |= HAS_LANGUAGES
+            elif key == "context":
+                item.context = self._share_context(value)
+                item.has |= HAS_CONTEXT
+            elif key == "confidence" and type(value) is float:
+                self.confidence[row] = value
+                item.has |= HAS_CONFIDENCE
+            elif key == "meaning_distance" and _float_dict(value):
+                if value:
+                    item.distance_ids = self.phrases.ids(value)
+                    item.distance_values = array("d", value.values())
+                item.has |= HAS_DISTANCE
+            elif key == "probability" and _float_dict(value):
+                for lang, p in value.items():
+                    self._probability_column(lang)[row] = p
+                item.has |= HAS_PROBABILITY
+            elif key == "last_modified":
+                item.last_modified = value
+                item.has |= HAS_LAST_MODIFIED
+            else:
+                # 型が想定外の値（int の confidence など）は詰めずにそのまま持つ
+                if extra is None:
+                    extra = {}
+                extra[key] = value
+        item.extra = extra
+        probability = entry.get("probability") if item.has & HAS_PROBABILITY else None
+        item.layout = self._layout((tuple(entry), tuple(probability) if probability else ()))
+
+    def field(self, item: CompactEntry, key: str):
+        """1キー分の値（無ければ NotImplemented）"""
+        has = item.has
+        if key == "languages" and has & HAS_LANGUAGES:
+            return {lang: list(texts) for lang, texts in item.languages}
+        if key == "context" and has & HAS_CONTEXT:
+            return item.context
+        if key == "confidence" and has & HAS_CONFIDENCE:
+            return self.confidence[item.row]
+        if key == "meaning_distance" and has & HAS_DISTANCE:
+            if item.distance_ids is None:
+                return {}
+            return {self.phrases.key(pid): d for pid, d in zip(item.distance_ids, item.distance_values)}
+        if key == "probability" and has & HAS_PROBABILITY:
+            row = item.row
+            return {lang: column[row] for lang, column in self.probability.items() if column[row] == column[row]}
+        if key == "last_modified" and has & HAS_LAST_MODIFIED:
+            return item.last_modified
+        if item.extra is not None and key in item.extra:
+            return item.extra[key]
+        return NotImplemented
+
+    def _layout(self, keys: tuple) -> int:
+        layout = self._layout_ids.get(keys)
+        if layout is None:
+            layout = self._layout_ids[keys] = len(self.layouts)
+            self.layouts.append(keys)
+        return layout
+
+    def unpack(self, item: CompactEntry) -> dict:
+        keys, probability_langs = self.layouts[item.layout]
+        entry = {key: self.field(item, key) for key in keys}
+        if probability_langs:
+            row = item.row
+            entry["probability"] = {lang: self.probability[lang][row] for lang in probability_langs}
+        return entry
+
+class FrozenEntries:
+    """
+    CompactEntries のある時点の写し（読み出し専用。スレッド上で読んでよい）
+    エントリは置き換えで更新されるのでエントリの表は浅いコピーで済み、その場で書き換わる
+    confidence / probability の列だけを複製する。フレーズ表と layouts は追加しかされないので共有
+    """
+    def __init__(self, table: CompactEntries):
+        self.phrases = table.phrases
+        self.layouts = table.layouts
+        self.confidence = table.confidence[:]
+        self.probability = {lang: column[:] for lang, column in table.probability.items()}
+        self._entries = dict(table._entries)
+        self._checked_out = copy.deepcopy(table._checked_out)
+
+    def __getitem__(self, entry_id: str) -> dict:
+        entry = self._checked_out.get(entry_id)
+        return entry if entry is not None else self.unpack(self._entries[entry_id])
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    field = CompactEntries.field
+    unpack = CompactEntries.unpack
+    to_dict = CompactEntries.to_dict
+    language_rows = CompactEntries.language_rows
+
+def freeze_entries(entries):
+    """保存用の写し（CompactEntries 以外の dict はエントリが置き換えで更新されるので浅いコピー）"""
+    if isinstance(entries, CompactEntries):
+        return entries.freeze()
+    return dict(entries)
+
+def _float_dict(value) -> bool:
+    return isinstance(value, dict) and all(type(v) is float for v in value.values())
+
+# =========================
+# 学習器
+# =========================
+class CompactLangDictTrainer(LangDictTrainer):
+    """CompactEntries 上の学習器（書き換えるエントリだけ dict に戻す）"""
+    def load_for_update(self, entry_id: str) -> dict:
+        return self.entries.checkout(entry_id)
+
+    def train(self, logs) -> Set[str]:
+        try:
+            return super().train(logs)
+        finally:
+            self.entries.commit_checkouts()
+
+def new_trainer(lang_dict: dict, context_window: int = 20) -> LangDictTrainer:
+    """entries の持ち方に合った学習器"""
+    if isinstance(lang_dict.get("entries"), CompactEntries):
+        return CompactLangDictTrainer(lang_dict, context_window)
+    return LangDictTrainer(lang_dict, context_window)
+
+def plain_entry(entry) -> dict:
+    """CompactEntry なら dict に戻す（別プロセスに渡すときなど）"""
+    return entry.to_dict() if isinstance(entry, CompactEntry) else entry
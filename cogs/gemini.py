@@ -0,0 +1,494 @@
+import asyncio
+import json
+import os
+import time
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+import aiohttp
+
+from cogs.lang_index import normalize_text
+from cogs.metrics import MetricsRegistry
+from cogs.partial_json import PartialJsonObject
+from cogs.upstream import AdaptiveLimiter, CircuitBreaker, backoff_delay, parse_retry_after
+
+# =========================
+# 設定
+# =========================
+SUPPORTED_LANGS = ["ja", "en", "ko", "zh"]
+
+GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "YOUR_GEMINI_API_KEY")
+GEMINI_API_URL = "https://generativelanguage.googleapis.com/v1beta/models/gemini-pro:generateContent"
+GEMINI_BATCH_WINDOW = 0.0  # 秒。0より大きいとマイクロバッチを有効化
+GEMINI_MAX_BATCH = 8
+GEMINI_TIMEOUT = 15.0      # 秒。1回の試行の上限
+GEMINI_DEADLINE = 30.0     # 秒。再試行を含めた1呼び出しの上限
+GEMINI_MAX_ATTEMPTS = 3
+GEMINI_HEDGE_DELAY = float(os.getenv("GEMINI_HEDGE_DELAY", "0"))  # 秒。0より大きいとヘッジを有効化
+
+GEMINI_REQUESTS_DOC = "Gemini API requests by result"
+
+def is_retryable(result: str) -> bool:
+    """再試行する失敗（429・5xx・タイムアウト・接続エラー）"""
+    return result in ("http_429", "timeout", "error") or result.startswith("http_5")
+
+# =========================
+# Geminiクライアント
+# =========================
+class GeminiClient:
+    """
+    Gemini 翻訳クライアント
+      - 同じ (src_lang, テキスト) の同時リクエストは1回の呼び出しを共有（single-flight）
+      - batch_window > 0 のとき、短時間に溜まった複数メッセージを
+        1つのプロンプトにまとめて送り、キー付きJSONで受けて振り分ける
+      - 同時リクエスト数は AdaptiveLimiter（429 で半減）、失敗は揺らぎ付きで再試行
+      - 上流が続けて失敗したら CircuitBreaker が開き、しばらくは送らずに失敗を返す
+      - hedge_delay > 0 のとき、その時間応答が無ければ同じリクエストをもう1本送り先着を使う
+      - stream() は streamGenerateContent の応答を読み進め、言語ごとの訳が閉じた順に返す
+        同じ (src_lang, テキスト) のストリームは1本を共有し、translate() とも結果を共有する
+    """
+    def __init__(
+        self, session: aiohttp.ClientSession, api_url: str = GEMINI_API_URL,
+        api_key: str = GEMINI_API_KEY, batch_window: float = GEMINI_BATCH_WINDOW,
+        max_batch: int = GEMINI_MAX_BATCH, metrics: Optional[MetricsRegistry] = None,
+        timeout: float = GEMINI_TIMEOUT, deadline: float = GEMINI_DEADLINE,
+        max_attempts: int = GEMINI_MAX_ATTEMPTS, hedge_delay: float = GEMINI_HEDGE_DELAY,
+        limiter: Optional[AdaptiveLimiter] = None, breaker: Optional[CircuitBreaker] = None,
+        stream_url: Optional[str] = None
+    ):
+        self.session = session
+        self.stream_url = stream_url or api_url.replace(":generateContent", ":streamGenerateContent")
+        self.metrics = metrics or MetricsRegistry()
+        self.limiter = limiter or AdaptiveLimiter()
+        self.breaker = breaker or CircuitBreaker()
+        self.timeout = timeout
+        self.deadline = deadline
+        self.max_attempts = max_attempts
+        self.hedge_delay = hedge_delay
+        self.last_error: Optional[str] = None
+        self.api_url = api_url
+        self.api_key = api_key
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self._inflight: Dict[tuple, asyncio.Future] = {}
+        self._streams: Dict[tuple, _SharedStream] = {}
+        self._pending: List[tuple] = []  # (text, src_lang, future)
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._tasks = set()
+
+    # =========================
+    # 公開API
+    # =========================
+    def available(self) -> bool:
+        """今送れば上流まで届くか（ブレーカーが開いている間は False）"""
+        return self.breaker.available()
+
+    async def translate(self, text: str, src_lang: str) -> Dict[str, str]:
+        """翻訳結果 {lang: text} を返す（失敗時は空dict）"""
+        key = (src_lang, normalize_text(text))
+        future = self._inflight.get(key)
+        if future is None:
+            future = self._new_future(key)
+            if self.batch_window > 0:
+                self._enqueue(text, src_lang, future)
+            else:
+                self._spawn(self._resolve(future, self.request(text, src_lang)))
+        # 待っている呼び出し元がキャンセルされても共有の結果は壊さない
+        try:
+            return dict(await asyncio.shield(future))
+        except asyncio.CancelledError:
+            if future.cancelled():
+                return {}  # 共有の呼び出しが止められた（close など）。失敗として扱う
+            raise
+
+    async def translate_many(self, texts: List[str], src_lang: str) -> List[Dict[str, str]]:
+        """
+        複数の文を1リクエストで翻訳し、同じ順で結果を返す（失敗した文は空dict）
+        同じ文を翻訳中の呼び出しがあればその結果を共有する
+        """
+        futures, batch = [], []
+        for text in texts:
+            key = (src_lang, normalize_text(text))
+            future = self._inflight.get(key)
+            if future is None:
+                future = self._new_future(key)
+                batch.append((text, src_lang, future))
+            futures.append(future)
+        if batch:
+            self._spawn(self._run_batch(batch))
+        # 共有の呼び出しが止められた文（キャンセル済みの future）は失敗として扱う
+        results = await asyncio.shield(asyncio.gather(*futures, return_exceptions=True))
+        return [dict(result) if isinstance(result, dict) else {} for result in results]
+
+    async def close(self):
+        """実行中・待機中の呼び出しを止める（待っている呼び出し元には失敗が返る）"""
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        pending, self._pending = self._pending, []
+        for _, _, future in pending:
+            future.cancel()
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def request(self, text: str, src_lang: str) -> Dict[str, str]:
+        """1メッセージを1リクエストで翻訳"""
+        parsed = await self._generate(self._prompt(text, src_lang))
+        if not isinstance(parsed, dict):
+            return {}
+        return self._pick_langs(parsed, src_lang)
+
+    async def stream(self, text: str, src_lang: str) -> AsyncIterator[Tuple[str, str]]:
+        """
+        1メッセージを翻訳し、(lang, 訳) を言語ごとに訳が閉じた順で返す
+          - 同じ (src_lang, テキスト) のストリームが流れていれば、その訳を受け取る
+          - 同じものを translate() で翻訳中なら、その結果を待ってまとめて返す
+        ストリームが途中で失敗したら、まだ返していない言語を再試行つきの request() で補う
+        """
+        key = (src_lang, normalize_text(text))
+        shared = self._streams.get(key)
+        if shared is None:
+            if key in self._inflight:
+                for lang, value in (await self.translate(text, src_lang)).items():
+                    yield lang, value
+                return
+            shared = _SharedStream()
+            self._streams[key] = shared
+            # 読み手が途中でやめても、同じ訳を待つ他の呼び出し元のために最後まで読む
+            self._spawn(self._pump(key, shared, self._new_future(key), text, src_lang))
+        async for lang, value in shared.follow():
+            yield lang, value
+
+    async def _pump(self, key: tuple, shared: "_SharedStream", future: asyncio.Future, text: str, src_lang: str):
+        """ストリームを1本読み、届いた訳を shared に配る（終わったら全体を future にも入れる）"""
+        completed = False
+        try:
+            if self.breaker.allow():
+                langs = self._stream_langs(self._prompt(text, src_lang), src_lang)
+                try:
+                    async for lang, value in langs:
+                        shared.push(lang, value)
+                    completed = True
+                except _StreamFailed:
+                    pass
+                finally:
+                    await langs.aclose()
+            else:
+                self.metrics.counter("gemini_short_circuits_total", "Gemini calls skipped by the open circuit").inc()
+                self.last_error = "circuit open"
+            if not completed:
+                for lang, value in (await self.request(text, src_lang)).items():
+                    if lang not in shared.values:
+                        shared.push(lang, value)
+            completed = True
+        except Exception:
+            completed = True  # 届いた分だけで終える
+        finally:
+            self._streams.pop(key, None)
+            shared.close()
+            _settle(future, dict(shared.values) if completed else None)
+
+    async def request_batch(self, items: List[tuple]) -> List[Dict[str, str]]:
+        """
+        複数メッセージを1リクエストで翻訳
+        items: [(text, src_lang), ...] → 同じ順で結果を返す
+        """
+        messages = {
+            str(i): {"source_language": src_lang, "message": text}
+            for i, (text, src_lang) in enumerate(items)
+        }
+        prompt = (
+            "You are a professional translation assistant.\n"
+            "Translate each of the following messages naturally.\n"
+            "Preserve tone and intent.\n\n"
+            f"Messages (JSON keyed by id):\n{json.dumps(messages, ensure_ascii=False)}\n\n"
+            "Return JSON only, keyed by the same ids:\n"
+            "{ \"0\": { \"ja\": \"...\", \"en\": \"...\", \"ko\": \"...\", \"zh\": \"...\" }, ... }"
+        )
+        parsed = await self._generate(prompt)
+        if not isinstance(parsed, dict):
+            return [{} for _ in items]
+        results = []
+        for i, (_, src_lang) in enumerate(items):
+            value = parsed.get(str(i))
+            results.append(self._pick_langs(value, src_lang) if isinstance(value, dict) else {})
+        return results
+
+    # =========================
+    # 内部処理
+    # =========================
+    async def _generate(self, prompt: str):
+        """generateContent を呼んで本文のJSONを返す（失敗時は None）"""
+        if not self.breaker.allow():
+            self.metrics.counter("gemini_short_circuits_total", "Gemini calls skipped by the open circuit").inc()
+            self.last_error = "circuit open"
+            return None
+        try:
+            result, parsed = await self._generate_with_retries(prompt)
+        except asyncio.CancelledError:
+            self.breaker.abandon()
+            raise
+        # 上流が応答できている（4xx・壊れた本文も含む）かどうかでブレーカーを動かす
+        if is_retryable(result):
+            self.breaker.record_failure()
+        else:
+            self.breaker.record_success()
+        return parsed
+
+    async def _generate_with_retries(self, prompt: str):
+        """(最後の結果, 本文のJSON) を返す。再試行は deadline の範囲内だけ"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.deadline
+        result, parsed = "timeout", None
+        for attempt in range(self.max_attempts):
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            result, parsed, retry_after = await self._attempt(prompt, min(self.timeout, remaining))
+            if not is_retryable(result) or attempt + 1 == self.max_attempts:
+                break
+            delay = backoff_delay(attempt, retry_after)
+            if loop.time() + delay >= deadline:
+                break
+            self.metrics.counter("gemini_retries_total", "Gemini request retries by cause", cause=result).inc()
+            await asyncio.sleep(delay)
+        return result, parsed
+
+    async def _attempt(self, prompt: str, timeout: float):
+        """1回の試行（ヘッジ有効時は遅ければ2本目を送り、先に成功した方を使う）"""
+        if self.hedge_delay <= 0 or self.hedge_delay >= timeout:
+            return await self._post(prompt, timeout)
+        first = asyncio.ensure_future(self._post(prompt, timeout))
+        done, _ = await asyncio.wait({first}, timeout=self.hedge_delay)
+        # 混んでいるとき（空き枠が無い）にヘッジすると負荷を上乗せするだけなので送らない
+        if done or not self.limiter.has_capacity():
+            return await first
+        self.metrics.counter("gemini_hedges_total", "Hedged Gemini requests sent").inc()
+        pending = {first, asyncio.ensure_future(self._post(prompt, timeout - self.hedge_delay))}
+        try:
+            while True:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                outcome = next(iter(done)).result()
+                if outcome[0] == "ok" or not pending:
+                    return outcome
+        finally:
+            for task in pending:
+                task.cancel()
+
+    async def _post(self, prompt: str, timeout: float):
+        """1リクエスト送って (結果, 本文のJSON, Retry-After) を返す"""
+        payload = {"contents": [{"parts": [{"text": prompt}]}]}
+        started = await self.limiter.acquire()
+        try:
+            with self.metrics.timer("gemini_request_seconds", "Gemini generateContent round-trip"):
+                async with self.session.post(
+                    f"{self.api_url}?key={self.api_key}", json=payload,
+                    timeout=aiohttp.ClientTimeout(total=timeout)
+                ) as resp:
+                    if resp.status != 200:
+                        if resp.status == 429:
+                            self.limiter.on_overload(started)
+                        self._record_failure(f"http_{resp.status}", f"HTTP {resp.status}")
+                        return f"http_{resp.status}", None, parse_retry_after(resp.headers.get("Retry-After"))
+                    data = await resp.json()
+            raw = data["candidates"][0]["content"]["parts"][0]["text"]
+            parsed = json.loads(raw)
+        except asyncio.TimeoutError:
+            self._record_failure("timeout", f"timed out after {timeout:.1f}s")
+            return "timeout", None, None
+        except (KeyError, IndexError, TypeError, ValueError) as e:
+            self._record_failure("invalid_response", f"{type(e).__name__}: {e}")
+            return "invalid_response", None, None
+        except Exception as e:
+            self._record_failure("error", f"{type(e).__name__}: {e}")
+            return "error", None, None
+        finally:
+            self.limiter.release()
+        self.limiter.on_success()
+        self.metrics.counter("gemini_requests_total", GEMINI_REQUESTS_DOC, result="ok").inc()
+        return "ok", parsed, None
+
+    async def _stream_langs(self, prompt: str, src_lang: str) -> AsyncIterator[Tuple[str, str]]:
+        """
+        streamGenerateContent（SSE）を1回呼び、本文の JSON を読み進めて言語ごとに返す
+        breaker.allow() を通った後に呼ぶこと。失敗したら _StreamFailed
+        """
+        payload = {"contents": [{"parts": [{"text": prompt}]}]}
+        started = await self.limiter.acquire()
+        began = time.perf_counter()
+        result, message = "error", None
+        try:
+            async with self.session.post(
+                f"{self.stream_url}?alt=sse&key={self.api_key}", json=payload,
+                timeout=aiohttp.ClientTimeout(total=self.timeout)
+            ) as resp:
+                if resp.status != 200:
+                    if resp.status == 429:
+                        self.limiter.on_overload(started)
+                    result, message = f"http_{resp.status}", f"HTTP {resp.status}"
+                    raise _StreamFailed()
+                parser = PartialJsonObject()
+                async for line in resp.content:
+                    if not line.startswith(b"data:"):
+                        continue
+                    for key, value in parser.feed(_chunk_text(json.loads(line[5:]))):
+                        if key in SUPPORTED_LANGS and key != src_lang and value:
+                            yield key, value
+                if not parser.done:
+                    result, message = "invalid_response", "stream ended before the JSON object closed"
+                    raise _StreamFailed()
+            result = "ok"
+        except asyncio.CancelledError:
+            self.breaker.abandon()
+            raise
+        except _StreamFailed:
+            raise
+        except asyncio.TimeoutError:
+            result, message = "timeout", f"stream timed out after {self.timeout:.1f}s"
+            raise _StreamFailed()
+        except (KeyError, IndexError, TypeError, ValueError) as e:
+            result, message = "invalid_response", f"{type(e).__name__}: {e}"
+            raise _StreamFailed()
+        except Exception as e:
+            result, message = "error", f"{type(e).__name__}: {e}"
+            raise _StreamFailed()
+        finally:
+            self.limiter.release()
+            self.metrics.histogram("gemini_request_seconds", "Gemini generateContent round-trip").observe(
+                time.perf_counter() - began
+            )
+            if result == "ok":
+                self.limiter.on_success()
+                self.breaker.record_success()
+                self.metrics.counter("gemini_requests_total", GEMINI_REQUESTS_DOC, result="ok").inc()
+            elif message is not None:
+                self._record_failure(result, message)
+                if is_retryable(result):
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()
+            else:
+                # 呼び出し元が途中で読むのをやめた
+                self.breaker.abandon()
+
+    def _prompt(self, text: str, src_lang: str) -> str:
+        return (
+            "You are a professional translation assistant.\n"
+            "Translate the following message naturally.\n"
+            "Preserve tone and intent.\n\n"
+            f"Source language: {src_lang}\n"
+            f"Message: {text}\n\n"
+            "Return JSON only:\n"
+            "{ \"ja\": \"...\", \"en\": \"...\", \"ko\": \"...\", \"zh\": \"...\" }"
+        )
+
+    def _record_failure(self, result: str, message: str):
+        # 失敗は握りつぶさず、件数と最後のエラーを残す
+        self.metrics.counter("gemini_requests_total", GEMINI_REQUESTS_DOC, result=result).inc()
+        self.last_error = message
+
+    def _pick_langs(self, parsed: dict, src_lang: str) -> Dict[str, str]:
+        return {lang: parsed.get(lang) for lang in SUPPORTED_LANGS if lang != src_lang and parsed.get(lang)}
+
+    def _new_future(self, key: tuple) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return future
+
+    def _spawn(self, coro):
+        # 参照を持っておかないとタスクが途中でGCされることがある
+        task = asyncio.create_task(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _resolve(self, future: asyncio.Future, coro):
+        result = None
+        try:
+            result = await coro
+        except Exception:
+            result = {}
+        finally:
+            # キャンセルされたとき（result が None）も future を未解決のまま残さない（待っている側が止まる）
+            _settle(future, result)
+
+    def _enqueue(self, text: str, src_lang: str, future: asyncio.Future):
+        self._pending.append((text, src_lang, future))
+        if len(self._pending) >= self.max_batch:
+            self._flush_pending()
+        elif self._flush_handle is None:
+            loop = asyncio.get_running_loop()
+            self._flush_handle = loop.call_later(self.batch_window, self._flush_pending)
+
+    def _flush_pending(self):
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+        batch, self._pending = self._pending, []
+        if batch:
+            self._spawn(self._run_batch(batch))
+
+    async def _run_batch(self, batch: List[tuple]):
+        results = [None] * len(batch)
+        try:
+            if len(batch) == 1:
+                text, src_lang, _ = batch[0]
+                results = [await self.request(text, src_lang)]
+            else:
+                results = await self.request_batch([(text, src_lang) for text, src_lang, _ in batch])
+        except Exception:
+            results = [{} for _ in batch]
+        finally:
+            for (_, _, future), result in zip(batch, results):
+                _settle(future, result)
+
+def _settle(future: asyncio.Future, result: Optional[Dict[str, str]]):
+    """共有の future を解決する（result が None なら呼び出しが止められたのでキャンセル）"""
+    if future.done():
+        return
+    if result is None:
+        future.cancel()
+    else:
+        future.set_result(result)
+
+class _SharedStream:
+    """1本のストリームの訳を、同じメッセージを待つ複数の呼び出し元へ配る"""
+    def __init__(self):
+        self.values: Dict[str, str] = {}
+        self.closed = False
+        self._changed = asyncio.Event()
+
+    def push(self, lang: str, value: str):
+        self.values[lang] = value
+        self._wake()
+
+    def close(self):
+        self.closed = True
+        self._wake()
+
+    def _wake(self):
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def follow(self) -> AsyncIterator[Tuple[str, str]]:
+        """届いた順に (lang, 訳) を返す（途中から読み始めても最初から返す）"""
+        seen = 0
+        while True:
+            items = list(self.values.items())
+            for lang, value in items[seen:]:
+                yield lang, value
+            seen = len(items)
+            if self.closed and seen == len(self.values):
+                return
+            if seen == len(self.values):
+                await self._changed.wait()
+
+class _StreamFailed(Exception):
+    """ストリームが失敗した（理由は記録済み）"""
+
+def _chunk_text(event: dict) -> str:
+    """SSE の1イベントに含まれる本文の断片（最後のイベントなどは空）"""
+    candidates = event.get("candidates") or [{}]
+    parts = (candidates[0].get("content") or {}).get("parts") or []
+    return "".join(part.get("text", "") for part in parts)
@@ -0,0 +1,219 @@
+import os
+import re
+from difflib import SequenceMatcher
+from typing import Dict, Iterable, List, Optional
+
+# あいまい検索の実装: "bktree"（厳密）/ "ngram"（numpy の行列積で候補を絞る近似）
+FUZZY_BACKEND = os.getenv("FUZZY_BACKEND", "bktree")
+
+# =========================
+# 正規化
+# =========================
+def normalize_text(text: str) -> str:
+    """テキスト正規化（小文字化、空白削除など）"""
+    return re.sub(r"\s+", "", text.strip().lower())
+
+# =========================
+# あいまい検索（BK-tree）
+# =========================
+def lcs_length(a: str, b: str) -> int:
+    """最長共通部分列の長さ（ビット並列、O(len(b) * len(a)/64)）"""
+    if not a or not b:
+        return 0
+    masks: Dict[str, int] = {}
+    for i, ch in enumerate(a):
+        masks[ch] = masks.get(ch, 0) | (1 << i)
+    full = (1 << len(a)) - 1
+    v = full
+    for ch in b:
+        u = v & masks.get(ch, 0)
+        v = ((v + u) | (v - u)) & full
+    return len(a) - v.bit_count()
+
+def indel_distance(a: str, b: str) -> int:
+    """挿入・削除のみの編集距離（距離の公理を満たす）"""
+    return len(a) + len(b) - 2 * lcs_length(a, b)
+
+class FuzzyIndex:
+    """
+    1言語分の BK-tree
+    SequenceMatcher の ratio は 2*LCS/(len(a)+len(b)) 以下なので、
+    ratio >= cutoff を満たす候補は indel 距離で上から抑えられる。
+    その範囲だけ木をたどり、最後に ratio で厳密に判定する
+    """
+    def __init__(self):
+        self._root = None  # [text, {distance: node}]
+        self.size = 0
+
+    def add(self, text: str):
+        if not text:
+            return
+        if self._root is None:
+            self._root = [text, {}]
+            self.size += 1
+            return
+        node = self._root
+        while True:
+            d = indel_distance(text, node[0])
+            if d == 0:
+                return
+            child = node[1].get(d)
+            if child is None:
+                node[1][d] = [text, {}]
+                self.size += 1
+                return
+            node = child
+
+    def search(self, query: str, cutoff: float, strict: bool = False) -> List[tuple]:
+        """ratio が cutoff 以上（strict なら超過）の (text, ratio) を返す"""
+        if self._root is None or not query or cutoff <= 0:
+            return []
+        a = len(query)
+        # 浮動小数の丸めで境界上の候補を落とさないよう少し緩める
+        slack = 1.0 - cutoff + 1e-9
+        # ratio >= cutoff となり得る候補長の上限
+        max_len = a * (2.0 - cutoff) / cutoff + 1e-9
+
+        matches = []
+        stack = [self._root]
+        while stack:
+            text, children = stack.pop()
+            b = len(text)
+            d = indel_distance(query, text)
+            if d <= slack * (a + b) and b <= max_len:
+                matcher = SequenceMatcher(None, query, text)
+                if matcher.real_quick_ratio() >= cutoff and matcher.quick_ratio() >= cutoff:
+                    ratio = matcher.ratio()
+                    if ratio > cutoff or (ratio == cutoff and not strict):
+                        matches.append((text, ratio))
+            for e, child in children.items():
+                # 子の部分木の文字列長は b + e 以下
+                bound = slack * (a + min(max_len, b + e))
+                if abs(d - e) <= bound:
+                    stack.append(child)
+        return matches
+
+    def search_many(self, queries: List[str], cutoff: float, strict: bool = False) -> List[List[tuple]]:
+        return [self.search(query, cutoff, strict) for query in queries]
+
+def new_fuzzy_index():
+    """FUZZY_BACKEND に応じた1言語分のあいまい検索索引（numpy が無ければ BK-tree）"""
+    if FUZZY_BACKEND == "ngram":
+        from cogs.ngram_index import NgramIndex, numpy_available
+        if numpy_available():
+            return NgramIndex()
+    return FuzzyIndex()
+
+# =========================
+# 索引本体
+# =========================
+class LangIndex:
+    """
+    lang_dict["entries"] の検索用索引
+    (src_lang, 正規化テキスト) → エントリID のリスト（登録順）を保持し、
+    完全一致を全件走査なしで引けるようにする。
+    あいまい検索は言語ごとの BK-tree（または n-gram 行列）で行う
+    """
+    def __init__(self, entries: Optional[Dict[str, dict]] = None):
+        self._exact: Dict[tuple, List[str]] = {}
+        self._fuzzy: Dict[str, FuzzyIndex] = {}
+        self._order: Dict[str, int] = {}
+        if entries:
+            self.build(entries)
+
+    def build(self, entries: Dict[str, dict]):
+        """エントリ全体から索引を作り直す（ロード時に一度だけ）"""
+        self._exact = {}
+        self._fuzzy = {}
+        self._order = {}
+        for eid, entry in entries.items():
+            self.add(eid, entry.get("languages", {}))
+
+    def add(self, entry_id: str, languages: Dict[str, Iterable[str]]):
+        """エントリを索引に追加（add_entry などから差分更新）"""
+        self._order.setdefault(entry_id, len(self._order))
+        for lang, texts in languages.items():
+            for text in texts:
+                norm = normalize_text(text)
+                ids = self._exact.get((lang, norm))
+                if ids is None:
+                    # 初めて見るテキストだけ BK-tree に入れる
+                    ids = self._exact[(lang, norm)] = []
+                    self._fuzzy.setdefault(lang, new_fuzzy_index()).add(norm)
+                if entry_id not in ids:
+                    ids.append(entry_id)
+
+    def remove(self, entry_id: str, languages: Dict[str, Iterable[str]]):
+        """エントリを索引から外す（上書き前の旧データ用）"""
+        for lang, texts in languages.items():
+            for text in texts:
+                key = (lang, normalize_text(text))
+                ids = self._exact.get(key)
+                if not ids or entry_id not in ids:
+                    continue
+                ids.remove(entry_id)
+                if not ids:
+                    del self._exact[key]
+
+    def lookup(self, text: str, src_lang: str) -> List[str]:
+        """完全一致するエントリIDを登録順で返す"""
+        return self.lookup_normalized(normalize_text(text), src_lang)
+
+    def lookup_normalized(self, norm: str, src_lang: str) -> List[str]:
+        return self._exact.get((src_lang, norm), [])
+
+    def rank(self, entry_id: str) -> int:
+        """登録順（小さいほど古い）"""
+        return self._order[entry_id]
+
+    def fuzzy_lookup(
+        self, text: str, src_lang: str, cutoff: float,
+        strict: bool = False, mode: str = "best"
+    ) -> List[str]:
+        """
+        類似一致するエントリIDを返す
+        mode="best"  : 類似度の高い順（同率は登録順）
+        mode="first" : 登録順（従来の「最初に閾値を超えたもの」）
+        """
+        return self.fuzzy_lookup_many([text], src_lang, cutoff, strict, mode)[0]
+
+    def fuzzy_lookup_many(
+        self, texts: List[str], src_lang: str, cutoff: float,
+        strict: bool = False, mode: str = "best"
+    ) -> List[List[str]]:
+        """複数の文をまとめて類似検索（n-gram 行列なら1回の行列積）"""
+        tree = self._fuzzy.get(src_lang)
+        if tree is None:
+            return [[] for _ in texts]
+        results = []
+        for matches in tree.search_many([normalize_text(t) for t in texts], cutoff, strict):
+            scored = {}
+            for norm, ratio in matches:
+                # 削除済みのテキストは木に残るので索引側で確認
+                for eid in self.lookup_normalized(norm, src_lang):
+                    if ratio > scored.get(eid, -1.0):
+                        scored[eid] = ratio
+            if mode == "first":
+                results.append(sorted(scored, key=self.rank))
+            else:
+                results.append(sorted(scored, key=lambda eid: (-scored[eid], self.rank(eid))))
+        return results
+
+    def resolve(
+        self, entries: Dict[str, dict], entry_ids: Iterable[str], tgt_langs: Iterable[str]
+    ) -> Dict[str, str]:
+        """
+        候補エントリから各ターゲット言語の訳を一度に解決する
+        言語ごとに、その言語を持つ最初のエントリの先頭訳を採用
+        """
+        result = {}
+        pending = set(tgt_langs)
+        for eid in entry_ids:
+            if not pending:
+                break
+            langs = entries.get(eid, {}).get("languages", {})
+            for lang in list(pending):
+                if langs.get(lang):
+                    result[lang] = langs[lang][0]
+                    pending.discard(lang)
+        return result
@@ -0,0 +1,290 @@
+import json
+import mmap
+import os
+import struct
+import zlib
+from array import array
+from collections.abc import Mapping
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from cogs.lang_index import LangIndex, normalize_text
+from cogs.persistence import atomic_write
+
+# =========================
+# 設定
+# =========================
+SNAPSHOT_MAGIC = b"LDSNAP01"
+
+# ヘッダ: magic, 元JSONのサイズ, 元JSONの mtime_ns, エントリ数, キー数, 完全一致表の枠数, ID表の枠数
+_HEADER = struct.Struct("<8sQQIIII")
+# 続いて各セクションの (オフセット, バイト数)
+_SECTIONS = (
+    "meta",         # entries 以外の lang_dict（JSON）
+    "eid_offsets",  # Q[エントリ数+1] : eid_blob 内の位置
+    "eid_blob",     # エントリIDを並べた UTF-8
+    "lang_offsets", # Q[エントリ数+1] : lang_blob 内の位置
+    "lang_blob",    # エントリごとの languages（JSON）
+    "key_offsets",  # Q[キー数+1]     : key_blob 内の位置
+    "key_blob",     # "lang\0正規化テキスト" を並べた UTF-8
+    "key_hashes",   # I[キー数]       : キーの crc32
+    "ids_offsets",  # I[キー数+1]     : ids 内の位置
+    "ids",          # I[...]          : キーごとのエントリ番号（登録順）
+    "exact_slots",  # I[枠数]         : キー番号+1（0 は空き）
+    "eid_slots",    # I[枠数]         : エントリ番号+1（0 は空き）
+)
+_SECTION = struct.Struct("<QQ")
+_ALIGN = 8
+
+LanguageRows = List[Tuple[str, tuple]]  # [(エントリID, ((lang, (text, ...)), ...)), ...]
+
+def snapshot_path_for(path: str) -> str:
+    """lang_dict.json → lang_dict.snap"""
+    return os.path.splitext(path)[0] + ".snap"
+
+# =========================
+# 書き出し
+# =========================
+def language_rows(entries) -> LanguageRows:
+    """
+    スナップショットに入れる languages を取り出す（freeze_entries の写しならスレッド上で呼んでよい）
+    CompactEntry の languages は書き換えられないタプルなのでそのまま持ち出せる
+    """
+    rows = []
+    compact = getattr(entries, "language_rows", None)
+    if compact is not None:
+        return compact()
+    for eid, entry in entries.items():
+        languages = entry.get("languages", {})
+        rows.append((eid, tuple((lang, tuple(texts)) for lang, texts in languages.items())))
+    return rows
+
+def _hash_table(hashes: List[int]) -> array:
+    """線形探索のハッシュ表（値は番号+1）。枠数は2の冪で要素数の2倍以上"""
+    size = 8
+    while size < 2 * len(hashes):
+        size *= 2
+    mask = size - 1
+    slots = array("I", bytes(4 * size))
+    for i, h in enumerate(hashes):
+        j = h & mask
+        while slots[j]:
+            j = (j + 1) & mask
+        slots[j] = i + 1
+    return slots
+
+def _offsets(chunks: List[bytes], typecode: str = "Q") -> array:
+    offsets = array(typecode, [0])
+    total = 0
+    for chunk in chunks:
+        total += len(chunk)
+        offsets.append(total)
+    return offsets
+
+def build_snapshot(rows: LanguageRows, meta: dict) -> Tuple[tuple, List[bytes]]:
+    """
+    languages と完全一致索引を (件数, セクションのバイト列) にする（スレッド上で呼んでよい）
+    キーごとのエントリの並びは LangIndex と同じ（登録順・重複なし）
+    """
+    eids = [eid.encode("utf-8") for eid, _ in rows]
+    langs = [
+        json.dumps({lang: list(texts) for lang, texts in languages}, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        for _, languages in rows
+    ]
+
+    exact: Dict[bytes, List[int]] = {}
+    for ordinal, (_, languages) in enumerate(rows):
+        for lang, texts in languages:
+            for text in texts:
+                ids = exact.setdefault(f"{lang}\0{normalize_text(text)}".encode("utf-8"), [])
+                if not ids or ids[-1] != ordinal:
+                    ids.append(ordinal)
+    keys = list(exact)
+    key_hashes = array("I", [zlib.crc32(key) for key in keys])
+    ids_offsets = array("I", [0])
+    ids = array("I")
+    for key in keys:
+        ids.extend(exact[key])
+        ids_offsets.append(len(ids))
+
+    sections = {
+        "meta": json.dumps(meta, ensure_ascii=False).encode("utf-8"),
+        "eid_offsets": _offsets(eids).tobytes(),
+        "eid_blob": b"".join(eids),
+        "lang_offsets": _offsets(langs).tobytes(),
+        "lang_blob": b"".join(langs),
+        "key_offsets": _offsets(keys).tobytes(),
+        "key_blob": b"".join(keys),
+        "key_hashes": key_hashes.tobytes(),
+        "ids_offsets": ids_offsets.tobytes(),
+        "ids": ids.tobytes(),
+        "exact_slots": _hash_table(key_hashes).tobytes(),
+        "eid_slots": _hash_table([zlib.crc32(eid) for eid in eids]).tobytes(),
+    }
+    counts = (len(rows), len(keys), len(sections["exact_slots"]) // 4, len(sections["eid_slots"]) // 4)
+    return counts, [sections[name] for name in _SECTIONS]
+
+def source_stat(source_path: str) -> Tuple[int, int]:
+    """スナップショットと JSON の対応を見るための (サイズ, mtime_ns)"""
+    stat = os.stat(source_path)
+    return stat.st_size, stat.st_mtime_ns
+
+def write_snapshot(path: str, built: Tuple[tuple, List[bytes]], stat: Tuple[int, int]):
+    """
+    元にした lang_dict.json の (サイズ, mtime_ns) を添えて原子的に書く
+    JSON の方が新しくなったスナップショットは読み込み時に捨てられる
+    """
+    counts, sections = built
+    offset = _HEADER.size + _SECTION.size * len(_SECTIONS)
+    table, body = [], []
+    for data in sections:
+        pad = -offset % _ALIGN
+        body.append(b"\0" * pad)
+        body.append(data)
+        table.append(_SECTION.pack(offset + pad, len(data)))
+        offset += pad + len(data)
+    header = _HEADER.pack(SNAPSHOT_MAGIC, *stat, *counts)
+    atomic_write(path, b"".join([header, *table, *body]))
+
+def is_fresh(path: str, source_path: str) -> bool:
+    """スナップショットが今の lang_dict.json から作られたものか"""
+    try:
+        with open(path, "rb") as f:
+            header = f.read(_HEADER.size)
+        stat = source_stat(source_path)
+    except OSError:
+        return False
+    if len(header) < _HEADER.size:
+        return False
+    magic, size, mtime_ns = _HEADER.unpack(header)[:3]
+    return magic == SNAPSHOT_MAGIC and (size, mtime_ns) == stat
+
+# =========================
+# 読み込み（mmap）
+# =========================
+class MappedSnapshot:
+    """
+    mmap したスナップショット（読み出し専用）
+    開くときはヘッダを読むだけで、引いた分だけページが読み込まれる
+    """
+    def __init__(self, path: str):
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        buf = memoryview(self._mmap)
+        (
+            magic, self.source_size, self.source_mtime_ns,
+            self.entry_count, self.key_count, exact_size, eid_size
+        ) = _HEADER.unpack_from(buf)
+        if magic != SNAPSHOT_MAGIC:
+            raise ValueError(f"not a lang_dict snapshot: {path}")
+        sections = {}
+        for i, name in enumerate(_SECTIONS):
+            offset, length = _SECTION.unpack_from(buf, _HEADER.size + _SECTION.size * i)
+            sections[name] = buf[offset:offset + length]
+        self.top_level_json = bytes(sections["meta"])
+        self.eid_offsets = sections["eid_offsets"].cast("Q")
+        self.eid_blob = sections["eid_blob"]
+        self.lang_offsets = sections["lang_offsets"].cast("Q")
+        self.lang_blob = sections["lang_blob"]
+        self.key_offsets = sections["key_offsets"].cast("Q")
+        self.key_blob = sections["key_blob"]
+        self.key_hashes = sections["key_hashes"].cast("I")
+        self.ids_offsets = sections["ids_offsets"].cast("I")
+        self.ids = sections["ids"].cast("I")
+        self.exact_slots = sections["exact_slots"].cast("I")
+        self.eid_slots = sections["eid_slots"].cast("I")
+        self._exact_mask = exact_size - 1
+        self._eid_mask = eid_size - 1
+
+    def matches(self, source_path: str) -> bool:
+        """source_path から作られたものか（サイズと mtime で判定）"""
+        try:
+            return (self.source_size, self.source_mtime_ns) == source_stat(source_path)
+        except OSError:
+            return False
+
+    def top_level(self) -> dict:
+        """entries 以外の lang_dict（meta など）"""
+        return json.loads(self.top_level_json)
+
+    def entry_id(self, ordinal: int) -> str:
+        return bytes(self.eid_blob[self.eid_offsets[ordinal]:self.eid_offsets[ordinal + 1]]).decode("utf-8")
+
+    def languages(self, ordinal: int) -> dict:
+        return json.loads(bytes(self.lang_blob[self.lang_offsets[ordinal]:self.lang_offsets[ordinal + 1]]))
+
+    def ordinal(self, entry_id: str) -> Optional[int]:
+        key = entry_id.encode("utf-8")
+        mask = self._eid_mask
+        j = zlib.crc32(key) & mask
+        while True:
+            found = self.eid_slots[j]
+            if not found:
+                return None
+            ordinal = found - 1
+            if self.eid_blob[self.eid_offsets[ordinal]:self.eid_offsets[ordinal + 1]] == key:
+                return ordinal
+            j = (j + 1) & mask
+
+    def lookup(self, norm: str, src_lang: str) -> List[int]:
+        """完全一致するエントリ番号（登録順）"""
+        key = f"{src_lang}\0{norm}".encode("utf-8")
+        h = zlib.crc32(key)
+        mask = self._exact_mask
+        j = h & mask
+        while True:
+            found = self.exact_slots[j]
+            if not found:
+                return []
+            k = found - 1
+            if self.key_hashes[k] == h and self.key_blob[self.key_offsets[k]:self.key_offsets[k + 1]] == key:
+                return self.ids[self.ids_offsets[k]:self.ids_offsets[k + 1]].tolist()
+            j = (j + 1) & mask
+
+class MappedEntries(Mapping):
+    """
+    スナップショット上のエントリ（{"languages": ...} だけを持つ読み出し専用の dict 風）
+    全体の読み込みが終わるまでの翻訳用。学習や書き込みには使わない
+    """
+    def __init__(self, mapped: MappedSnapshot):
+        self.mapped = mapped
+
+    def __getitem__(self, entry_id: str) -> dict:
+        ordinal = self.mapped.ordinal(entry_id)
+        if ordinal is None:
+            raise KeyError(entry_id)
+        return {"languages": self.mapped.languages(ordinal)}
+
+    def __contains__(self, entry_id) -> bool:
+        return isinstance(entry_id, str) and self.mapped.ordinal(entry_id) is not None
+
+    def __iter__(self) -> Iterator[str]:
+        return (self.mapped.entry_id(i) for i in range(self.mapped.entry_count))
+
+    def __len__(self) -> int:
+        return self.mapped.entry_count
+
+class MappedLangIndex(LangIndex):
+    """
+    スナップショット上の完全一致索引
+    あいまい検索の索引は持たない（全体の読み込みが終わるまでは常に該当なし）
+    """
+    def __init__(self, mapped: MappedSnapshot):
+        super().__init__()
+        self.mapped = mapped
+
+    def build(self, entries):
+        raise TypeError("MappedLangIndex is read-only")
+
+    def add(self, entry_id: str, languages):
+        raise TypeError("MappedLangIndex is read-only")
+
+    def remove(self, entry_id: str, languages):
+        raise TypeError("MappedLangIndex is read-only")
+
+    def lookup_normalized(self, norm: str, src_lang: str) -> List[str]:
+        entry_id = self.mapped.entry_id
+        return [entry_id(ordinal) for ordinal in self.mapped.lookup(norm, src_lang)]
+
+    def rank(self, entry_id: str) -> int:
+        ordinal = self.mapped.ordinal(entry_id)
+        return ordinal if ordinal is not None else 1 << 62
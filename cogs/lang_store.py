@@ -0,0 +1,326 @@
+import asyncio
+import copy
+import json
+import os
+import pickle
+import threading
+from typing import Dict, Iterable, NamedTuple, Optional
+
+from cogs.compact_entries import CompactEntries, freeze_entries, new_trainer, plain_entry
+from cogs.lang_index import LangIndex
+from cogs.lang_snapshot import (
+    MappedEntries, MappedLangIndex, MappedSnapshot, build_snapshot, is_fresh,
+    language_rows, snapshot_path_for, source_stat, write_snapshot
+)
+from cogs.persistence import DebouncedSaver
+from cogs.trainer import LangDictTrainer
+
+DATA_DIR = "data"
+LANGDICT_PATH = f"{DATA_DIR}/lang_dict.json"
+SAVE_DELAY = 5.0  # 保存をまとめる間隔（秒）
+LANGDICT_BACKEND = os.getenv("LANGDICT_BACKEND", "json")  # "json" / "sqlite"
+# 読み込んだエントリを CompactEntries（列・ID で持つ省メモリ版）に詰めるか
+COMPACT_ENTRIES = os.getenv("COMPACT_ENTRIES", "1") != "0"
+# 保存のたびに languages と完全一致索引のスナップショット（lang_dict.snap）も書き、
+# 起動時はそれを mmap して JSON の読み込みを待たずに引けるようにするか
+LANGDICT_SNAPSHOT = os.getenv("LANGDICT_SNAPSHOT", "1") != "0"
+
+# =========================
+# ユーティリティ
+# =========================
+def load_json(path, default=None):
+    if not os.path.exists(path):
+        return default if default is not None else {}
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+# =========================
+# スナップショット
+# =========================
+class LangDictSnapshot(NamedTuple):
+    """
+    今の辞書と索引の組（lang_dict は JSON バックエンドのみ）
+    version は変更のたびに増える番号で、中身の写しではない。add_entry / merge_entries などは
+    entries と index をその場で書き換え、新しい版も同じオブジェクトを持つ（全体の差し替えだけが別物になる）。
+    await をまたいで持ち続けず、引くたびに snapshot() を取り直すこと
+    """
+    version: int
+    lang_dict: dict
+    entries: Dict[str, dict]
+    index: LangIndex
+
+# =========================
+# 辞書ストア
+# =========================
+class LangDictStore:
+    """
+    全Cogで共有する lang_dict の唯一の保持者
+    辞書本体と索引を持ち、変更のたびに版の番号（version）を上げる。
+    書き込みはイベントループ上で await を挟まずに適用するので、
+    読み手は snapshot() を取って await を挟まずに引けばロックなしで一貫した内容を見られる
+    （エントリ・索引はその場で書き換わるので、await をまたいで持った snapshot は一貫しない。
+    引いた結果の訳など、必要なものだけを取り出して持つこと）
+
+    snapshot_path を渡すと、起動時に新しいスナップショットがあればそれを mmap して
+    完全一致だけ引ける状態ですぐに返り、JSON 全体と類似検索の索引はスレッドで作って
+    差し替える（loaded / wait_loaded）。読み込み前の書き込みはその場で全体を読んでから行う
+    """
+    def __init__(self, path: str = LANGDICT_PATH, snapshot_path: Optional[str] = None):
+        self.path = path
+        self.snapshot_path = snapshot_path
+        self._snapshot: Optional[LangDictSnapshot] = None
+        self._load_task: Optional[asyncio.Task] = None
+        self._snapshot_task: Optional[asyncio.Task] = None
+        self._snapshot_lock = threading.Lock()  # 保存時と読み込み後の書き出しが重ならないように
+        self.saver = DebouncedSaver(
+            path, self.export, SAVE_DELAY, self._snapshot_writer if snapshot_path else None
+        )
+        if not self._open_mapped():
+            self.reload()
+
+    # =========================
+    # 参照
+    # =========================
+    def snapshot(self) -> LangDictSnapshot:
+        """今の辞書と索引（await をまたいで持たない。LangDictSnapshot を参照）"""
+        return self._snapshot
+
+    @property
+    def version(self) -> int:
+        return self._snapshot.version
+
+    @property
+    def lang_dict(self) -> dict:
+        return self._snapshot.lang_dict
+
+    @property
+    def entries(self) -> Dict[str, dict]:
+        return self._snapshot.entries
+
+    @property
+    def index(self) -> LangIndex:
+        return self._snapshot.index
+
+    @property
+    def meta(self) -> dict:
+        """学習カーソルなどのメタ情報（辞書と一緒に保存される）"""
+        self.ensure_loaded()
+        return self.lang_dict.setdefault("meta", {})
+
+    @property
+    def loaded(self) -> bool:
+        """辞書全体と類似検索の索引が揃っているか（スナップショットのみなら False）"""
+        return not isinstance(self._snapshot.entries, MappedEntries)
+
+    async def wait_loaded(self):
+        """バックグラウンドの読み込みが終わるまで待つ"""
+        if self._load_task is not None and not self.loaded:
+            await asyncio.shield(self._load_task)
+        self.ensure_loaded()
+
+    def ensure_loaded(self):
+        """読み込み前なら、待たずにその場で全体を読む（書き込み・学習の前に）"""
+        if not self.loaded:
+            self.reload()
+
+    def make_trainer(self, context_window: int = 20) -> LangDictTrainer:
+        self.ensure_loaded()
+        return new_trainer(self.lang_dict, context_window)
+
+    def export(self):
+        """
+        保存用の lang_dict を作る関数（DebouncedSaver がスレッド上で呼ぶ）
+        イベントループ上では写しを取るだけで、元の JSON スキーマへの変換は関数の中で行う
+        """
+        self.ensure_loaded()
+        entries = freeze_entries(self.entries)
+        top_level = copy.deepcopy({k: v for k, v in self.lang_dict.items() if k != "entries"})
+        keys = list(self.lang_dict)
+
+        def build() -> dict:
+            plain = entries if isinstance(entries, dict) else entries.to_dict()
+            return {k: plain if k == "entries" else top_level[k] for k in keys}
+        return build
+
+    def replica_source(self) -> tuple:
+        """学習ワーカーに渡す辞書の写し（イベントループ上で直列化して途中の変更を含めない）"""
+        self.ensure_loaded()
+        return ("json", pickle.dumps(self.lang_dict, protocol=pickle.HIGHEST_PROTOCOL))
+
+    # =========================
+    # 更新
+    # =========================
+    def reload(self):
+        """ディスクから読み直す（オフライン再構築後など）"""
+        self.replace(load_json(self.path, {"entries": {}}))
+        self._refresh_snapshot()
+
+    def replace(self, lang_dict: dict):
+        """辞書全体を差し替えて索引を作り直す"""
+        entries = _prepare_entries(lang_dict)
+        self._publish(lang_dict, entries, LangIndex(entries))
+
+    def _publish(self, lang_dict: dict, entries, index: LangIndex):
+        version = self._snapshot.version + 1 if self._snapshot else 0
+        self._snapshot = LangDictSnapshot(version, lang_dict, entries, index)
+
+    def commit(self, entry_ids: Iterable[str] = ()):
+        """
+        辞書本体への変更を索引に反映して版の番号を上げる
+        （entries と index はその場で書き換えるので、前の版の snapshot も同じ内容を見る）
+        entry_ids: 追加・変更されたエントリ
+        """
+        self.ensure_loaded()
+        current = self._snapshot
+        for eid in entry_ids:
+            entry = current.entries.get(eid)
+            if entry is not None:
+                current.index.add(eid, entry.get("languages", {}))
+        self._snapshot = current._replace(version=current.version + 1)
+
+    def merge_entries(self, entries: Dict[str, dict]):
+        """学習ワーカーが返したエントリで置き換えて1つの版として公開する"""
+        self.ensure_loaded()
+        current = self.entries
+        for eid, entry in entries.items():
+            old = current.get(eid)
+            if old is not None:
+                self.index.remove(eid, old.get("languages", {}))
+            current[eid] = entry
+        self.commit(entries)
+
+    def add_entry(self, entry_id: str, languages: Dict[str, list]):
+        self.ensure_loaded()
+        old = self.entries.get(entry_id)
+        if old:
+            self.index.remove(entry_id, old.get("languages", {}))
+        self.entries[entry_id] = {"languages": languages}
+        self.commit([entry_id])
+
+    def update_entry_confidence(self, entry_id: str, confidence: float) -> bool:
+        self.ensure_loaded()
+        entry = self.entries.get(entry_id)
+        if entry is None:
+            return False
+        # 保存中の写しが持っているので、その場で書き換えずに置き換える
+        self.entries[entry_id] = {**plain_entry(entry), "confidence": confidence}
+        self.commit()
+        return True
+
+    def save(self):
+        """保存を予約（数秒分の変更をまとめて、スレッド上で原子的に書く）"""
+        self.ensure_loaded()
+        self.saver.mark_dirty()
+
+    async def flush(self):
+        """予約中の保存をすぐに書き出す"""
+        await self.saver.flush()
+        if self._snapshot_task is not None:
+            await self._snapshot_task
+
+    # =========================
+    # スナップショット
+    # =========================
+    def _open_mapped(self) -> bool:
+        """
+        JSON と同じ版のスナップショットがあれば mmap して公開し、全体の読み込みを始める
+        （読み込みはイベントループ上のタスクなので、ループ外では使わない）
+        """
+        if self.snapshot_path is None or not os.path.exists(self.snapshot_path):
+            return False
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return False
+        try:
+            mapped = MappedSnapshot(self.snapshot_path)
+        except (OSError, ValueError) as e:
+            print(f"Snapshot ignored ({self.snapshot_path}):", e)
+            return False
+        if not mapped.matches(self.path):
+            return False
+        lang_dict = mapped.top_level()
+        entries = lang_dict["entries"] = MappedEntries(mapped)
+        self._publish(lang_dict, entries, MappedLangIndex(mapped))
+        self._load_task = loop.create_task(self._load_in_background())
+        return True
+
+    async def _load_in_background(self):
+        mapped = self._snapshot
+        try:
+            lang_dict, entries, index = await asyncio.to_thread(self._load_full)
+        except Exception as e:
+            print("Background load failed:", e)
+            if self._snapshot is mapped:
+                self.reload()
+            return
+        # 待っている間に reload などで差し替えられていたら捨てる
+        if self._snapshot is mapped:
+            self._publish(lang_dict, entries, index)
+
+    def _load_full(self) -> tuple:
+        """JSON の読み込みから索引作りまで（スレッド上で呼ぶ。共有状態には触れない）"""
+        lang_dict = load_json(self.path, {"entries": {}})
+        entries = _prepare_entries(lang_dict)
+        return lang_dict, entries, LangIndex(entries)
+
+    def _snapshot_writer(self, stat: Optional[tuple] = None):
+        """
+        今の版のスナップショットを書く関数（イベントループ上で中身を取り出しておく）
+        stat: 今の版に対応する JSON の (サイズ, mtime_ns)。省略時は書く直前の JSON
+        （保存直後に呼ばれるとき）。JSON がその後書き換わっていたら書かない
+        """
+        entries = freeze_entries(self.entries)
+        top_level = copy.deepcopy({k: v for k, v in self.lang_dict.items() if k != "entries"})
+        path, source_path = self.snapshot_path, self.path
+
+        def write():
+            built = build_snapshot(language_rows(entries), top_level)
+            with self._snapshot_lock:
+                current = source_stat(source_path)
+                if stat is None or stat == current:
+                    write_snapshot(path, built, current)
+        return write
+
+    def _refresh_snapshot(self):
+        """JSON を読んだがスナップショットが古い・無いとき、次の起動のために書いておく"""
+        if self.snapshot_path is None or not os.path.exists(self.path):
+            return
+        if self._snapshot_task is not None or is_fresh(self.snapshot_path, self.path):
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        writer = self._snapshot_writer(source_stat(self.path))
+        self._snapshot_task = loop.create_task(self._write_snapshot(writer))
+
+    async def _write_snapshot(self, write):
+        try:
+            await asyncio.to_thread(write)
+        except Exception as e:
+            print(f"Snapshot save failed ({self.snapshot_path}):", e)
+        finally:
+            self._snapshot_task = None
+
+def _prepare_entries(lang_dict: dict):
+    """lang_dict["entries"] を保持する形（既定では CompactEntries）にする"""
+    entries = lang_dict.setdefault("entries", {})
+    if COMPACT_ENTRIES and not isinstance(entries, CompactEntries):
+        entries = lang_dict["entries"] = CompactEntries(entries)
+    return entries
+
+# =========================
+# Bot 共有インスタンス
+# =========================
+def get_store(bot) -> LangDictStore:
+    """Bot に1つだけ持たせた LangDictStore を返す（無ければ作る）"""
+    store = getattr(bot, "lang_store", None)
+    if store is None:
+        if LANGDICT_BACKEND == "sqlite":
+            from cogs.storage_sqlite import SqliteLangDictStore
+            store = SqliteLangDictStore()
+        else:
+            store = LangDictStore(snapshot_path=snapshot_path_for(LANGDICT_PATH) if LANGDICT_SNAPSHOT else None)
+        bot.lang_store = store
+    return store
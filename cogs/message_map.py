@@ -0,0 +1,148 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+DATA_DIR = "data"
+MESSAGE_MAP_PATH = f"{DATA_DIR}/message_map.sqlite3"
+MESSAGE_MAP_SIZE = 20000  # 覚えておく元メッセージの数（古いものから忘れる）
+
+# =========================
+# 送信済みメッセージの対応表
+# =========================
+class MessageMap:
+    """
+    元メッセージID → 送信した Webhook メッセージと訳の組み立て方
+    編集・削除をリンク先へ反映するために使う。記録の中身は
+      {"channel_id": 元チャンネル, "src_lang": 言語, "text": 訳した本文,
+       "parts": [[文, {lang: 訳} または None], ...],   # 訳したときの文の分け方
+       "translations": {lang: 送った訳},
+       "sent": {送信先チャンネル: [lang, webhook_url, メッセージID]}}
+    同じ作者の連投をまとめて1通で送ったときは、メンバーごとの記録に
+      "unit": [まとめた元メッセージID, ...], "content": {lang: 送った訳（メンバーの訳を改行でつないだもの）}
+    が加わる（"translations" はそのメンバーの分だけ）
+    メモリ上は件数上限つきの LRU で持ち、SQLite に永続化して再起動後の編集にも追従する
+    ディスクへの書き込みは TranslationCache と同じく溜めておき、flush でまとめて行う
+    """
+    def __init__(
+        self, path: str = MESSAGE_MAP_PATH, max_entries: int = MESSAGE_MAP_SIZE,
+        flush_interval: float = 10.0
+    ):
+        self.path = path
+        self.max_entries = max_entries
+        self.flush_interval = flush_interval
+
+        self._items: "OrderedDict[int, dict]" = OrderedDict()
+        self._pending_put: Dict[int, dict] = {}
+        self._pending_delete = set()
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    # =========================
+    # 起動・終了
+    # =========================
+    async def open(self):
+        await asyncio.to_thread(self._open_db)
+        self._task = asyncio.create_task(self._flush_loop())
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+        if self._db:
+            with self._db_lock:
+                self._db.close()
+            self._db = None
+
+    def _open_db(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        with self._db_lock:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS messages ("
+                " message_id INTEGER PRIMARY KEY, record TEXT NOT NULL,"
+                " updated REAL NOT NULL)"
+            )
+            # 上限を超えた古い記録はディスクからも消す
+            self._db.execute(
+                "DELETE FROM messages WHERE message_id NOT IN"
+                " (SELECT message_id FROM messages ORDER BY updated DESC LIMIT ?)",
+                (self.max_entries,)
+            )
+            self._db.commit()
+            rows = self._db.execute(
+                "SELECT message_id, record FROM messages ORDER BY updated"
+            ).fetchall()
+        for message_id, raw in rows:
+            self._items[message_id] = json.loads(raw)
+
+    # =========================
+    # 参照・登録
+    # =========================
+    def __len__(self) -> int:
+        return len(self._items)
+
+    def __contains__(self, message_id: int) -> bool:
+        return message_id in self._items
+
+    def get(self, message_id: int) -> Optional[dict]:
+        record = self._items.get(message_id)
+        if record is not None:
+            self._items.move_to_end(message_id)
+        return record
+
+    def put(self, message_id: int, record: dict):
+        self._items[message_id] = record
+        self._items.move_to_end(message_id)
+        self._pending_delete.discard(message_id)
+        self._pending_put[message_id] = record
+        while len(self._items) > self.max_entries:
+            oldest, _ = self._items.popitem(last=False)
+            self._forget(oldest)
+
+    def pop(self, message_id: int) -> Optional[dict]:
+        record = self._items.pop(message_id, None)
+        if record is not None:
+            self._forget(message_id)
+        return record
+
+    def _forget(self, message_id: int):
+        self._pending_put.pop(message_id, None)
+        self._pending_delete.add(message_id)
+
+    # =========================
+    # 永続化
+    # =========================
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def flush(self):
+        if self._db is None or not (self._pending_put or self._pending_delete):
+            return
+        # シリアライズはイベントループ上（記録を書き換え中に読まないため）
+        now = time.time()
+        puts = [
+            (message_id, json.dumps(record, ensure_ascii=False), now)
+            for message_id, record in self._pending_put.items()
+        ]
+        deletes = [(message_id,) for message_id in self._pending_delete]
+        self._pending_put, self._pending_delete = {}, set()
+        try:
+            await asyncio.to_thread(self._write, puts, deletes)
+        except Exception as e:
+            # 対応表の永続化失敗でもBotは止めない
+            print("Message map flush failed:", e)
+
+    def _write(self, puts: list, deletes: list):
+        with self._db_lock:
+            self._db.executemany("DELETE FROM messages WHERE message_id = ?", deletes)
+            self._db.executemany("INSERT OR REPLACE INTO messages VALUES (?, ?, ?)", puts)
+            self._db.commit()
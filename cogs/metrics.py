@@ -0,0 +1,163 @@
+import bisect
+import time
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# =========================
+# 設定
+# =========================
+# 秒単位のレイテンシ用バケット（上限値）
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05,
+    0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0
+)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+# =========================
+# 計測値
+# =========================
+class Counter:
+    def __init__(self):
+        self.value = 0.0
+
+    def inc(self, amount: float = 1.0):
+        self.value += amount
+
+class Gauge:
+    """今の値（件数・バイト数など。増減する）"""
+    def __init__(self):
+        self.value = 0.0
+
+    def set(self, value: float):
+        self.value = value
+
+class Histogram:
+    """固定バケットのヒストグラム（Prometheus の histogram と同じ累積形式で出力）"""
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # 最後は +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """q 分位点が入るバケットの上限（+Inf に入る場合は最後の上限）"""
+        if self.count == 0:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return self.buckets[-1]
+
+# =========================
+# レジストリ
+# =========================
+class MetricsRegistry:
+    """
+    カウンター・ゲージ・ヒストグラムの置き場所
+    名前とラベルの組ごとに1つの値を持ち、Prometheus のテキスト形式で書き出せる
+    """
+    def __init__(self):
+        # name → {"type", "doc", "children": {labels: Counter/Gauge/Histogram}}
+        self._families: Dict[str, dict] = {}
+
+    def _child(self, kind: str, name: str, doc: str, labels: dict, factory):
+        family = self._families.get(name)
+        if family is None:
+            family = {"type": kind, "doc": doc, "children": {}}
+            self._families[name] = family
+        elif doc and not family["doc"]:
+            family["doc"] = doc
+        key: LabelKey = tuple(sorted((k, str(v)) for k, v in labels.items()))
+        child = family["children"].get(key)
+        if child is None:
+            child = factory()
+            family["children"][key] = child
+        return child
+
+    def counter(self, name: str, doc: str = "", **labels) -> Counter:
+        return self._child("counter", name, doc, labels, Counter)
+
+    def gauge(self, name: str, doc: str = "", **labels) -> Gauge:
+        return self._child("gauge", name, doc, labels, Gauge)
+
+    def histogram(self, name: str, doc: str = "", buckets=LATENCY_BUCKETS, **labels) -> Histogram:
+        return self._child("histogram", name, doc, labels, lambda: Histogram(buckets))
+
+    @contextmanager
+    def timer(self, name: str, doc: str = "", buckets=LATENCY_BUCKETS, **labels) -> Iterator[None]:
+        """with ブロックの経過時間（秒）をヒストグラムに記録（await を挟んでもよい）"""
+        histogram = self.histogram(name, doc, buckets, **labels)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            histogram.observe(time.perf_counter() - started)
+
+    def get(self, name: str, **labels):
+        """登録済みの値を返す（無ければ None。作らないので表示側から使う）"""
+        family = self._families.get(name)
+        if family is None:
+            return None
+        return family["children"].get(tuple(sorted((k, str(v)) for k, v in labels.items())))
+
+    def children(self, name: str) -> List[tuple]:
+        """[(labels dict, Counter/Gauge/Histogram), ...]"""
+        family = self._families.get(name)
+        if family is None:
+            return []
+        return [(dict(key), child) for key, child in family["children"].items()]
+
+    # =========================
+    # 出力
+    # =========================
+    def render_prometheus(self) -> str:
+        """Prometheus テキスト形式（version 0.0.4）"""
+        lines = []
+        for name, family in sorted(self._families.items()):
+            if family["doc"]:
+                lines.append(f"# HELP {name} {family['doc']}")
+            lines.append(f"# TYPE {name} {family['type']}")
+            for key, child in sorted(family["children"].items()):
+                if family["type"] in ("counter", "gauge"):
+                    lines.append(f"{name}{_format_labels(key)} {_format_value(child.value)}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(child.buckets + (float("inf"),), child.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{name}_bucket{_format_labels(key + (('le', le),))} {cumulative}")
+                lines.append(f"{name}_sum{_format_labels(key)} {_format_value(child.sum)}")
+                lines.append(f"{name}_count{_format_labels(key)} {child.count}")
+        return "\n".join(lines) + "\n"
+
+def _format_labels(key: LabelKey) -> str:
+    if not key:
+        return ""
+    escaped = (
+        (k, v.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"'))
+        for k, v in key
+    )
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+def _format_value(value: float) -> str:
+    return repr(int(value)) if float(value).is_integer() else repr(value)
+
+# =========================
+# Bot 共有インスタンス
+# =========================
+def get_metrics(bot) -> MetricsRegistry:
+    """Bot に1つだけ持たせた MetricsRegistry を返す（無ければ作る）"""
+    metrics = getattr(bot, "metrics", None)
+    if metrics is None:
+        metrics = MetricsRegistry()
+        bot.metrics = metrics
+    return metrics
@@ -1,26 +1,11 @@
-import json
-import os
 import re
-from difflib import get_close_matches
-from typing import Dict, Optional
+from typing import Dict, Iterable, Optional
 
-DATA_DIR = "data"
-LANGDICT_PATH = f"{DATA_DIR}/lang_dict.json"
-SUPPORTED_LANGS = ["ja", "en", "ko", "zh"]
-
-# =========================
-# ユーティリティ
-# =========================
-def load_json(path, default=None):
-    if not os.path.exists(path):
-        return default if default is not None else {}
-    with open(path, "r", encoding="utf-8") as f:
-        return json.load(f)
+from cogs.lang_index import normalize_text
+from cogs.lang_store import LangDictStore
 
-def save_json(path, data):
-    os.makedirs(os.path.dirname(path), exist_ok=True)
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
+SUPPORTED_LANGS = ["ja", "en", "ko", "zh"]
+FUZZY_CUTOFF = 0.8
 
 # =========================
 # モデル本体
@@ -29,37 +14,52 @@ class JsonAIModel:
     """
     LangDictJsonを用いた翻訳モデル
     """
-    def __init__(self):
-        self.lang_dict = load_json(LANGDICT_PATH, {"entries": {}})
-        self.entries = self.lang_dict.get("entries", {})
+    def __init__(self, store: Optional[LangDictStore] = None, fuzzy_mode: str = "first"):
+        """
+        store: 共有の辞書ストア（省略時は単独で読み込む）
+        fuzzy_mode: "first"（登録順で最初の一致）/ "best"（最も近い一致）
+        """
+        self.store = store or LangDictStore()
+        self.fuzzy_mode = fuzzy_mode
+
+    @property
+    def lang_dict(self) -> dict:
+        return self.store.lang_dict
+
+    @property
+    def entries(self) -> Dict[str, dict]:
+        return self.store.entries
 
     def _normalize_text(self, text: str) -> str:
         """テキスト正規化（半角化、空白削除など）"""
-        return re.sub(r"\s+", "", text.strip().lower())
+        return normalize_text(text)
+
+    def _find_translations(
+        self, word: str, src_lang: str, tgt_langs: Iterable[str]
+    ) -> Dict[str, str]:
+        """単語・フレーズの近似検索翻訳（全ターゲット言語を一度に解決）"""
+        tgt_langs = list(tgt_langs)
+        snap = self.store.snapshot()
+
+        # 完全一致（索引）
+        result = snap.index.resolve(
+            snap.entries, snap.index.lookup(word, src_lang), tgt_langs
+        )
+        pending = [lang for lang in tgt_langs if lang not in result]
+        if not pending:
+            return result
+
+        # 類似語検索（言語別 BK-tree）
+        fuzzy_ids = snap.index.fuzzy_lookup(
+            word, src_lang, cutoff=FUZZY_CUTOFF, mode=self.fuzzy_mode
+        )
+        result.update(snap.index.resolve(snap.entries, fuzzy_ids, pending))
+
+        return result
 
     def _find_translation(self, word: str, src_lang: str, tgt_lang: str) -> Optional[str]:
         """単語・フレーズの近似検索翻訳"""
-        norm_word = self._normalize_text(word)
-
-        candidates = []
-        for eid, entry in self.entries.items():
-            langs = entry.get("languages", {})
-            if src_lang not in langs or tgt_lang not in langs:
-                continue
-
-            src_texts = [self._normalize_text(t) for t in langs[src_lang]]
-            if norm_word in src_texts:
-                # 完全一致
-                return langs[tgt_lang][0]
-
-            # 類似語検索
-            close = get_close_matches(norm_word, src_texts, n=1, cutoff=0.8)
-            if close:
-                candidates.append(langs[tgt_lang][0])
-
-        if candidates:
-            return candidates[0]
-        return None
+        return self._find_translations(word, src_lang, [tgt_lang]).get(tgt_lang)
 
     def translate_text(
         self, text: str, src_lang: str, tgt_langs=None
@@ -78,8 +78,9 @@ class JsonAIModel:
         for sentence in sentences:
             if not sentence:
                 continue
+            found = self._find_translations(sentence, src_lang, tgt_langs)
             for lang in tgt_langs:
-                translated = self._find_translation(sentence, src_lang, lang)
+                translated = found.get(lang)
                 # もし見つからなければ文をそのまま残す
                 if translated is None:
                     translated = sentence
@@ -94,17 +95,15 @@ class JsonAIModel:
         """
         新しい単語・フレーズを追加
         """
-        self.entries[entry_id] = {"languages": languages}
-        self.lang_dict["entries"] = self.entries
-        save_json(LANGDICT_PATH, self.lang_dict)
+        self.store.add_entry(entry_id, languages)
+        self.store.save()
 
     def update_entry_confidence(self, entry_id: str, confidence: float):
         """
         confidence更新用
         """
-        if entry_id in self.entries:
-            self.entries[entry_id]["confidence"] = confidence
-            save_json(LANGDICT_PATH, self.lang_dict)
+        if self.store.update_entry_confidence(entry_id, confidence):
+            self.store.save()
 
 # =========================
 # 簡単なテスト
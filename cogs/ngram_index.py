@@ -0,0 +1,121 @@
+import zlib
+from difflib import SequenceMatcher
+from typing import Dict, List
+
+try:
+    import numpy as np
+except ImportError:  # numpy は任意（無ければ BK-tree を使う）
+    np = None
+
+# =========================
+# 設定
+# =========================
+NGRAM_DIM = 256           # ハッシュ先の次元数（行あたり NGRAM_DIM * 4 バイト）
+NGRAM_SIZES = (1, 2, 3)   # 文字 n-gram の長さ
+NGRAM_TOP_K = 32          # 1文あたり ratio で確かめる候補数
+INITIAL_ROWS = 1024
+
+def numpy_available() -> bool:
+    return np is not None
+
+def char_ngrams(text: str) -> List[str]:
+    """文字 n-gram（2文字以上は両端に目印を付けて先頭・末尾も区別）"""
+    grams = list(text)
+    padded = f"\x02{text}\x03"
+    for n in NGRAM_SIZES:
+        if n == 1:
+            continue
+        grams.extend(padded[i:i + n] for i in range(len(padded) - n + 1))
+    return grams
+
+# =========================
+# n-gram 行列
+# =========================
+class NgramIndex:
+    """
+    1言語分の類似検索用行列（FuzzyIndex と同じ add / search を持つ）
+    各フレーズを文字 n-gram のハッシュ頻度ベクトル（L2正規化した float32）として
+    1行に持ち、メッセージ中の全文をまとめて1回の行列積でコサイン類似度を出す。
+    上位 top_k 件だけを SequenceMatcher の ratio で確かめる（近似：上位に入らない
+    一致は拾わない）
+    """
+    def __init__(self, dim: int = NGRAM_DIM, top_k: int = NGRAM_TOP_K):
+        if np is None:
+            raise RuntimeError("NgramIndex requires numpy")
+        self.dim = dim
+        self.top_k = top_k
+        self.size = 0
+        self._texts: List[str] = []
+        self._rows: Dict[str, int] = {}
+        self._buckets: Dict[str, int] = {}  # 登録したフレーズに出てくる n-gram だけ（検索語では増やさない）
+        self._matrix = np.zeros((INITIAL_ROWS, dim), dtype=np.float32)
+        self._lengths = np.zeros(INITIAL_ROWS, dtype=np.int32)
+
+    def _bucket(self, gram: str, remember: bool = False) -> int:
+        bucket = self._buckets.get(gram)
+        if bucket is None:
+            bucket = zlib.crc32(gram.encode("utf-8")) % self.dim
+            if remember:
+                self._buckets[gram] = bucket
+        return bucket
+
+    def encode(self, text: str, remember: bool = False):
+        """
+        remember: n-gram のハッシュを覚えておく（登録時だけ。検索語の n-gram まで覚えると
+        ユーザーの入力に比例して際限なく増える）
+        """
+        counts = np.bincount(
+            [self._bucket(g, remember) for g in char_ngrams(text)], minlength=self.dim
+        ).astype(np.float32)
+        norm = np.linalg.norm(counts)
+        return counts / norm if norm else counts
+
+    def add(self, text: str):
+        """行を追加（容量は倍々で伸ばすので追加は償却 O(dim)）"""
+        if not text or text in self._rows:
+            return
+        if self.size == len(self._matrix):
+            capacity = len(self._matrix) * 2
+            matrix = np.zeros((capacity, self.dim), dtype=np.float32)
+            matrix[:self.size] = self._matrix[:self.size]
+            lengths = np.zeros(capacity, dtype=np.int32)
+            lengths[:self.size] = self._lengths[:self.size]
+            self._matrix, self._lengths = matrix, lengths
+        self._matrix[self.size] = self.encode(text, remember=True)
+        self._lengths[self.size] = len(text)
+        self._rows[text] = self.size
+        self._texts.append(text)
+        self.size += 1
+
+    def search(self, query: str, cutoff: float, strict: bool = False) -> List[tuple]:
+        return self.search_many([query], cutoff, strict)[0]
+
+    def search_many(self, queries: List[str], cutoff: float, strict: bool = False) -> List[List[tuple]]:
+        """各クエリについて ratio が cutoff 以上（strict なら超過）の (text, ratio) を返す"""
+        results: List[List[tuple]] = [[] for _ in queries]
+        live = [i for i, q in enumerate(queries) if q]
+        if self.size == 0 or not live or cutoff <= 0:
+            return results
+
+        matrix = self._matrix[:self.size]
+        lengths = self._lengths[:self.size]
+        scores = np.stack([self.encode(queries[i]) for i in live]) @ matrix.T
+        k = min(self.top_k, self.size)
+
+        for row, i in zip(scores, live):
+            query = queries[i]
+            a = len(query)
+            # ratio >= cutoff となり得る長さの候補だけを残す
+            too_far = (lengths < a * cutoff / (2.0 - cutoff) - 1e-9) | (lengths > a * (2.0 - cutoff) / cutoff + 1e-9)
+            row = np.where(too_far, -1.0, row)
+            candidates = np.argpartition(-row, k - 1)[:k]
+            for r in candidates[np.argsort(-row[candidates])]:
+                if row[r] <= 0:
+                    break
+                text = self._texts[r]
+                matcher = SequenceMatcher(None, query, text)
+                if matcher.real_quick_ratio() >= cutoff and matcher.quick_ratio() >= cutoff:
+                    ratio = matcher.ratio()
+                    if ratio > cutoff or (ratio == cutoff and not strict):
+                        results[i].append((text, ratio))
+        return results
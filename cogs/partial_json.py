@@ -0,0 +1,125 @@
+import json
+import re
+from typing import List, Tuple
+
+_STRING_STOP = re.compile(r'["\\]')
+_WHITESPACE = " \t\r\n"
+
+# =========================
+# 少しずつ届く JSON
+# =========================
+class PartialJsonObject:
+    """
+    分割されて届く JSON オブジェクト（{"ja": "...", "en": "...", ...}）を読み進め、
+    最上位の文字列値が閉じた時点で (キー, 値) を取り出す
+      - オブジェクトの前の文字（```json など）は読み飛ばす
+      - 文字列以外の値（数値・入れ子）は読み飛ばす
+    """
+    def __init__(self):
+        self.state = "start"
+        self.done = False
+        self._key = None
+        self._raw: List[str] = []   # 読みかけの文字列（エスケープはそのまま）
+        self._escape = False
+        self._depth = 0             # 読み飛ばし中の入れ子の深さ
+        self._skip_string = False   # 読み飛ばし中の値の中の文字列にいるか
+
+    def feed(self, chunk: str) -> List[Tuple[str, str]]:
+        """chunk を読み、閉じた (キー, 文字列値) を返す"""
+        found = []
+        i, n = 0, len(chunk)
+        while i < n and not self.done:
+            state = self.state
+            if state in ("key", "string"):
+                i = self._read_string(chunk, i)
+                if self.state == state:
+                    continue  # chunk の終わりまで文字列が続いた
+                text = _decode(self._raw)
+                if state == "key":
+                    self._key = text
+                else:
+                    found.append((self._key, text))
+                continue
+            ch = chunk[i]
+            i += 1
+            if state == "start":
+                if ch == "{":
+                    self.state = "key_or_end"
+            elif state == "key_or_end":
+                if ch == '"':
+                    self._raw = []
+                    self.state = "key"
+                elif ch == "}":
+                    self.done = True
+            elif state == "colon":
+                if ch == ":":
+                    self.state = "value"
+            elif state == "value":
+                if ch in _WHITESPACE:
+                    continue
+                if ch == '"':
+                    self._raw = []
+                    self.state = "string"
+                else:
+                    self.state = "skip"
+                    self._depth = 0
+                    self._skip_string = False
+                    self._skip(ch)
+            elif state == "skip":
+                self._skip(ch)
+            elif state == "after_value":
+                if ch == ",":
+                    self.state = "key_or_end"
+                elif ch == "}":
+                    self.done = True
+        return found
+
+    def _read_string(self, chunk: str, i: int) -> int:
+        """閉じる " まで読む（戻り値は次に読む位置）"""
+        n = len(chunk)
+        while i < n:
+            if self._escape:
+                self._raw.append(chunk[i])
+                self._escape = False
+                i += 1
+                continue
+            m = _STRING_STOP.search(chunk, i)
+            if m is None:
+                self._raw.append(chunk[i:])
+                return n
+            self._raw.append(chunk[i:m.start()])
+            i = m.end()
+            if m.group() == "\\":
+                self._raw.append("\\")
+                self._escape = True
+            else:
+                self.state = "colon" if self.state == "key" else "after_value"
+                return i
+        return i
+
+    def _skip(self, ch: str):
+        if self._skip_string:
+            if self._escape:
+                self._escape = False
+            elif ch == "\\":
+                self._escape = True
+            elif ch == '"':
+                self._skip_string = False
+        elif ch == '"':
+            self._skip_string = True
+        elif ch in "[{":
+            self._depth += 1
+        elif ch in "]}":
+            if self._depth == 0:
+                self.done = True  # 最上位のオブジェクトが閉じた
+            else:
+                self._depth -= 1
+        elif ch == "," and self._depth == 0:
+            self.state = "key_or_end"
+
+def _decode(raw: List[str]) -> str:
+    text = "".join(raw)
+    try:
+        return json.loads(f'"{text}"')
+    except ValueError:
+        return text
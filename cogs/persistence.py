@@ -0,0 +1,155 @@
+import asyncio
+import json
+import os
+import tempfile
+import threading
+from typing import Any, Callable, Optional
+
+# =========================
+# 原子的な書き込み
+# =========================
+def dump_json(data) -> bytes:
+    """コンパクトにシリアライズ（インデントなし）"""
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def atomic_write(path: str, payload: bytes):
+    """
+    一時ファイルに書いて fsync してからリネームで置き換える
+    途中で落ちても元のファイルか新しいファイルのどちらかが残る
+    一時ファイルは書き込みごとに別の名前（同時に書いても互いの一時ファイルを壊さない）
+    """
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=f".{os.path.basename(path)}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        # mkstemp は 0600 で作るので、置き換える前のファイルの権限に合わせる
+        try:
+            os.chmod(tmp_path, os.stat(path).st_mode & 0o777)
+        except FileNotFoundError:
+            os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return  # ディレクトリの fsync ができない環境（Windows など）
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+def atomic_write_json(path: str, data):
+    atomic_write(path, dump_json(data))
+
+# =========================
+# 遅延保存
+# =========================
+class DebouncedSaver:
+    """
+    変更を dirty として記録し、delay 秒ごとにまとめて保存する
+    get_data はイベントループ上で呼ばれ、保存する値の写し（その後書き換えられないもの）を返す。
+    関数を返したときは、その関数がスレッド上で呼ばれて保存する値を作る（大きなデータの変換もループの外で）。
+    シリアライズ・ファイル書き込み・fsync はスレッド上で行う
+    保存は flush・予約・ループ外からの保存を含めて1つずつ行い、古い写しが新しい写しの後に書かれることはない
+    companion: 保存のたびに続けて書く付随ファイル。イベントループ上で呼ばれて
+    書き込み関数を返し、その関数は本体を書き終えた後にスレッド上で呼ばれる
+    """
+    def __init__(
+        self, path: str, get_data: Callable[[], Any], delay: float = 5.0,
+        companion: Optional[Callable[[], Callable[[], None]]] = None
+    ):
+        self.path = path
+        self.get_data = get_data
+        self.delay = delay
+        self.companion = companion
+        self.saves = 0
+        self._dirty = False
+        self._handle: Optional[asyncio.TimerHandle] = None
+        self._save_lock = asyncio.Lock()        # ループ上の保存を1つずつ（写しを取る順 = 書く順）
+        self._snapshot_lock = threading.Lock()  # 写しを取る順に番号を振る（ループ外からの保存と共有）
+        self._write_lock = threading.Lock()     # ループ外からの保存とも書き込みが重ならないように
+        self._generation = 0                    # 写しを取った順の番号
+        self._written = 0                       # 書き終えた写しの番号
+        self._task: Optional[asyncio.Task] = None
+
+    def mark_dirty(self):
+        """保存を予約（イベントループ外から呼ばれた場合はその場で保存）"""
+        self._dirty = True
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._save_sync()
+            return
+        if self._handle is None and self._task is None:
+            self._handle = loop.call_later(self.delay, self._start_save)
+
+    async def flush(self):
+        """予約を待たずに保存（終了時など）"""
+        if self._task is not None:
+            await self._task
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+        if self._dirty:
+            await self._save()
+        if self._task is not None:
+            await self._task  # flush の保存中に予約された保存
+
+    def _start_save(self):
+        self._handle = None
+        self._task = asyncio.create_task(self._save())
+        self._task.add_done_callback(self._on_saved)
+
+    def _on_saved(self, _):
+        self._task = None
+        # 保存中にまた変更が入っていれば次を予約
+        if self._dirty and self._handle is None:
+            self._handle = asyncio.get_running_loop().call_later(self.delay, self._start_save)
+
+    async def _save(self):
+        async with self._save_lock:
+            generation, data, companion = self._take_snapshot()
+            try:
+                await asyncio.to_thread(self._write, generation, data, companion)
+            except Exception as e:
+                # 保存失敗でもBotは止めない（次の変更で再試行）
+                self._dirty = True
+                print(f"Save failed ({self.path}):", e)
+
+    def _save_sync(self):
+        self._write(*self._take_snapshot())
+
+    def _take_snapshot(self) -> tuple:
+        """(番号, 保存する値の写し, companion の書き込み関数)"""
+        with self._snapshot_lock:
+            self._dirty = False
+            self._generation += 1
+            data = self.get_data()
+            companion = self.companion() if self.companion else None
+            return self._generation, data, companion
+
+    def _write(self, generation: int, data, companion: Optional[Callable[[], None]]):
+        with self._write_lock:
+            if generation < self._written:
+                return  # ループ外の保存が先に新しい写しを書いた
+            if callable(data):
+                data = data()
+            atomic_write(self.path, dump_json(data))
+            self._written = generation
+            self.saves += 1
+            if companion is None:
+                return
+            try:
+                companion()
+            except Exception as e:
+                # 付随ファイルは作り直せるので、本体の保存は成功扱いにする
+                print(f"Companion save failed ({self.path}):", e)
@@ -0,0 +1,234 @@
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional
+
+from cogs.metrics import MetricsRegistry
+
+# =========================
+# 設定
+# =========================
+PIPELINE_WORKERS = int(os.getenv("PIPELINE_WORKERS", "4"))        # 同時に処理するワークユニット数
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", "50"))  # チャンネルごとの待ち行列の上限
+# 待ち行列があふれたとき: "drop_oldest"（古いものを捨てる）/ "dictionary_only"（辞書だけで訳して早く流す）
+PIPELINE_SHED_POLICY = os.getenv("PIPELINE_SHED_POLICY", "drop_oldest")
+# 同じ作者の連投を1つにまとめる間隔（秒）。既定の 0 は無効（まとめると複数のメッセージが
+# 改行でつながった1通になり見た目が変わるので、使うときだけ設定する。例: 3）。
+# まとめるのはまだ待っているものだけなので、空いているときに待ち時間が増えることはない
+PIPELINE_COALESCE_WINDOW = float(os.getenv("PIPELINE_COALESCE_WINDOW", "0"))
+COALESCE_MAX_MESSAGES = 5
+COALESCE_MAX_CHARS = 1500  # 訳が Discord の 2000 文字に収まるように
+
+SHED_POLICIES = ("drop_oldest", "dictionary_only")
+# dictionary_only でもこれを超えたら古いものを捨てる（メモリの上限）
+DICTIONARY_ONLY_HARD_LIMIT = 2
+DEPTH_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+QUEUE_DOC = "Messages submitted to the pipeline by result"
+SHED_DOC = "Messages shed from overflowing channel queues by action"
+
+# =========================
+# ワークユニット
+# =========================
+class WorkUnit:
+    """
+    1回の翻訳・送信で扱うメッセージ（同じ作者の連投はまとめられて複数になる）
+    texts は処理を始める前なら編集で書き換わる。done は処理が終わると True、捨てられると False
+    """
+    def __init__(self, channel_key: str, author_key, message, text: str, now: float):
+        self.channel_key = channel_key
+        self.author_key = author_key
+        self.messages = [message]
+        self.texts = [text]
+        self.created = now
+        self.updated = now
+        self.dictionary_only = False
+        self.done: asyncio.Future = asyncio.get_running_loop().create_future()
+
+    def length(self) -> int:
+        return sum(len(text) for text in self.texts)
+
+    def finish(self, result: bool):
+        if not self.done.done():
+            self.done.set_result(result)
+
+class _Channel:
+    def __init__(self):
+        self.units: Deque[WorkUnit] = deque()
+        self.scheduled = False  # 実行待ちの列に入っている、またはワーカーが処理中
+        self.degraded = False   # dictionary_only で、待ち行列が空になるまで辞書だけで訳す
+
+# =========================
+# スケジューラ
+# =========================
+class PipelineScheduler:
+    """
+    チャンネルごとの上限つき待ち行列と固定数のワーカー
+      - 同じチャンネルのユニットは1つずつ順に処理する（訳が届く順を守る）
+      - ワーカーはチャンネルを順番に回る（1つのチャンネルの連投が他を待たせない）
+      - 待っているユニットの最後が同じ作者で coalesce_window 秒以内なら、新しいメッセージをそこへまとめる
+      - あふれたら shed_policy に従って落とす・辞書だけにする
+    待ち行列の長さ（投入時）と待ち時間（処理開始時）はヒストグラムに記録する
+    """
+    def __init__(
+        self, handler: Callable[[WorkUnit], Awaitable[None]], workers: int = PIPELINE_WORKERS,
+        max_queue: int = PIPELINE_QUEUE_SIZE, shed_policy: str = PIPELINE_SHED_POLICY,
+        coalesce_window: float = PIPELINE_COALESCE_WINDOW, metrics: Optional[MetricsRegistry] = None,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        if shed_policy not in SHED_POLICIES:
+            raise ValueError(f"unknown shed policy: {shed_policy}")
+        self.handler = handler
+        self.workers = workers
+        self.max_queue = max_queue
+        self.shed_policy = shed_policy
+        self.coalesce_window = coalesce_window
+        self.metrics = metrics or MetricsRegistry()
+        self.clock = clock
+        self.busy = 0
+        self._channels: Dict[str, _Channel] = {}
+        self._queued: Dict[int, WorkUnit] = {}  # メッセージID → 待っているユニット
+        self._ready: "asyncio.Queue[str]" = asyncio.Queue()
+        self._tasks: List[asyncio.Task] = []
+
+    # =========================
+    # 起動・終了
+    # =========================
+    def start(self):
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def close(self):
+        """ワーカーを止め、待っていたユニットは捨てる"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        for channel in self._channels.values():
+            for unit in channel.units:
+                unit.finish(False)
+        self._channels.clear()
+        self._queued.clear()
+
+    # =========================
+    # 投入
+    # =========================
+    def depth(self) -> int:
+        return sum(len(channel.units) for channel in self._channels.values())
+
+    def submit(self, channel_key: str, author_key, message, text: str) -> WorkUnit:
+        """message を待ち行列に入れ、それを含むユニットを返す"""
+        now = self.clock()
+        channel = self._channels.get(channel_key)
+        if channel is None:
+            channel = self._channels[channel_key] = _Channel()
+
+        tail = channel.units[-1] if channel.units else None
+        if tail is not None and self._can_coalesce(tail, author_key, text, now):
+            tail.messages.append(message)
+            tail.texts.append(text)
+            tail.updated = now
+            self._queued[message.id] = tail
+            self.metrics.counter("pipeline_messages_total", QUEUE_DOC, result="coalesced").inc()
+            return tail
+
+        limit = self.max_queue
+        if self.shed_policy == "dictionary_only":
+            if len(channel.units) >= limit:
+                channel.degraded = True
+            limit *= DICTIONARY_ONLY_HARD_LIMIT
+        while len(channel.units) >= limit:
+            self._drop(channel.units.popleft())
+
+        unit = WorkUnit(channel_key, author_key, message, text, now)
+        channel.units.append(unit)
+        self._queued[message.id] = unit
+        self.metrics.counter("pipeline_messages_total", QUEUE_DOC, result="queued").inc()
+        self.metrics.histogram(
+            "pipeline_queue_depth", "Channel queue depth seen by each new work unit", DEPTH_BUCKETS
+        ).observe(len(channel.units))
+        if not channel.scheduled:
+            channel.scheduled = True
+            self._ready.put_nowait(channel_key)
+        return unit
+
+    def _can_coalesce(self, tail: WorkUnit, author_key, text: str, now: float) -> bool:
+        return (
+            self.coalesce_window > 0
+            and tail.author_key == author_key
+            and now - tail.updated <= self.coalesce_window
+            and len(tail.messages) < COALESCE_MAX_MESSAGES
+            and tail.length() + len(text) <= COALESCE_MAX_CHARS
+        )
+
+    def _drop(self, unit: WorkUnit):
+        for message in unit.messages:
+            self._queued.pop(message.id, None)
+        self.metrics.counter("pipeline_shed_total", SHED_DOC, action="dropped").inc(len(unit.messages))
+        unit.finish(False)
+
+    # =========================
+    # 処理前の編集・削除
+    # =========================
+    def update(self, message_id: int, text: str) -> bool:
+        """まだ待っているメッセージなら本文を差し替える（処理を始めていれば False）"""
+        unit = self._queued.get(message_id)
+        if unit is None:
+            return False
+        for i, message in enumerate(unit.messages):
+            if message.id == message_id:
+                unit.texts[i] = text
+        return True
+
+    def discard(self, message_id: int) -> bool:
+        """まだ待っているメッセージなら取り除く（処理を始めていれば False）"""
+        unit = self._queued.pop(message_id, None)
+        if unit is None:
+            return False
+        keep = [i for i, message in enumerate(unit.messages) if message.id != message_id]
+        unit.messages = [unit.messages[i] for i in keep]
+        unit.texts = [unit.texts[i] for i in keep]
+        if not unit.messages:
+            channel = self._channels.get(unit.channel_key)
+            if channel is not None and unit in channel.units:
+                channel.units.remove(unit)
+            unit.finish(False)
+        return True
+
+    # =========================
+    # ワーカー
+    # =========================
+    async def _worker(self):
+        while True:
+            channel_key = await self._ready.get()
+            channel = self._channels[channel_key]
+            if channel.units:
+                await self._run(channel.units.popleft(), channel)
+            if channel.units:
+                # 後ろに並び直して他のチャンネルに順番を回す
+                self._ready.put_nowait(channel_key)
+            else:
+                channel.scheduled = False
+                channel.degraded = False
+                del self._channels[channel_key]
+
+    async def _run(self, unit: WorkUnit, channel: _Channel):
+        for message in unit.messages:
+            self._queued.pop(message.id, None)
+        if channel.degraded:
+            unit.dictionary_only = True
+            self.metrics.counter("pipeline_shed_total", SHED_DOC, action="dictionary_only").inc(len(unit.messages))
+        self.metrics.histogram(
+            "pipeline_wait_seconds", "Time work units spent queued before a worker picked them up"
+        ).observe(self.clock() - unit.created)
+        self.busy += 1
+        try:
+            await self.handler(unit)
+            unit.finish(True)
+        except Exception as e:
+            # 1件の失敗でワーカーを止めない
+            print("Pipeline handler failed:", repr(e))
+            unit.finish(False)
+        finally:
+            self.busy -= 1
+            unit.finish(False)  # キャンセルされたとき
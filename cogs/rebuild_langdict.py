@@ -0,0 +1,249 @@
+import argparse
+import heapq
+import multiprocessing
+import os
+import time
+import zlib
+from array import array
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from cogs.lang_store import LANGDICT_PATH, load_json
+from cogs.persistence import atomic_write_json
+from cogs.trainer import LangDictTrainer
+from cogs.translate_log import TRANSLATE_LOG_PATH, complete_size, iter_log_records
+
+# =========================
+# 設定
+# =========================
+SEED_LANGDICT_PATH = "data/dictionaries/translate.json"  # train_json と同じ出発点
+REBUILT_LANGDICT_PATH = "data/lang_dict.rebuilt.json"   # 稼働中の辞書は上書きしない
+SHARD_LANGS = ("ja", "en", "ko", "zh")  # この順に担当を割り振る（他の言語はハッシュで）
+CONTEXT_WINDOW = 20                      # train_json の文脈履歴と同じ
+
+LogSource = Tuple[str, Optional[int]]  # (パス, 読む上限のバイト位置)
+
+# =========================
+# ログの列挙
+# =========================
+def list_log_files(paths: List[str]) -> List[str]:
+    """
+    ファイル・ディレクトリを受け取り、ログファイルを古い順に並べる
+    ディレクトリ内は名前に ".jsonl" を含むもの（日次ローテーションの
+    translate_logs.jsonl-20240101.gz など）を名前順に読む
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(
+                os.path.join(path, name) for name in os.listdir(path)
+                if ".jsonl" in name and os.path.isfile(os.path.join(path, name))
+            ))
+        else:
+            files.append(path)
+    return files
+
+def iter_sources(sources: List[LogSource]) -> Iterator[dict]:
+    for path, end in sources:
+        yield from iter_log_records(path, end)
+
+def shard_of(lang: str, shards: int) -> int:
+    if lang in SHARD_LANGS:
+        return SHARD_LANGS.index(lang) % shards
+    return zlib.crc32(lang.encode("utf-8")) % shards
+
+# =========================
+# シャード（別プロセス側）
+# =========================
+def train_shard(
+    shard: int, shards: int, sources: List[LogSource], seed_path: str,
+    context_window: int = CONTEXT_WINDOW
+) -> dict:
+    """
+    1シャード分の学習（全レコードを読み、文脈履歴はどのシャードも同じものを持つ）
+      - 担当言語の単語: 触れた順のイベント（レコード番号, 言語の位置）と新規エントリ
+      - meaning_distance: 担当言語の新規エントリと、番号 % shards が自分のシードエントリ
+    confidence / probability / ID は全言語の順序に依存するのでマージ側でイベントを再生する
+    """
+    seed = load_json(seed_path, {"entries": {}}).get("entries", {})
+    owned: Dict[str, bool] = {}
+
+    def is_mine(lang: str) -> bool:
+        mine = owned.get(lang)
+        if mine is None:
+            mine = owned[lang] = shard_of(lang, shards) == shard
+        return mine
+
+    # (lang, text) → シード内の番号（全言語）／シャードの新規エントリ（-1 - 作成順）
+    seed_index: Dict[tuple, int] = {}
+    seed_initial: Dict[int, dict] = {}
+    for i, entry in enumerate(seed.values()):
+        for lang, texts in entry.get("languages", {}).items():
+            for text in texts:
+                seed_index.setdefault((lang, text), i)
+        if i % shards == shard:
+            seed_initial[i] = entry.get("meaning_distance") or {}
+    del seed
+    new_index: Dict[tuple, int] = {}
+
+    # 文脈履歴と文脈距離の規則は学習器のものをそのまま使う
+    trainer = LangDictTrainer({"entries": {}}, context_window)
+    new_texts: List[tuple] = []          # 新規エントリの (lang, text)
+    new_distances: List[dict] = []       # 新規エントリの meaning_distance
+    seed_distances: Dict[int, dict] = {}  # 担当シードエントリの meaning_distance
+    langs: List[str] = []
+    lang_codes: Dict[str, int] = {}
+    ev_rec, ev_slot, ev_ref, ev_lang, ev_ts = array("q"), array("H"), array("q"), array("B"), []
+
+    records = 0
+    for rec, log in enumerate(iter_sources(sources)):
+        records += 1
+        ts = log.get("timestamp")
+        word = log.get("word", {})
+        for slot, (lang, text) in enumerate(word.items()):
+            if not text:
+                continue
+            distances = None
+            ref = seed_index.get((lang, text))
+            if ref is not None:
+                if ref % shards == shard:
+                    distances = seed_distances.get(ref)
+                    if distances is None:
+                        distances = seed_distances[ref] = dict(seed_initial[ref])
+            elif is_mine(lang):
+                ref = new_index.get((lang, text))
+                if ref is None:
+                    ref = new_index[(lang, text)] = -1 - len(new_texts)
+                    new_texts.append((lang, text))
+                    new_distances.append({})
+                distances = new_distances[-1 - ref]
+
+            if is_mine(lang):
+                code = lang_codes.get(lang)
+                if code is None:
+                    code = lang_codes[lang] = len(langs)
+                    langs.append(lang)
+                ev_rec.append(rec)
+                ev_slot.append(slot)
+                ev_ref.append(ref)
+                ev_lang.append(code)
+                ev_ts.append(ts)
+            if distances is not None:
+                trainer.add_context_distances(distances, lang, ts)
+        trainer.context.append((ts, word))
+
+    return {
+        "records": records,
+        "langs": langs,
+        "events": (ev_rec, ev_slot, ev_ref, ev_lang, ev_ts),
+        "new_texts": new_texts,
+        "new_distances": new_distances,
+        "seed_distances": seed_distances,
+    }
+
+# =========================
+# マージ
+# =========================
+def merge_shards(lang_dict: dict, results: List[dict], context_window: int = CONTEXT_WINDOW) -> dict:
+    """
+    シャードの結果を1つの辞書にまとめる
+    イベントを (レコード番号, 言語の位置) 順に再生するので、
+    シャード数や完了順によらず LangDictTrainer で順に学習した結果と同じになる
+    """
+    trainer = LangDictTrainer(lang_dict, context_window)
+    entries = trainer.entries
+    seed_ids = list(entries)
+    new_ids: List[List[str]] = [[] for _ in results]
+
+    streams = [
+        zip(rec, slot, repeat(shard), ref, code, ts)
+        for shard, (rec, slot, ref, code, ts) in enumerate(r["events"] for r in results)
+    ]
+    for _, _, shard, ref, code, ts in heapq.merge(*streams):
+        result = results[shard]
+        lang = result["langs"][code]
+        if ref >= 0:
+            entry_id = seed_ids[ref]
+        else:
+            ids = new_ids[shard]
+            k = -1 - ref
+            if k == len(ids):
+                ids.append(trainer.new_entry(*result["new_texts"][k], ts))
+            entry_id = ids[k]
+        entry = entries[entry_id]
+        trainer.bump_confidence(entry)
+        entry.setdefault("meaning_distance", {})
+        trainer.update_probability(entry, lang, ts)
+
+    # meaning_distance はシャードで計算済み（エントリごとに1つのシャードが担当）
+    for shard, result in enumerate(results):
+        for k, distances in enumerate(result["new_distances"]):
+            entries[new_ids[shard][k]]["meaning_distance"] = distances
+        for ref, distances in result["seed_distances"].items():
+            entries[seed_ids[ref]]["meaning_distance"] = distances
+    return lang_dict
+
+# =========================
+# 再構築
+# =========================
+def rebuild(
+    sources: List[LogSource], seed_path: str = SEED_LANGDICT_PATH,
+    workers: int = len(SHARD_LANGS), context_window: int = CONTEXT_WINDOW
+) -> Tuple[dict, int]:
+    """シード辞書からログ全体を学習し直した lang_dict と読んだレコード数を返す"""
+    shards = max(1, workers)
+    if shards == 1:
+        results = [train_shard(0, 1, sources, seed_path, context_window)]
+    else:
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=shards, mp_context=context) as executor:
+            futures = [
+                executor.submit(train_shard, shard, shards, sources, seed_path, context_window)
+                for shard in range(shards)
+            ]
+            results = [future.result() for future in futures]
+    lang_dict = merge_shards(load_json(seed_path, {"entries": {}}), results, context_window)
+    return lang_dict, results[0]["records"]
+
+# =========================
+# CLI
+# =========================
+def main():
+    parser = argparse.ArgumentParser(
+        description="アーカイブ済みの翻訳ログから lang_dict を作り直す（稼働中のBotには触れない）"
+    )
+    parser.add_argument("logs", nargs="*", help="ログファイルまたはディレクトリ（古い順に読む。*.gz 可）")
+    parser.add_argument("--seed", default=SEED_LANGDICT_PATH, help="出発点の辞書")
+    parser.add_argument("--out", default=REBUILT_LANGDICT_PATH, help="書き出し先")
+    parser.add_argument("--live-log", default=TRANSLATE_LOG_PATH, help="最後に読む現行ログ（学習カーソルの基準）")
+    parser.add_argument("--no-live-log", action="store_true", help="現行ログを読まない")
+    parser.add_argument("--workers", type=int, default=min(len(SHARD_LANGS), os.cpu_count() or 1))
+    parser.add_argument("--context-window", type=int, default=CONTEXT_WINDOW)
+    args = parser.parse_args()
+
+    sources: List[LogSource] = [(path, None) for path in list_log_files(args.logs)]
+    live_end = 0
+    if not args.no_live_log and os.path.exists(args.live_log):
+        live = os.path.realpath(args.live_log)
+        sources = [s for s in sources if os.path.realpath(s[0]) != live]
+        # 追記中の行は読まず、そこを学習カーソルにして Bot に続きを任せる
+        live_end = complete_size(args.live_log)
+        sources.append((args.live_log, live_end))
+    if not sources:
+        parser.error("no log files")
+
+    started = time.perf_counter()
+    lang_dict, records = rebuild(sources, args.seed, args.workers, args.context_window)
+    lang_dict.setdefault("meta", {})["train_cursor"] = live_end
+    atomic_write_json(args.out, lang_dict)
+    print(
+        f"Rebuilt {len(lang_dict['entries'])} entries from {records} records"
+        f" ({len(sources)} files, {args.workers} workers) in {time.perf_counter() - started:.1f}s"
+    )
+    if args.out != LANGDICT_PATH:
+        print(f"Wrote {args.out}. Replace {LANGDICT_PATH} with it and run !reload_langdict to switch.")
+
+
+if __name__ == "__main__":
+    main()
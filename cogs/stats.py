@@ -0,0 +1,168 @@
+# cogs/stats.py
+
+import discord
+from discord.ext import commands
+from aiohttp import web
+import os
+
+from cogs.metrics import get_metrics
+
+# =========================
+# 設定
+# =========================
+# Prometheus 用のエンドポイント（ローカルからのみ）
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.getenv("METRICS_PORT", "9108"))
+METRICS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+STAGES = ["dictionary", "gemini", "log", "fanout", "first_delivery", "total"]
+
+# =========================
+# ユーティリティ
+# =========================
+def format_ms(seconds) -> str:
+    if seconds is None:
+        return "-"
+    return f"≤{seconds * 1000:g}ms"
+
+def format_histogram(histogram) -> str:
+    if histogram is None:
+        return "n=0"
+    return (
+        f"n={histogram.count} p50 {format_ms(histogram.quantile(0.5))}"
+        f" p99 {format_ms(histogram.quantile(0.99))}"
+    )
+
+def counts_by(metrics, name: str, label: str) -> dict:
+    return {labels.get(label, ""): int(c.value) for labels, c in metrics.children(name)}
+
+# =========================
+# 計測値Cog
+# =========================
+class StatsCog(commands.Cog):
+    """
+    計測値の公開
+      - http://METRICS_HOST:METRICS_PORT/metrics（Prometheus テキスト形式）
+      - !stats（管理者向けの要約）
+    """
+
+    def __init__(self, bot: commands.Bot):
+        self.bot = bot
+        self.metrics = get_metrics(bot)
+        self._runner = None
+
+    async def cog_load(self):
+        app = web.Application()
+        app.router.add_get("/metrics", self.handle_metrics)
+        self._runner = web.AppRunner(app)
+        await self._runner.setup()
+        try:
+            await web.TCPSite(self._runner, METRICS_HOST, METRICS_PORT).start()
+        except OSError as e:
+            # ポートが使えなくても !stats は使える
+            print(f"Metrics endpoint disabled ({METRICS_HOST}:{METRICS_PORT}):", e)
+
+    async def cog_unload(self):
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def handle_metrics(self, request: web.Request) -> web.Response:
+        body = self.metrics.render_prometheus().encode("utf-8")
+        return web.Response(body=body, headers={"Content-Type": METRICS_CONTENT_TYPE})
+
+    # =========================
+    # !stats
+    # =========================
+    @commands.command(name="stats")
+    @commands.has_permissions(administrator=True)
+    async def stats(self, ctx: commands.Context):
+        """
+        各段階のレイテンシ（p50/p99 はヒストグラムのバケット上限）と件数を表示
+        """
+        embed = discord.Embed(title="📊 Translate stats", color=0x3498db)
+
+        lines = []
+        for stage in STAGES:
+            histogram = self.metrics.get("translate_stage_seconds", stage=stage)
+            lines.append(f"`{stage:<10}` {format_histogram(histogram)}")
+        embed.add_field(name="Stages", value="\n".join(lines), inline=False)
+
+        lookups = counts_by(self.metrics, "dictionary_lookups_total", "result")
+        fallbacks = counts_by(self.metrics, "gemini_fallbacks_total", "result")
+        requests = counts_by(self.metrics, "gemini_requests_total", "result")
+        embed.add_field(
+            name="Dictionary",
+            value=f"hit {lookups.get('hit', 0)} / fuzzy {lookups.get('fuzzy_hit', 0)} / miss {lookups.get('miss', 0)}",
+            inline=False
+        )
+        gemini = " / ".join(f"{k} {v}" for k, v in sorted(fallbacks.items())) or "-"
+        gemini_requests = " / ".join(f"{k} {v}" for k, v in sorted(requests.items())) or "-"
+        translate_cog = self.bot.get_cog("TranslateCog")
+        client = getattr(translate_cog, "gemini", None)
+        last_error = getattr(client, "last_error", None)
+        value = f"fallbacks: {gemini}\nrequests: {gemini_requests}"
+        if client is not None:
+            value += (
+                f"\ncircuit: {client.breaker.state} / concurrency: "
+                f"{client.limiter.inflight}/{int(client.limiter.limit)}"
+            )
+        if last_error:
+            value += f"\nlast error: `{last_error[:200]}`"
+        embed.add_field(name="Gemini", value=value, inline=False)
+
+        cache_lookups = counts_by(self.metrics, "translation_cache_lookups_total", "result")
+        evictions = counts_by(self.metrics, "translation_cache_evictions_total", "reason")
+        hits, misses = cache_lookups.get("hit", 0), cache_lookups.get("miss", 0)
+        entries = self.metrics.get("translation_cache_entries")
+        size = self.metrics.get("translation_cache_bytes")
+        rate = f"{hits / (hits + misses):.0%}" if hits + misses else "-"
+        embed.add_field(
+            name="Translation cache",
+            value=f"hit {hits} / miss {misses} ({rate})\n"
+                  f"entries {int(entries.value) if entries else 0}"
+                  f" / {(size.value if size else 0) / 1024 / 1024:.1f} MiB"
+                  f" / evicted: size {evictions.get('size', 0)} / expired {evictions.get('expired', 0)}",
+            inline=False
+        )
+
+        queued = counts_by(self.metrics, "pipeline_messages_total", "result")
+        shed = counts_by(self.metrics, "pipeline_shed_total", "action")
+        scheduler = getattr(translate_cog, "scheduler", None)
+        value = (
+            f"wait {format_histogram(self.metrics.get('pipeline_wait_seconds'))}\n"
+            f"queued {queued.get('queued', 0)} / coalesced {queued.get('coalesced', 0)}"
+            f" / dropped {shed.get('dropped', 0)} / dictionary only {shed.get('dictionary_only', 0)}"
+        )
+        if scheduler is not None:
+            value += (
+                f"\ndepth: {scheduler.depth()} / workers: {scheduler.busy}/{scheduler.workers}"
+                f" / policy: {scheduler.shed_policy}"
+            )
+        embed.add_field(name="Pipeline", value=value, inline=False)
+
+        errors = {}
+        for labels, counter in self.metrics.children("webhook_errors_total"):
+            errors[labels["target"]] = errors.get(labels["target"], 0) + int(counter.value)
+        if errors:
+            worst = sorted(errors.items(), key=lambda kv: -kv[1])[:10]
+            value = "\n".join(f"<#{target}>: {count}" for target, count in worst)
+        else:
+            value = "-"
+        embed.add_field(name="Webhook errors", value=value, inline=False)
+
+        records = self.metrics.get("train_records_total")
+        embed.add_field(
+            name="Training",
+            value=f"{format_histogram(self.metrics.get('train_pass_seconds'))}"
+                  f" / records {int(records.value) if records else 0}",
+            inline=False
+        )
+
+        await ctx.send(embed=embed)
+
+# =========================
+# Cog登録
+# =========================
+async def setup(bot: commands.Bot):
+    await bot.add_cog(StatsCog(bot))
@@ -0,0 +1,564 @@
+import argparse
+import json
+import os
+import sqlite3
+from collections import OrderedDict
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from cogs.lang_index import LangIndex, new_fuzzy_index, normalize_text
+from cogs.lang_store import LangDictSnapshot, load_json
+from cogs.trainer import DEFAULT_CONFIDENCE, FIRST_ENTRY_ID, LangDictTrainer
+
+DATA_DIR = "data"
+LANGDICT_DB_PATH = f"{DATA_DIR}/lang_dict.sqlite3"
+ENTRY_CACHE_SIZE = 10000  # メモリに置いておくエントリ数（学習中の書き換え分は別枠）
+
+# languages / confidence / probability / meaning_distance 以外のキーは extra にJSONで保持
+STRUCTURED_KEYS = ("languages", "confidence", "probability", "meaning_distance")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    id TEXT PRIMARY KEY,
+    seq INTEGER NOT NULL UNIQUE,
+    confidence REAL,
+    has_probability INTEGER NOT NULL DEFAULT 0,
+    has_distance INTEGER NOT NULL DEFAULT 0,
+    extra TEXT NOT NULL DEFAULT '{}'
+);
+CREATE TABLE IF NOT EXISTS phrases (
+    entry_id TEXT NOT NULL,
+    lang TEXT NOT NULL,
+    lang_order INTEGER NOT NULL,
+    pos INTEGER NOT NULL,
+    text TEXT NOT NULL,
+    norm TEXT NOT NULL,
+    PRIMARY KEY (entry_id, lang, pos)
+);
+CREATE INDEX IF NOT EXISTS phrases_norm ON phrases (lang, norm);
+CREATE INDEX IF NOT EXISTS phrases_text ON phrases (lang, text);
+CREATE TABLE IF NOT EXISTS probability (
+    entry_id TEXT NOT NULL,
+    lang TEXT NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (entry_id, lang)
+);
+CREATE TABLE IF NOT EXISTS meaning_distance (
+    entry_id TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (entry_id, key)
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+# =========================
+# 接続
+# =========================
+def connect(path: str = LANGDICT_DB_PATH) -> sqlite3.Connection:
+    """WALモードで開く（学習の書き込み中も読み出しを止めない）"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+# =========================
+# 行 ⇔ エントリ変換
+# =========================
+def _entry_rows(entry_id: str, seq: int, entry: dict):
+    extra = {k: v for k, v in entry.items() if k not in STRUCTURED_KEYS}
+    entry_row = (
+        entry_id, seq, entry.get("confidence"),
+        int("probability" in entry), int("meaning_distance" in entry),
+        json.dumps(extra, ensure_ascii=False)
+    )
+    phrase_rows = [
+        (entry_id, lang, lang_order, pos, text, normalize_text(text))
+        for lang_order, (lang, texts) in enumerate(entry.get("languages", {}).items())
+        for pos, text in enumerate(texts)
+    ]
+    prob_rows = [(entry_id, lang, value) for lang, value in entry.get("probability", {}).items()]
+    dist_rows = [(entry_id, key, value) for key, value in entry.get("meaning_distance", {}).items()]
+    return entry_row, phrase_rows, prob_rows, dist_rows
+
+def _build_entry(row, phrases, probs, dists) -> dict:
+    _, _, confidence, has_probability, has_distance, extra = row
+    entry = json.loads(extra)
+    languages: Dict[str, list] = {}
+    for lang, text in phrases:
+        languages.setdefault(lang, []).append(text)
+    entry["languages"] = languages
+    if confidence is not None:
+        entry["confidence"] = confidence
+    if has_probability:
+        entry["probability"] = dict(probs)
+    if has_distance:
+        entry["meaning_distance"] = dict(dists)
+    return entry
+
+def _load_entries(conn: sqlite3.Connection, entry_ids: List[str]) -> Dict[str, dict]:
+    """複数エントリをまとめて読む"""
+    if not entry_ids:
+        return {}
+    marks = ",".join("?" * len(entry_ids))
+    rows = conn.execute(
+        f"SELECT id, seq, confidence, has_probability, has_distance, extra"
+        f" FROM entries WHERE id IN ({marks}) ORDER BY seq", entry_ids
+    ).fetchall()
+    phrases: Dict[str, list] = {}
+    for eid, lang, text in conn.execute(
+        f"SELECT entry_id, lang, text FROM phrases WHERE entry_id IN ({marks})"
+        f" ORDER BY entry_id, lang_order, pos", entry_ids
+    ):
+        phrases.setdefault(eid, []).append((lang, text))
+    probs: Dict[str, list] = {}
+    for eid, lang, value in conn.execute(
+        f"SELECT entry_id, lang, value FROM probability WHERE entry_id IN ({marks})", entry_ids
+    ):
+        probs.setdefault(eid, []).append((lang, value))
+    dists: Dict[str, list] = {}
+    for eid, key, value in conn.execute(
+        f"SELECT entry_id, key, value FROM meaning_distance WHERE entry_id IN ({marks})", entry_ids
+    ):
+        dists.setdefault(eid, []).append((key, value))
+    return {
+        row[0]: _build_entry(row, phrases.get(row[0], []), probs.get(row[0], []), dists.get(row[0], []))
+        for row in rows
+    }
+
+# =========================
+# インポート／エクスポート
+# =========================
+def import_lang_dict(conn: sqlite3.Connection, lang_dict: dict):
+    """JSON形式（version 2）の辞書でDBの中身を置き換える"""
+    with conn:
+        for table in ("entries", "phrases", "probability", "meaning_distance", "meta"):
+            conn.execute(f"DELETE FROM {table}")
+        conn.executemany(
+            "INSERT INTO meta VALUES (?, ?)",
+            [(k, json.dumps(v, ensure_ascii=False)) for k, v in lang_dict.get("meta", {}).items()]
+        )
+        for seq, (eid, entry) in enumerate(lang_dict.get("entries", {}).items()):
+            entry_row, phrase_rows, prob_rows, dist_rows = _entry_rows(eid, seq, entry)
+            conn.execute("INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?)", entry_row)
+            conn.executemany("INSERT INTO phrases VALUES (?, ?, ?, ?, ?, ?)", phrase_rows)
+            conn.executemany("INSERT INTO probability VALUES (?, ?, ?)", prob_rows)
+            conn.executemany("INSERT INTO meaning_distance VALUES (?, ?, ?)", dist_rows)
+
+def iter_entries(conn: sqlite3.Connection, chunk_size: int = 1000) -> Iterator[tuple]:
+    """登録順に (id, entry) を少しずつ読む"""
+    last_seq = -1
+    while True:
+        ids = [
+            row[0] for row in conn.execute(
+                "SELECT id FROM entries WHERE seq > ? ORDER BY seq LIMIT ?", (last_seq, chunk_size)
+            )
+        ]
+        if not ids:
+            return
+        loaded = _load_entries(conn, ids)
+        for eid in ids:
+            yield eid, loaded[eid]
+        last_seq = conn.execute("SELECT seq FROM entries WHERE id = ?", (ids[-1],)).fetchone()[0]
+
+def load_meta(conn: sqlite3.Connection) -> dict:
+    return {k: json.loads(v) for k, v in conn.execute("SELECT key, value FROM meta")}
+
+def export_lang_dict(conn: sqlite3.Connection, path: str):
+    """DBの中身をJSON形式（version 2）で書き出す（エントリ単位で逐次書き込み）"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write('{"meta":' + json.dumps(load_meta(conn), ensure_ascii=False) + ',"entries":{')
+        for i, (eid, entry) in enumerate(iter_entries(conn)):
+            if i:
+                f.write(",")
+            f.write(json.dumps(eid) + ":" + json.dumps(entry, ensure_ascii=False))
+        f.write("}}")
+
+# =========================
+# エントリの遅延読み込み
+# =========================
+class SqliteEntries:
+    """
+    entries の dict 風ビュー
+    読み出しは LRU キャッシュ経由。学習で書き換えるエントリは checkout で
+    取り出して commit まで固定し、commit 時に差分の行だけを書き戻す
+    """
+    def __init__(self, store: "SqliteLangDictStore", cache_size: int = ENTRY_CACHE_SIZE):
+        self.store = store
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, dict]" = OrderedDict()
+        self._pinned: Dict[str, Optional[tuple]] = {}  # id → 読み込み時の状態（新規なら None）
+        self.pending_texts: Dict[tuple, str] = {}      # 未コミットの新規エントリの (lang, text)
+
+    def get(self, entry_id: str, default=None):
+        entry = self._cache.get(entry_id)
+        if entry is not None:
+            self._cache.move_to_end(entry_id)
+            return entry
+        entry = _load_entries(self.store.conn, [entry_id]).get(entry_id)
+        if entry is None:
+            return default
+        self._cache[entry_id] = entry
+        self._trim()
+        return entry
+
+    def __getitem__(self, entry_id: str) -> dict:
+        entry = self.get(entry_id)
+        if entry is None:
+            raise KeyError(entry_id)
+        return entry
+
+    def __contains__(self, entry_id: str) -> bool:
+        if entry_id in self._cache:
+            return True
+        row = self.store.conn.execute("SELECT 1 FROM entries WHERE id = ?", (entry_id,)).fetchone()
+        return row is not None
+
+    def __setitem__(self, entry_id: str, entry: dict):
+        """新規エントリ（commit までDBには書かない）"""
+        if entry_id not in self._pinned:
+            self._pinned[entry_id] = self._state(self.get(entry_id)) if entry_id in self else None
+        self._cache[entry_id] = entry
+        for lang, texts in entry.get("languages", {}).items():
+            for text in texts:
+                self.pending_texts.setdefault((lang, text), entry_id)
+
+    def __len__(self) -> int:
+        return self.store.conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0] + sum(
+            1 for state in self._pinned.values() if state is None
+        )
+
+    def items(self) -> Iterator[tuple]:
+        return iter_entries(self.store.conn)
+
+    def checkout(self, entry_id: str) -> dict:
+        """書き換え用に取り出す（commit まで追い出さない）"""
+        entry = self._cache.get(entry_id)
+        if entry is None:
+            entry = _load_entries(self.store.conn, [entry_id]).get(entry_id)
+            if entry is None:
+                raise KeyError(entry_id)
+            self._cache[entry_id] = entry
+        if entry_id not in self._pinned:
+            self._pinned[entry_id] = self._state(entry)
+        # 固定してから追い出す（固定済みが多いと読んだ直後に追い出されて別物を返してしまう）
+        self._trim()
+        return entry
+
+    def _state(self, entry: dict) -> tuple:
+        return (
+            json.dumps(entry.get("languages", {}), ensure_ascii=False),
+            dict(entry.get("probability", {})),
+            dict(entry.get("meaning_distance", {})),
+        )
+
+    def _trim(self):
+        while len(self._cache) > self.cache_size:
+            for eid in self._cache:
+                if eid not in self._pinned:
+                    del self._cache[eid]
+                    break
+            else:
+                return
+
+# =========================
+# 索引（SQL）
+# =========================
+class SqliteLangIndex(LangIndex):
+    """
+    完全一致は phrases(lang, norm) の索引で引く。
+    あいまい検索用の BK-tree は正規化テキストだけから初回に作る
+    """
+    def __init__(self, store: "SqliteLangDictStore"):
+        super().__init__()
+        self.store = store
+        self._fuzzy_built = False
+
+    def build(self, entries):
+        self._fuzzy = {}
+        self._fuzzy_built = False
+
+    def add(self, entry_id: str, languages: Dict[str, Iterable[str]]):
+        if not self._fuzzy_built:
+            return
+        for lang, texts in languages.items():
+            for text in texts:
+                self._fuzzy.setdefault(lang, new_fuzzy_index()).add(normalize_text(text))
+
+    def remove(self, entry_id: str, languages: Dict[str, Iterable[str]]):
+        # 完全一致はDBが正なので何もしない（BK-tree に残った分は照合時に落ちる）
+        pass
+
+    def lookup_normalized(self, norm: str, src_lang: str) -> List[str]:
+        return [
+            row[0] for row in self.store.conn.execute(
+                "SELECT p.entry_id FROM phrases p JOIN entries e ON e.id = p.entry_id"
+                " WHERE p.lang = ? AND p.norm = ? GROUP BY p.entry_id ORDER BY MIN(e.seq)",
+                (src_lang, norm)
+            )
+        ]
+
+    def rank(self, entry_id: str) -> int:
+        row = self.store.conn.execute("SELECT seq FROM entries WHERE id = ?", (entry_id,)).fetchone()
+        return row[0] if row else 1 << 62
+
+    def fuzzy_lookup_many(self, texts, src_lang: str, cutoff: float, strict: bool = False, mode: str = "best"):
+        if not self._fuzzy_built:
+            for lang, norm in self.store.conn.execute("SELECT DISTINCT lang, norm FROM phrases"):
+                self._fuzzy.setdefault(lang, new_fuzzy_index()).add(norm)
+            self._fuzzy_built = True
+        return super().fuzzy_lookup_many(texts, src_lang, cutoff, strict, mode)
+
+# =========================
+# 学習器（SQL）
+# =========================
+class SqliteLangDictTrainer(LangDictTrainer):
+    """逆引き・ID・confidence 合計をDBから取る学習器"""
+    def __init__(self, store: "SqliteLangDictStore", context_window: int = 20):
+        self.store = store
+        super().__init__({"entries": store.entries}, context_window)
+
+    def rebuild(self):
+        self.text_index = {}
+        self.next_id = max(FIRST_ENTRY_ID, self.store.max_numeric_id()) + 1
+        self.confidence_total = self.store.confidence_total()
+
+    def find_entry(self, lang: str, text: str) -> Optional[str]:
+        return self.store.find_entry_id(lang, text)
+
+    def index_text(self, lang: str, text: str, entry_id: str):
+        pass  # SqliteEntries.pending_texts が持つ
+
+    def load_for_update(self, entry_id: str) -> dict:
+        return self.entries.checkout(entry_id)
+
+# =========================
+# ストア本体
+# =========================
+class SqliteLangDictStore:
+    """
+    LangDictStore と同じ使い方ができる SQLite 版ストア
+    辞書全体をメモリに載せず、(lang, 正規化テキスト) の索引で引き、
+    confidence / probability / meaning_distance は行単位で更新する
+    """
+    def __init__(self, path: str = LANGDICT_DB_PATH):
+        self.path = path
+        self.conn = connect(path)
+        self.meta: dict = {}
+        self._snapshot: Optional[LangDictSnapshot] = None
+        self.reload()
+
+    # =========================
+    # 参照
+    # =========================
+    def snapshot(self) -> LangDictSnapshot:
+        """今の辞書と索引（LangDictStore と同じく await をまたいで持たない）"""
+        return self._snapshot
+
+    @property
+    def version(self) -> int:
+        return self._snapshot.version
+
+    @property
+    def entries(self) -> SqliteEntries:
+        return self._snapshot.entries
+
+    @property
+    def index(self) -> SqliteLangIndex:
+        return self._snapshot.index
+
+    @property
+    def lang_dict(self) -> dict:
+        """JSON形式に展開したもの（重いのでエクスポート用途のみ）"""
+        return {"meta": dict(self.meta), "entries": dict(iter_entries(self.conn))}
+
+    @property
+    def loaded(self) -> bool:
+        """DB を直接引くので起動時に読み込むものは無い"""
+        return True
+
+    async def wait_loaded(self):
+        pass
+
+    def ensure_loaded(self):
+        pass
+
+    def find_entry_id(self, lang: str, text: str) -> Optional[str]:
+        """学習用の完全一致（正規化なし）"""
+        pending = self.entries.pending_texts.get((lang, text))
+        if pending:
+            return pending
+        row = self.conn.execute(
+            "SELECT p.entry_id FROM phrases p JOIN entries e ON e.id = p.entry_id"
+            " WHERE p.lang = ? AND p.text = ? ORDER BY e.seq LIMIT 1", (lang, text)
+        ).fetchone()
+        return row[0] if row else None
+
+    def max_numeric_id(self) -> int:
+        row = self.conn.execute(
+            "SELECT MAX(CAST(id AS INTEGER)) FROM entries WHERE id NOT GLOB '*[^0-9]*'"
+        ).fetchone()
+        return row[0] or 0
+
+    def confidence_total(self) -> float:
+        row = self.conn.execute(
+            "SELECT SUM(COALESCE(confidence, ?)) FROM entries", (DEFAULT_CONFIDENCE,)
+        ).fetchone()
+        return row[0] or 0.0
+
+    def make_trainer(self, context_window: int = 20) -> SqliteLangDictTrainer:
+        return SqliteLangDictTrainer(self, context_window)
+
+    def replica_source(self) -> tuple:
+        """学習ワーカーは同じDBを自分で開く"""
+        return ("sqlite", self.path)
+
+    # =========================
+    # 更新
+    # =========================
+    def reload(self):
+        """キャッシュを捨ててDBから読み直す"""
+        self.meta = load_meta(self.conn)
+        version = self._snapshot.version + 1 if self._snapshot else 0
+        self._snapshot = LangDictSnapshot(version, None, SqliteEntries(self), SqliteLangIndex(self))
+
+    def replace(self, lang_dict: dict):
+        import_lang_dict(self.conn, lang_dict)
+        self.reload()
+
+    def commit(self, entry_ids: Iterable[str] = ()):
+        """checkout・追加されたエントリの差分とメタ情報を1トランザクションで書く"""
+        entries = self.entries
+        targets = dict(entries._pinned)
+        for eid in entry_ids:
+            if eid not in targets and eid in entries._cache:
+                targets[eid] = ()  # 読み込み時の状態が不明なので全行を書き直す
+        new_languages = []
+        with self.conn:
+            next_seq = self.conn.execute("SELECT COALESCE(MAX(seq), -1) + 1 FROM entries").fetchone()[0]
+            for eid, orig in targets.items():
+                entry = entries._cache.get(eid)
+                if entry is None:
+                    continue
+                if self._write_entry(eid, entry, orig, next_seq):
+                    next_seq += 1
+                if not orig or orig[0] != json.dumps(entry.get("languages", {}), ensure_ascii=False):
+                    new_languages.append((eid, entry.get("languages", {})))
+            self._write_meta()
+        entries._pinned.clear()
+        entries.pending_texts.clear()
+        entries._trim()
+        for eid, languages in new_languages:
+            self.index.add(eid, languages)
+        self._snapshot = self._snapshot._replace(version=self._snapshot.version + 1)
+
+    def _write_entry(self, eid: str, entry: dict, orig: Optional[tuple], next_seq: int) -> bool:
+        """1エントリ分の行を書く（新規なら True）"""
+        entry_row, phrase_rows, prob_rows, dist_rows = _entry_rows(eid, next_seq, entry)
+        row = self.conn.execute("SELECT seq FROM entries WHERE id = ?", (eid,)).fetchone()
+        if row is None:
+            self.conn.execute("INSERT INTO entries VALUES (?, ?, ?, ?, ?, ?)", entry_row)
+            orig = None
+        else:
+            self.conn.execute(
+                "UPDATE entries SET confidence = ?, has_probability = ?, has_distance = ?, extra = ?"
+                " WHERE id = ?", (*entry_row[2:], eid)
+            )
+        old_languages, old_probs, old_dists = orig if orig else (None, None, None)
+
+        if old_languages != json.dumps(entry.get("languages", {}), ensure_ascii=False):
+            self.conn.execute("DELETE FROM phrases WHERE entry_id = ?", (eid,))
+            self.conn.executemany("INSERT INTO phrases VALUES (?, ?, ?, ?, ?, ?)", phrase_rows)
+        self._write_map("probability", "lang", eid, old_probs, entry.get("probability", {}))
+        self._write_map("meaning_distance", "key", eid, old_dists, entry.get("meaning_distance", {}))
+        return row is None
+
+    def _write_map(self, table: str, column: str, eid: str, old: Optional[dict], new: dict):
+        """probability / meaning_distance は変わったキーだけ書く"""
+        if old is None:
+            self.conn.execute(f"DELETE FROM {table} WHERE entry_id = ?", (eid,))
+            old = {}
+        self.conn.executemany(
+            f"INSERT OR REPLACE INTO {table} (entry_id, {column}, value) VALUES (?, ?, ?)",
+            [(eid, key, value) for key, value in new.items() if old.get(key) != value]
+        )
+        self.conn.executemany(
+            f"DELETE FROM {table} WHERE entry_id = ? AND {column} = ?",
+            [(eid, key) for key in old if key not in new]
+        )
+
+    def _write_meta(self):
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO meta VALUES (?, ?)",
+            [(k, json.dumps(v, ensure_ascii=False)) for k, v in self.meta.items()]
+        )
+
+    def merge_entries(self, entries: Dict[str, dict]):
+        """学習ワーカーが返したエントリを差分として1トランザクションで書く"""
+        for eid, entry in entries.items():
+            if eid in self.entries:
+                target = self.entries.checkout(eid)
+                target.clear()
+                target.update(entry)
+            else:
+                self.entries[eid] = entry
+        self.commit(entries)
+
+    def add_entry(self, entry_id: str, languages: Dict[str, list]):
+        self.entries._cache.pop(entry_id, None)
+        self.entries[entry_id] = {"languages": languages}
+        self.commit([entry_id])
+
+    def update_entry_confidence(self, entry_id: str, confidence: float) -> bool:
+        with self.conn:
+            cur = self.conn.execute(
+                "UPDATE entries SET confidence = ? WHERE id = ?", (confidence, entry_id)
+            )
+        if not cur.rowcount:
+            return False
+        cached = self.entries._cache.get(entry_id)
+        if cached is not None:
+            cached["confidence"] = confidence
+        self._snapshot = self._snapshot._replace(version=self._snapshot.version + 1)
+        return True
+
+    def save(self):
+        """エントリは commit 時に書き込み済み。メタ情報だけ書く"""
+        with self.conn:
+            self._write_meta()
+
+    async def flush(self):
+        self.save()
+
+# =========================
+# インポート／エクスポート CLI
+# =========================
+def main():
+    parser = argparse.ArgumentParser(description="lang_dict の JSON ⇔ SQLite 変換")
+    sub = parser.add_subparsers(dest="command", required=True)
+    imp = sub.add_parser("import", help="JSON → SQLite")
+    imp.add_argument("json_path")
+    imp.add_argument("--db", default=LANGDICT_DB_PATH)
+    exp = sub.add_parser("export", help="SQLite → JSON")
+    exp.add_argument("json_path")
+    exp.add_argument("--db", default=LANGDICT_DB_PATH)
+    args = parser.parse_args()
+
+    conn = connect(args.db)
+    if args.command == "import":
+        import_lang_dict(conn, load_json(args.json_path, {"entries": {}}))
+        count = conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        print(f"Imported {count} entries into {args.db}")
+    else:
+        export_lang_dict(conn, args.json_path)
+        print(f"Exported {args.db} to {args.json_path}")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
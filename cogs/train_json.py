@@ -1,20 +1,28 @@
 # cogs/train_json.py
 
-import discord
 from discord.ext import commands, tasks
+import asyncio
 import json
+import multiprocessing
 import os
 import time
-from collections import defaultdict, deque
-from difflib import SequenceMatcher
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
+
+from cogs import train_worker
+from cogs.lang_store import get_store
+from cogs.metrics import get_metrics
+from cogs.translate_log import TRANSLATE_LOG_PATH
 
 # =========================
 # パス設定
 # =========================
-LOG_PATH = "data/translate_logs.json"  # translate.py が書き込むログ
-LANGDICT_PATH = "data/lang_dict.json"
+LOG_PATH = TRANSLATE_LOG_PATH  # translate.py が書き込むログ（JSONL）
+SEED_LANGDICT_PATH = "data/dictionaries/translate.json"  # 全再学習の出発点
 
-SUPPORTED_LANGS = ["ja", "en", "ko", "zh"]
+# 学習1回あたりの所要時間（秒）のバケット
+TRAIN_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 300.0)
 
 # =========================
 # ユーティリティ
@@ -25,11 +33,6 @@ def load_json(path, default=None):
     with open(path, "r", encoding="utf-8") as f:
         return json.load(f)
 
-def save_json(path, data):
-    os.makedirs(os.path.dirname(path), exist_ok=True)
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-
 def timestamp_to_date(ts):
     return time.strftime("%Y:%m:%d", time.localtime(ts))
 
@@ -44,12 +47,18 @@ class TrainJson(commands.Cog):
 
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        self.lang_dict = load_json(LANGDICT_PATH, {"entries": {}})
+        self.store = get_store(bot)  # 全Cog共有の辞書
+        self.metrics = get_metrics(bot)
         self.context_window = 20  # 文脈履歴
         self.last_update = 0
+        self.batch_size = 5000  # 1回の学習で読む最大レコード数
 
-        # 文脈ログを読み込み
-        self.logs = load_json(LOG_PATH, [])
+        # 学習は別プロセスのワーカーで行い、イベントループを止めない
+        self.executor: Optional[ProcessPoolExecutor] = None
+        self.replica_key = 0         # ワーカーが持つ辞書レプリカの版
+        self.synced_entries = None   # レプリカの元になった entries
+        self.synced_version = None   # レプリカと一致しているストアの版
+        self._train_lock = asyncio.Lock()  # 学習は同時に1つだけ
 
         # 非同期ループで定期更新
         self.update_task.start()
@@ -57,8 +66,12 @@ class TrainJson(commands.Cog):
     # =========================
     # Cog終了時にタスク停止
     # =========================
-    def cog_unload(self):
+    async def cog_unload(self):
         self.update_task.cancel()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+        await self.store.flush()
 
     # =========================
     # 定期更新タスク
@@ -66,94 +79,154 @@ class TrainJson(commands.Cog):
     @tasks.loop(seconds=30.0)
     async def update_task(self):
         """
-        30秒ごとにログを確認して LangDictJson を更新
+        30秒ごとに前回以降のログだけを読んで LangDictJson を更新
         """
-        self.logs = load_json(LOG_PATH, [])
-        self.train_lang_dict()
-        save_json(LANGDICT_PATH, self.lang_dict)
+        if self._train_lock.locked():
+            return  # 前回の学習（または手動の学習）がまだ終わっていない
+        try:
+            await self.train_incremental()
+        except Exception as e:
+            # 失敗しても定期更新は止めない（次の周期で続きから）
+            print("Training failed:", e)
 
     # =========================
-    # 学習ロジック
+    # 学習カーソル
     # =========================
-    def train_lang_dict(self):
+    def get_cursor(self) -> int:
         """
-        ログを解析して LangDictJson を更新
+        学習済みログのバイトオフセット
+        辞書の meta に持たせ、辞書と同じ書き込みで永続化する
+        （保存前に落ちても同じレコードを二重に学習しない）
         """
-        entries = self.lang_dict.setdefault("entries", {})
-
-        # チャンネル別文脈履歴
-        context_logs = defaultdict(lambda: deque(maxlen=self.context_window))
+        return self.store.meta.get("train_cursor", 0)
 
-        for log in self.logs:
-            ts = log.get("timestamp")
-            word = log.get("word", {})
+    def set_cursor(self, offset: int):
+        self.store.meta["train_cursor"] = offset
 
-            # タイムスタンプごとの文脈に格納
-            context_logs[ts].append(word)
+    async def train_incremental(self) -> int:
+        """
+        カーソル以降の新規ログだけを学習して保存
+        戻り値は学習したレコード数
+        """
+        async with self._train_lock:
+            # 起動直後はスナップショットだけなので、辞書全体の読み込みを待つ
+            await self.store.wait_loaded()
+            return await self._train_incremental()
 
-            # 各言語の単語／文章ごとに処理
-            for lang, text in word.items():
-                if not text:
+    async def train_full(self) -> int:
+        """
+        シード辞書から作り直し、ログ全体を最初から学習
+        """
+        async with self._train_lock:
+            await self.store.wait_loaded()
+            self.store.replace(load_json(SEED_LANGDICT_PATH, {"entries": {}}))
+            self.set_cursor(0)
+            total = await self._train_incremental()
+            self.store.save()
+            return total
+
+    async def _train_incremental(self) -> int:
+        start = self.get_cursor()
+        total = 0
+        while True:
+            offset = self.get_cursor()
+            entries = self.store.entries
+            with self.metrics.timer(
+                "train_pass_seconds", "Duration of one training pass", buckets=TRAIN_BUCKETS
+            ):
+                changes, new_offset, count = await self.run_worker(offset)
+                if self.store.entries is not entries:
+                    # 学習中に辞書が差し替えられた（リロード）。結果は捨ててやり直す
                     continue
+                if new_offset == offset:
+                    break
+                # カーソルは学習結果と同じ commit で書かれるよう先に進める
+                self.set_cursor(new_offset)
+                self.merge_changes(changes)
+            self.metrics.counter("train_records_total", "Log records trained").inc(count)
+            total += count
+            if count < self.batch_size:
+                break
+        if self.get_cursor() != start:
+            self.store.save()
+        return total
 
-                # 既存エントリ検索（単語が一致するもの）
-                entry_id = None
-                for eid, entry in entries.items():
-                    if lang in entry["languages"] and text in entry["languages"][lang]:
-                        entry_id = eid
-                        break
-
-                # 新規エントリ作成
-                if not entry_id:
-                    new_id = str(max(map(int, entries.keys()), default=1000) + 1)
-                    entries[new_id] = {
-                        "languages": {lang: [text]},
-                        "confidence": 0.3,
-                        "meaning_distance": {},
-                        "probability": {},
-                        "last_modified": ts
-                    }
-                    entry_id = new_id
-
-                entry = entries[entry_id]
-
-                # confidence 更新（時間と使用回数に応じて）
-                old_conf = entry.get("confidence", 0.3)
-                entry["confidence"] = min(1.0, old_conf + 0.05)
-
-                # 文脈距離を更新
-                for other_ts, other_words in context_logs.items():
-                    if other_ts == ts:
-                        continue
-                    for o_lang, o_text in other_words:
-                        if o_lang == lang:
-                            continue
-                        # 他言語単語との距離
-                        key = f"{o_lang}:{o_text}"
-                        entry.setdefault("meaning_distance", {})
-                        entry["meaning_distance"][key] = entry["meaning_distance"].get(key, 0.0) + 0.05
-
-                # probability を confidence に比例して計算
-                entry["probability"][lang] = entry["confidence"] / sum(
-                    e.get("confidence", 0.3) for e in entries.values()
-                )
-
-                entry["last_modified"] = ts
+    # =========================
+    # 学習ワーカー
+    # =========================
+    def _new_executor(self) -> ProcessPoolExecutor:
+        # fork だとイベントループやスレッドの状態まで複製されるので spawn で起動
+        return ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn"))
 
+    async def run_worker(self, offset: int) -> tuple:
+        """
+        ワーカープロセスで1バッチ分のログを読んで学習し、
+        (変更されたエントリ, 新しいオフセット, 件数) を受け取る。
+        レプリカが古い（他のCogが辞書を変更した・差し替えた）ときは辞書を添えて送る
+        """
+        loop = asyncio.get_running_loop()
+        if self.executor is None:
+            self.executor = self._new_executor()
+        source, reset = None, False
+        if self.store.entries is not self.synced_entries or self.store.version != self.synced_version:
+            reset = self.store.entries is not self.synced_entries
+            source = self.store.replica_source()
+            self.replica_key += 1
+            self.synced_entries = self.store.entries
+            self.synced_version = self.store.version
+
+        for _ in range(2):
+            try:
+                result = await loop.run_in_executor(
+                    self.executor, train_worker.train_batch, self.replica_key, LOG_PATH,
+                    offset, self.batch_size, self.context_window, source, reset
+                )
+            except BrokenProcessPool:
+                # ワーカーが落ちた。作り直して辞書ごと送り直す
+                self.executor = self._new_executor()
+                result = None
+            if result is not None:
+                return result
+            source = self.store.replica_source()
+        self.synced_version = None  # 次の周期で辞書ごと送り直す
+        raise RuntimeError("training worker failed twice")
+
+    def merge_changes(self, changes: dict):
+        """
+        ワーカーが返したエントリをストアへ反映（await を挟まないので一度に公開される）
+        学習中に他のCogが辞書を変更していたら、次の学習で辞書ごと送り直す
+        """
+        in_sync = self.store.version == self.synced_version
+        self.store.merge_entries(changes)
+        self.synced_version = self.store.version if in_sync else None
         self.last_update = time.time()
 
     # =========================
     # 手動トリガー
     # =========================
     @commands.command(name="train_langdict")
-    async def manual_train(self, ctx: commands.Context):
+    async def manual_train(self, ctx: commands.Context, mode: str = "incremental"):
         """
         管理者が手動で LangDictJson を更新
+        !train_langdict       : 前回以降のログだけを学習
+        !train_langdict full  : シード辞書からログ全体を再学習
+        """
+        if self._train_lock.locked():
+            await ctx.send("⏳ 学習中です。終わってから実行してください。")
+            return
+        if mode == "full":
+            count = await self.train_full()
+        else:
+            count = await self.train_incremental()
+        await ctx.send(f"✅ LangDictJsonを更新しました。（{count}件）")
+
+    @commands.command(name="reload_langdict")
+    async def reload_langdict(self, ctx: commands.Context):
+        """
+        ディスク上の LangDictJson を読み直して全Cogに反映
         """
-        self.logs = load_json(LOG_PATH, [])
-        self.train_lang_dict()
-        save_json(LANGDICT_PATH, self.lang_dict)
-        await ctx.send("✅ LangDictJsonを更新しました。")
+        self.store.reload()
+        await ctx.send(f"🔄 LangDictJsonを再読み込みしました。（{len(self.store.entries)}件）")
 
 # =========================
 # Cog登録
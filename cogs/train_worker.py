@@ -0,0 +1,66 @@
+import pickle
+from typing import Dict, Optional, Tuple
+
+from cogs.compact_entries import new_trainer, plain_entry
+from cogs.translate_log import read_log_since
+
+# =========================
+# 学習ワーカー（別プロセス側）
+# =========================
+# プロセスごとに1つだけ持つ辞書のレプリカ
+#   key     : メインプロセスが付けた版（変わったら作り直しが必要）
+#   trainer : レプリカ上の学習器
+#   store   : SQLite バックエンドのときのワーカー側ストア
+_replica: dict = {"key": None, "trainer": None, "store": None}
+
+def _load_replica(key, source: tuple, context_window: int, reset_context: bool):
+    """source: ("json", pickle した lang_dict) / ("sqlite", DBパス)"""
+    old = _replica["trainer"]
+    kind, payload = source
+    store = None
+    if kind == "sqlite":
+        from cogs.storage_sqlite import SqliteLangDictStore
+        store = SqliteLangDictStore(payload)
+        trainer = store.make_trainer(context_window)
+    else:
+        trainer = new_trainer(pickle.loads(payload), context_window)
+    if old is not None and not reset_context:
+        # 他のCogによる変更で読み直すだけなら文脈履歴は引き継ぐ
+        trainer.context.extend(old.context)
+    _replica.update(key=key, trainer=trainer, store=store)
+
+def train_batch(
+    key, path: str, offset: int, max_records: int,
+    context_window: int = 20, source: Optional[tuple] = None, reset_context: bool = False
+) -> Optional[Tuple[Dict[str, dict], int, int]]:
+    """
+    offset 以降のログを最大 max_records 件読んで学習し、
+    (変更されたエントリ {id: エントリ全体}, 新しいオフセット, 件数) を返す。
+    レプリカが key と合わず source も無いときは None（メイン側が source を付けて再送する）
+    reset_context: 辞書ごと差し替えられた（全再学習・リロード）ときは文脈履歴も捨てる
+    """
+    if source is not None:
+        _load_replica(key, source, context_window, reset_context)
+    elif _replica["key"] != key or _replica["trainer"] is None:
+        return None
+
+    trainer = _replica["trainer"]
+    store = _replica["store"]
+    if store is not None:
+        # SQLite はDBが正。前回分はメインが commit 済みなのでキャッシュを捨てて読み直す
+        # （ID と confidence 合計は前回の続きをそのまま使う）
+        old = trainer
+        store.reload()
+        trainer = store.make_trainer(context_window)
+        trainer.context.extend(old.context)
+        trainer.next_id = old.next_id
+        trainer.confidence_total = old.confidence_total
+        _replica["trainer"] = trainer
+
+    logs, new_offset = read_log_since(path, offset, max_records)
+    if not logs:
+        return {}, new_offset, 0
+    changed = trainer.train(logs)
+    # 新規エントリは作成順（= ID 順）に並べ、メイン側でも同じ登録順になるようにする
+    ordered = sorted(changed, key=lambda eid: (not eid.isdigit(), int(eid) if eid.isdigit() else 0, eid))
+    return {eid: plain_entry(trainer.entries[eid]) for eid in ordered}, new_offset, len(logs)
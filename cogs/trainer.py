@@ -0,0 +1,122 @@
+from collections import deque
+from typing import Dict, Iterable, Optional, Set
+
+DEFAULT_CONFIDENCE = 0.3
+CONFIDENCE_STEP = 0.05
+DISTANCE_STEP = 0.05
+FIRST_ENTRY_ID = 1000
+
+# =========================
+# 学習ロジック本体
+# =========================
+class LangDictTrainer:
+    """
+    翻訳ログから LangDictJson を育てる学習器
+    以下を差分更新で持ち回り、1レコードあたりの処理を辞書サイズに依存させない
+      - (lang, text) → エントリID の逆引き索引
+      - 単調増加の新規ID
+      - confidence の合計（probability の分母）
+      - 直近 context_window 件の文脈履歴
+    """
+    def __init__(self, lang_dict: dict, context_window: int = 20):
+        self.lang_dict = lang_dict
+        self.entries: Dict[str, dict] = lang_dict.setdefault("entries", {})
+        self.context = deque(maxlen=context_window)
+        self.text_index: Dict[tuple, str] = {}
+        self.next_id = FIRST_ENTRY_ID + 1
+        self.confidence_total = 0.0
+        self.rebuild()
+
+    def rebuild(self):
+        """エントリ全体から索引・ID・合計を作り直す（ロード時のみ）"""
+        self.text_index = {}
+        max_id = FIRST_ENTRY_ID
+        total = 0.0
+        for eid, entry in self.entries.items():
+            for lang, texts in entry.get("languages", {}).items():
+                for text in texts:
+                    self.text_index.setdefault((lang, text), eid)
+            if eid.isdigit():
+                max_id = max(max_id, int(eid))
+            total += entry.get("confidence", DEFAULT_CONFIDENCE)
+        self.next_id = max_id + 1
+        self.confidence_total = total
+
+    def find_entry(self, lang: str, text: str) -> Optional[str]:
+        return self.text_index.get((lang, text))
+
+    def index_text(self, lang: str, text: str, entry_id: str):
+        self.text_index[(lang, text)] = entry_id
+
+    def load_for_update(self, entry_id: str) -> dict:
+        """書き換え用にエントリを取り出す（保存先によって差し替える）"""
+        return self.entries[entry_id]
+
+    def new_entry(self, lang: str, text: str, ts) -> str:
+        """新規エントリ作成"""
+        entry_id = str(self.next_id)
+        self.next_id += 1
+        self.entries[entry_id] = {
+            "languages": {lang: [text]},
+            "confidence": DEFAULT_CONFIDENCE,
+            "meaning_distance": {},
+            "probability": {},
+            "last_modified": ts
+        }
+        self.index_text(lang, text, entry_id)
+        self.confidence_total += DEFAULT_CONFIDENCE
+        return entry_id
+
+    def bump_confidence(self, entry: dict):
+        """confidence 更新（時間と使用回数に応じて）"""
+        old_conf = entry.get("confidence", DEFAULT_CONFIDENCE)
+        entry["confidence"] = min(1.0, old_conf + CONFIDENCE_STEP)
+        self.confidence_total += entry["confidence"] - old_conf
+
+    def add_context_distances(self, distances: dict, lang: str, ts):
+        """文脈距離を更新（直近の別タイムスタンプの発言の他言語訳）"""
+        for other_ts, other_words in self.context:
+            if other_ts == ts:
+                continue
+            for o_lang, o_text in other_words.items():
+                if o_lang == lang or not o_text:
+                    continue
+                key = f"{o_lang}:{o_text}"
+                distances[key] = distances.get(key, 0.0) + DISTANCE_STEP
+
+    def update_probability(self, entry: dict, lang: str, ts):
+        """probability を confidence に比例して計算"""
+        entry.setdefault("probability", {})[lang] = (
+            entry["confidence"] / self.confidence_total
+        )
+        entry["last_modified"] = ts
+
+    def train(self, logs: Iterable[dict]) -> Set[str]:
+        """
+        ログを解析して LangDictJson を更新
+        戻り値は追加・更新したエントリID
+        """
+        changed = set()
+        for log in logs:
+            ts = log.get("timestamp")
+            word = log.get("word", {})
+
+            # 各言語の単語／文章ごとに処理
+            for lang, text in word.items():
+                if not text:
+                    continue
+
+                # 既存エントリ検索（逆引き索引）／新規エントリ作成
+                entry_id = self.find_entry(lang, text)
+                if not entry_id:
+                    entry_id = self.new_entry(lang, text, ts)
+
+                entry = self.load_for_update(entry_id)
+                changed.add(entry_id)
+
+                self.bump_confidence(entry)
+                self.add_context_distances(entry.setdefault("meaning_distance", {}), lang, ts)
+                self.update_probability(entry, lang, ts)
+
+            self.context.append((ts, word))
+        return changed
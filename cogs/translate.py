@@ -2,13 +2,24 @@ import discord
 from discord.ext import commands
 from discord import app_commands
 import aiohttp
-import json
-import os
+import asyncio
 import time
+import weakref
+from contextlib import AsyncExitStack, asynccontextmanager
 from datetime import datetime
 from cogs.model import JsonAIModel
+from cogs.lang_index import normalize_text
+from cogs.lang_store import LangDictStore, get_store
+from cogs.translate_log import TRANSLATE_LOG_PATH, TranslateLogWriter, migrate_json_log
+from cogs.translation_cache import TranslationCache
+from cogs.message_map import MessageMap
+from cogs.pipeline import PipelineScheduler, WorkUnit
+from cogs.gemini import GeminiClient
+from cogs.webhook_fanout import WebhookFanout
+from cogs.channel_links import ChannelLinks
+from cogs.metrics import MetricsRegistry, get_metrics
 import re
-import difflib
+from typing import AsyncIterator, Dict, List, Optional, Tuple
 
 # =========================
 # 設定
@@ -21,34 +32,19 @@ SUPPORTED_LANGS = {
 }
 
 DATA_DIR = "data"
-CHANNEL_LINK_PATH = f"{DATA_DIR}/channel_links.json"
-TRANSLATE_LOG_PATH = f"{DATA_DIR}/translate_logs.json"
-LANGDICT_PATH = f"{DATA_DIR}/lang_dict.json"
+FUZZY_CUTOFF = 0.7
+# 辞書に無い文だけを Gemini に送り、辞書訳と元の順に組み立てる
+HYBRID_TRANSLATION = True
+# メッセージ全体を Gemini に送るとき応答をストリームで受け、訳が閉じた言語から送信を始める
+STREAM_GEMINI = True
+# 送信した Webhook メッセージを覚えておき、元メッセージの編集・削除をリンク先へ反映する
+MESSAGE_SYNC = True
+# 文をつなぐ文字（分割時に消えた空白の代わり）
+SENTENCE_JOINERS = {"ja": "", "zh": "", "en": " ", "ko": " "}
 
-GEMINI_API_KEY = os.getenv("GEMINI_API_KEY", "YOUR_GEMINI_API_KEY")
-GEMINI_API_URL = "https://generativelanguage.googleapis.com/v1beta/models/gemini-pro:generateContent"
-
-# =========================
-# ユーティリティ
-# =========================
-def load_json(path, default):
-    if not os.path.exists(path):
-        return default
-    with open(path, "r", encoding="utf-8") as f:
-        return json.load(f)
-
-def save_json(path, data):
-    os.makedirs(os.path.dirname(path), exist_ok=True)
-    with open(path, "w", encoding="utf-8") as f:
-        json.dump(data, f, ensure_ascii=False, indent=2)
-
-def append_json(path, data):
-    logs = []
-    if os.path.exists(path):
-        with open(path, "r", encoding="utf-8") as f:
-            logs = json.load(f)
-    logs.append(data)
-    save_json(path, logs)
+STAGE_DOC = "Time spent in each on_message stage"
+FALLBACK_DOC = "Messages sent to the Gemini fallback by result"
+EDIT_DOC = "Sentences in edited messages by whether the stored translation was reused"
 
 # =========================
 # Model翻訳（長文対応）
@@ -58,8 +54,23 @@ class ModelTranslator:
     LangDictJson を使った自作翻訳
     文単位・類似語で翻訳、長文も対応
     """
-    def __init__(self):
-        self.lang_dict = load_json(LANGDICT_PATH, {"entries": {}})
+    def __init__(
+        self, store: Optional[LangDictStore] = None, fuzzy_mode: str = "first",
+        metrics: Optional[MetricsRegistry] = None
+    ):
+        """
+        store: 共有の辞書ストア（TrainJson の学習結果がそのまま見える）
+        fuzzy_mode: "first"（登録順で最初の一致）/ "best"（最も近い一致）
+        metrics: 完全一致／類似一致／未登録の件数を数える先
+        """
+        self.store = store or LangDictStore()
+        self.fuzzy_mode = fuzzy_mode
+        self.metrics = metrics or MetricsRegistry()
+
+    def _count(self, result: str):
+        self.metrics.counter(
+            "dictionary_lookups_total", "Per-sentence dictionary lookups by result", result=result
+        ).inc()
 
     def split_sentences(self, text: str):
         """
@@ -72,43 +83,119 @@ class ModelTranslator:
         """
         単一文を翻訳（完全一致 or 類似検索）
         """
-        entries = self.lang_dict.get("entries", {})
-        for eid, entry in entries.items():
-            langs = entry.get("languages", {})
-            if src_lang not in langs:
-                continue
+        return self.translate_sentences([sentence], src_lang)[0]
+
+    def translate_sentences(self, sentences: List[str], src_lang: str) -> List[Optional[dict]]:
+        """
+        複数の文を翻訳（完全一致を先に引き、残りはまとめて類似検索）
+        """
+        snap = self.store.snapshot()
+        results: List[Optional[dict]] = [None] * len(sentences)
 
-            # 完全一致
-            if sentence in langs[src_lang]:
-                return {tl: texts[0] for tl, texts in langs.items() if tl != src_lang}
+        def pick(ids):
+            langs = snap.entries[ids[0]].get("languages", {})
+            return {tl: texts[0] for tl, texts in langs.items() if tl != src_lang and texts}
 
-            # 類似文字列
-            for candidate in langs[src_lang]:
-                ratio = difflib.SequenceMatcher(None, sentence, candidate).ratio()
-                if ratio > 0.7:
-                    return {tl: texts[0] for tl, texts in langs.items() if tl != src_lang}
-        return None
+        # 完全一致（索引）
+        missing = []
+        for i, sentence in enumerate(sentences):
+            ids = snap.index.lookup(sentence, src_lang)
+            if ids:
+                self._count("hit")
+                results[i] = pick(ids)
+            else:
+                missing.append(i)
+        if not missing:
+            return results
 
-    def translate(self, text: str, src_lang: str):
+        # 類似文字列（言語別 BK-tree / n-gram 行列に全文まとめて）
+        fuzzy_ids = snap.index.fuzzy_lookup_many(
+            [sentences[i] for i in missing], src_lang,
+            cutoff=FUZZY_CUTOFF, strict=True, mode=self.fuzzy_mode
+        )
+        for i, ids in zip(missing, fuzzy_ids):
+            if ids:
+                self._count("fuzzy_hit")
+                results[i] = pick(ids)
+            else:
+                self._count("miss")
+        return results
+
+    def translate_parts(self, text: str, src_lang: str) -> List[Tuple[str, Optional[dict]]]:
         """
-        文単位で翻訳 → 結合
+        文ごとの辞書訳 [(文, {lang: 訳} または None), ...]（元の順）
         """
         sentences = self.split_sentences(text)
-        final_result = {lang: "" for lang in SUPPORTED_LANGS if lang != src_lang}
+        return list(zip(sentences, self.translate_sentences(sentences, src_lang)))
 
-        for sentence in sentences:
-            translated = self.translate_sentence(sentence, src_lang)
-            if translated:
-                for lang, t in translated.items():
-                    final_result[lang] += t
-            else:
-                # 見つからなければ空文字（後でGeminiにフォールバック）
-                pass
+    def join_parts(
+        self, parts: List[Tuple[str, Optional[dict]]], src_lang: str, keep_source: bool = False
+    ) -> Tuple[Optional[Dict[str, str]], bool]:
+        """
+        文ごとの訳を元の順に結合
+        全ての文の訳が揃った言語だけを返す（一部の文を黙って落とさない）
+        keep_source: 訳の無い文は原文のまま残す（Gemini が使えないときの辞書だけの訳）
+        戻り値は (訳, 原文で埋めた文が無いか)。原文が混ざった訳は学習ログに残さない
+        """
+        if keep_source and not any(t for _, t in parts):
+            return None, False
+        result = {}
+        complete = True
+        for lang in SUPPORTED_LANGS:
+            if lang == src_lang:
+                continue
+            pieces = [(t or {}).get(lang) for _, t in parts]
+            if keep_source and not all(pieces):
+                complete = False
+                pieces = [piece or sentence for piece, (sentence, _) in zip(pieces, parts)]
+            if pieces and all(pieces):
+                result[lang] = SENTENCE_JOINERS.get(lang, " ").join(pieces)
+        return result or None, complete
 
-        # 空文字だけの場合はNoneを返す
-        if all(not v for v in final_result.values()):
+    def align_parts(
+        self, parts: List[Tuple[str, Optional[dict]]], translations: Dict[str, str]
+    ) -> List[Tuple[str, Optional[dict]]]:
+        """
+        メッセージ全体の訳を文に分け、文の数が原文と同じ言語だけ文ごとの訳として parts に入れる
+        （編集時に変わっていない文の訳を使い回すため）
+        """
+        aligned = [dict(t or {}) for _, t in parts]
+        for lang, content in translations.items():
+            pieces = self.split_sentences(content)
+            if len(pieces) == len(parts):
+                for t, piece in zip(aligned, pieces):
+                    t[lang] = piece
+        return [(sentence, t or None) for (sentence, _), t in zip(parts, aligned)]
+
+    def reuse_parts(
+        self, old_parts: List[Tuple[str, Optional[dict]]], sentences: List[str], src_lang: str
+    ) -> Tuple[List[Tuple[str, Optional[dict]]], List[int]]:
+        """
+        前回の文ごとの訳のうち、今回も同じ文（正規化して比較）で全言語の訳が揃っているものを使い回す
+        戻り値は (parts, 訳し直す文の番号)
+        """
+        langs = [lang for lang in SUPPORTED_LANGS if lang != src_lang]
+        known = {}
+        for sentence, t in old_parts:
+            if t and all(t.get(lang) for lang in langs):
+                known.setdefault(normalize_text(sentence), t)
+        parts, missing = [], []
+        for i, sentence in enumerate(sentences):
+            t = known.get(normalize_text(sentence))
+            parts.append((sentence, t))
+            if t is None:
+                missing.append(i)
+        return parts, missing
+
+    def translate(self, text: str, src_lang: str):
+        """
+        文単位で翻訳 → 結合
+        全ての文が辞書にあるときだけ訳を返す（1文でも無ければ None）
+        """
+        parts = self.translate_parts(text, src_lang)
+        if not parts or any(t is None for _, t in parts):
             return None
-        return final_result
+        return self.join_parts(parts, src_lang)[0]
 
 # =========================
 # 翻訳Cog
@@ -116,38 +203,253 @@ class ModelTranslator:
 class TranslateCog(commands.Cog):
     def __init__(self, bot: commands.Bot):
         self.bot = bot
-        self.model = JsonAIModel()           # 自作AIモデル
-        self.channel_links = load_json(CHANNEL_LINK_PATH, {})
+        self.store = get_store(bot)          # 全Cog共有の辞書
+        self.metrics = get_metrics(bot)      # 全Cog共有の計測値
+        self.model = JsonAIModel(self.store) # 自作AIモデル
+        self.links = ChannelLinks()          # チャンネル連携（グループ別の送信先表）
         self.session = aiohttp.ClientSession()
-        self.model_translator = ModelTranslator()
+        self.model_translator = ModelTranslator(self.store, metrics=self.metrics)
+        self.log_writer = TranslateLogWriter(TRANSLATE_LOG_PATH)
+        self.cache = TranslationCache(metrics=self.metrics)  # Gemini翻訳キャッシュ
+        self.gemini = GeminiClient(self.session, metrics=self.metrics)
+        self.fanout = WebhookFanout(self.session)
+        self.message_map = MessageMap()      # 元メッセージ → 送信した Webhook メッセージ
+        self._message_locks = weakref.WeakValueDictionary()  # 元メッセージIDごとの送信・編集・削除の順序
+        self._unit_lock = asyncio.Lock()     # まとめて送ったメッセージの組み立て直し
+        self.scheduler = PipelineScheduler(self.process_unit, metrics=self.metrics)
+
+    async def cog_load(self):
+        # 旧形式（JSON配列）のログがあれば一度だけJSONLへ移行
+        await asyncio.to_thread(migrate_json_log)
+        self.log_writer.start()
+        await self.cache.open()
+        await self.message_map.open()
+        self.scheduler.start()
 
     async def cog_unload(self):
+        await self.scheduler.close()
+        await self.gemini.close()
+        await self.log_writer.close()
+        await self.cache.close()
+        await self.message_map.close()
+        await self.links.flush()
+        await self.store.flush()
         await self.session.close()
 
+    @commands.Cog.listener()
+    async def on_ready(self):
+        # サーバーを記録する前のリンクに記録する（それまでは古いリンク同士でつながっている）
+        guilds = []
+        for cid in self.links:
+            if not self.links.get(cid).get("guild"):
+                channel = self.bot.get_channel(int(cid))
+                if channel is not None and getattr(channel, "guild", None) is not None:
+                    guilds.append((cid, str(channel.guild.id)))
+        self.links.assign_guilds(guilds)
+
     # =========================
     # Gemini翻訳
     # =========================
     async def translate_with_gemini(self, text: str, src_lang: str):
-        prompt = (
-            "You are a professional translation assistant.\n"
-            "Translate the following message naturally.\n"
-            "Preserve tone and intent.\n\n"
-            f"Source language: {src_lang}\n"
-            f"Message: {text}\n\n"
-            "Return JSON only:\n"
-            "{ \"ja\": \"...\", \"en\": \"...\", \"ko\": \"...\", \"zh\": \"...\" }"
-        )
-        payload = {"contents": [{"parts": [{"text": prompt}]}]}
-        try:
-            async with self.session.post(f"{GEMINI_API_URL}?key={GEMINI_API_KEY}", json=payload) as resp:
-                if resp.status != 200:
-                    return {}
-                data = await resp.json()
-            raw = data["candidates"][0]["content"]["parts"][0]["text"]
-            parsed = json.loads(raw)
-            return {lang: parsed.get(lang) for lang in SUPPORTED_LANGS if lang != src_lang and parsed.get(lang)}
-        except Exception:
-            return {}
+        cached = self.cache.get(text, src_lang)
+        if cached is not None:
+            self.metrics.counter("gemini_fallbacks_total", FALLBACK_DOC, result="cache_hit").inc()
+            return cached
+
+        translations = await self.gemini.translate(text, src_lang)
+        # 失敗の理由は gemini_requests_total と gemini.last_error に残る
+        result = "ok" if translations else "failure"
+        self.metrics.counter("gemini_fallbacks_total", FALLBACK_DOC, result=result).inc()
+        self.cache.put(text, src_lang, translations)
+        return translations
+
+    async def stream_with_gemini(self, text: str, src_lang: str) -> AsyncIterator[Tuple[str, str]]:
+        """
+        translate_with_gemini と同じ訳を (lang, 訳) で、訳が閉じた言語から順に返す
+        STREAM_GEMINI が False ならまとめて受けてから返す
+        """
+        if not STREAM_GEMINI:
+            for lang, content in (await self.translate_with_gemini(text, src_lang)).items():
+                yield lang, content
+            return
+        cached = self.cache.get(text, src_lang)
+        if cached is not None:
+            self.metrics.counter("gemini_fallbacks_total", FALLBACK_DOC, result="cache_hit").inc()
+            for lang, content in cached.items():
+                yield lang, content
+            return
+
+        translations = {}
+        async for lang, content in self.gemini.stream(text, src_lang):
+            translations[lang] = content
+            yield lang, content
+        result = "ok" if translations else "failure"
+        self.metrics.counter("gemini_fallbacks_total", FALLBACK_DOC, result=result).inc()
+        self.cache.put(text, src_lang, translations)
+
+    async def translate_sentences_with_gemini(self, sentences: List[str], src_lang: str) -> List[dict]:
+        """
+        辞書に無かった文だけをまとめて翻訳（キャッシュに無い分を1リクエストで）
+        戻り値は sentences と同じ順（失敗した文は空dict）
+        """
+        results = [self.cache.get(s, src_lang) for s in sentences]
+        pending = [i for i, cached in enumerate(results) if cached is None]
+        if len(pending) < len(sentences):
+            self.metrics.counter("gemini_fallbacks_total", FALLBACK_DOC, result="cache_hit").inc(
+                len(sentences) - len(pending)
+            )
+        if not pending:
+            return results
+
+        translated = await self.gemini.translate_many([sentences[i] for i in pending], src_lang)
+        for i, translations in zip(pending, translated):
+            result = "ok" if translations else "failure"
+            self.metrics.counter("gemini_fallbacks_total", FALLBACK_DOC, result=result).inc()
+            self.cache.put(sentences[i], src_lang, translations)
+            results[i] = translations
+        return results
+
+    # =========================
+    # 辞書＋Gemini
+    # =========================
+    async def translate_message(
+        self, text: str, src_lang: str, split: Optional[list] = None, status: Optional[dict] = None
+    ) -> Optional[Dict[str, str]]:
+        """
+        辞書訳を優先し、足りない分を Gemini で補う
+          - 全文が辞書にあれば Gemini は呼ばない
+          - 全文が辞書に無ければ、文脈を保つためメッセージ全体を送る
+          - 一部だけ無ければ、その文だけを1リクエストで送り元の順に組み立てる
+          - Gemini が使えない（ブレーカーが開いている）・失敗したときは、
+            辞書にあった文だけ訳し残りは原文のままにする
+        split: 渡すと文ごとの訳 [(文, {lang: 訳} または None), ...] を入れる（編集時の差分翻訳用）
+        status: 渡すと "complete"（原文のまま残した文が無いか。False なら学習ログに残さない）を入れる
+        """
+        translations = {}
+        async for lang, content in self.translate_message_stream(text, src_lang, split, status=status):
+            translations[lang] = content
+        return translations or None
+
+    async def translate_message_stream(
+        self, text: str, src_lang: str, split: Optional[list] = None, dictionary_only: bool = False,
+        status: Optional[dict] = None
+    ) -> AsyncIterator[Tuple[str, str]]:
+        """
+        translate_message と同じ訳を (lang, 訳) で、送れるようになった言語から順に返す
+        メッセージ全体を Gemini に送るときだけ言語ごとに届き、それ以外はまとめて返る
+        split・status は translate_message と同じ（返し終えた時点で埋まっている）
+        dictionary_only: Gemini を使わず辞書だけで訳す（待ち行列があふれたとき）
+        """
+        if status is None:
+            status = {}
+        with self.metrics.timer("translate_stage_seconds", STAGE_DOC, stage="dictionary"):
+            parts = self.model_translator.translate_parts(text, src_lang)
+        missing = [i for i, (_, t) in enumerate(parts) if t is None]
+        if parts and not missing:
+            translations, status["complete"] = self.model_translator.join_parts(parts, src_lang)
+        elif dictionary_only or not self.gemini.available():
+            # 上流の回復（待ち行列が空くの）を待たずに辞書だけで返す
+            if not dictionary_only:
+                self.metrics.counter("gemini_fallbacks_total", FALLBACK_DOC, result="circuit_open").inc()
+            translations, status["complete"] = self.model_translator.join_parts(parts, src_lang, keep_source=True)
+        elif not HYBRID_TRANSLATION or len(missing) == len(parts):
+            streamed = {}
+            with self.metrics.timer("translate_stage_seconds", STAGE_DOC, stage="gemini"):
+                async for lang, content in self.stream_with_gemini(text, src_lang):
+                    streamed[lang] = content
+                    yield lang, content
+            if streamed:
+                status["complete"] = True
+                if split is not None:
+                    split[:] = self.model_translator.align_parts(parts, streamed)
+                return
+            translations, status["complete"] = self.model_translator.join_parts(parts, src_lang, keep_source=True)
+        else:
+            with self.metrics.timer("translate_stage_seconds", STAGE_DOC, stage="gemini"):
+                filled = await self.translate_sentences_with_gemini([parts[i][0] for i in missing], src_lang)
+            for i, sentence_translations in zip(missing, filled):
+                parts[i] = (parts[i][0], sentence_translations or None)
+            translations, status["complete"] = self.model_translator.join_parts(parts, src_lang, keep_source=True)
+        if split is not None:
+            split[:] = parts
+        for lang, content in (translations or {}).items():
+            yield lang, content
+
+    async def translate_unit_stream(
+        self, texts: List[str], src_lang: str, members: list, dictionary_only: bool = False
+    ) -> AsyncIterator[Tuple[str, str]]:
+        """
+        ワークユニットの訳を (lang, 訳) で返す
+        1件なら translate_message_stream と同じ。同じ作者の連投をまとめたものは、辞書に無い文を
+        全メッセージ分まとめて1リクエストで Gemini に送り、メッセージごとの訳を改行でつなぐ
+        members にはメッセージごとの (文ごとの訳, 訳, 原文のまま残した文が無いか) を入れる
+        （訳せなかった文は原文のまま）
+        """
+        if len(texts) == 1:
+            split, translations, status = [], {}, {}
+            async for lang, content in self.translate_message_stream(
+                texts[0], src_lang, split, dictionary_only, status
+            ):
+                translations[lang] = content
+                yield lang, content
+            members.append((split, translations, status.get("complete", False)))
+            return
+
+        with self.metrics.timer("translate_stage_seconds", STAGE_DOC, stage="dictionary"):
+            all_parts = [self.model_translator.translate_parts(text, src_lang) for text in texts]
+        missing = [(i, j) for i, parts in enumerate(all_parts) for j, (_, t) in enumerate(parts) if t is None]
+        if missing and not dictionary_only:
+            if not self.gemini.available():
+                self.metrics.counter("gemini_fallbacks_total", FALLBACK_DOC, result="circuit_open").inc()
+            else:
+                with self.metrics.timer("translate_stage_seconds", STAGE_DOC, stage="gemini"):
+                    filled = await self.translate_sentences_with_gemini(
+                        [all_parts[i][j][0] for i, j in missing], src_lang
+                    )
+                for (i, j), sentence_translations in zip(missing, filled):
+                    all_parts[i][j] = (all_parts[i][j][0], sentence_translations or None)
+
+        langs = [lang for lang in SUPPORTED_LANGS if lang != src_lang]
+        for text, parts in zip(texts, all_parts):
+            translations, complete = self.model_translator.join_parts(parts, src_lang, keep_source=True)
+            members.append((parts, translations or {lang: text for lang in langs}, complete))
+        if not any(t for parts in all_parts for _, t in parts):
+            return
+        for lang in langs:
+            yield lang, "\n".join(translations[lang] for _, translations, _ in members)
+
+    async def retranslate_message(
+        self, old_parts: list, text: str, src_lang: str
+    ) -> Tuple[Optional[Dict[str, str]], list, bool]:
+        """
+        編集後の text を訳す。前回と同じ文は保存しておいた訳を使い、変わった文だけを訳し直す
+        （辞書 → 残りを1リクエストで Gemini）。全ての文が変わったときは新しいメッセージと同じ扱い
+        戻り値は (訳, 文ごとの訳, 原文のまま残した文が無いか)
+        """
+        sentences = self.model_translator.split_sentences(text)
+        parts, missing = self.model_translator.reuse_parts(old_parts, sentences, src_lang)
+        self.metrics.counter("edit_sentences_total", EDIT_DOC, result="reused").inc(len(sentences) - len(missing))
+        self.metrics.counter("edit_sentences_total", EDIT_DOC, result="retranslated").inc(len(missing))
+        if len(missing) == len(sentences):
+            split, status = [], {}
+            translations = await self.translate_message(text, src_lang, split, status)
+            return translations, split, status.get("complete", False)
+
+        if missing:
+            with self.metrics.timer("translate_stage_seconds", STAGE_DOC, stage="dictionary"):
+                found = self.model_translator.translate_sentences([sentences[i] for i in missing], src_lang)
+            for i, sentence_translations in zip(missing, found):
+                parts[i] = (sentences[i], sentence_translations)
+            missing = [i for i in missing if parts[i][1] is None]
+        if missing and not self.gemini.available():
+            self.metrics.counter("gemini_fallbacks_total", FALLBACK_DOC, result="circuit_open").inc()
+        elif missing:
+            with self.metrics.timer("translate_stage_seconds", STAGE_DOC, stage="gemini"):
+                filled = await self.translate_sentences_with_gemini([sentences[i] for i in missing], src_lang)
+            for i, sentence_translations in zip(missing, filled):
+                parts[i] = (sentences[i], sentence_translations or None)
+        translations, complete = self.model_translator.join_parts(parts, src_lang, keep_source=True)
+        return translations, parts, complete
 
     # =========================
     # ログ保存
@@ -158,60 +460,296 @@ class TranslateCog(commands.Cog):
             "time": datetime.utcnow().strftime("%Y:%m:%d"),
             "word": translations
         }
-        append_json(TRANSLATE_LOG_PATH, log)
+        self.log_writer.write(log)
 
     # =========================
     # メッセージ監視
     # =========================
     @commands.Cog.listener()
     async def on_message(self, message: discord.Message):
+        # 翻訳・送信はワーカーに任せ、ここでは待ち行列に入れるだけ
+        self.enqueue_message(message)
+
+    def enqueue_message(self, message: discord.Message) -> Optional[WorkUnit]:
+        """連携チャンネルのメッセージを待ち行列に入れる（処理の完了は戻り値の done で待てる）"""
         if message.author.bot:
-            return
+            return None
 
         cid = str(message.channel.id)
-        if cid not in self.channel_links:
-            return
+        if self.links.get(cid) is None:
+            return None
 
-        src_lang = self.channel_links[cid]["lang"]
         text = message.content.strip()
         if not text:
-            return
+            return None
+        return self.scheduler.submit(cid, message.author.id, message, text)
 
-        # ===== 自作モデル翻訳優先 =====
-        translations = self.model_translator.translate(text, src_lang)
-        if not translations:
-            translations = await self.translate_with_gemini(text, src_lang)
+    async def process_unit(self, unit: WorkUnit):
+        """ワーカーから呼ばれる（同じチャンネルのユニットは1つずつ順に来る）"""
+        link = self.links.get(unit.channel_key)
+        if link is None:
+            return  # 待っている間にリンクが解除された
+
+        with self.metrics.timer("translate_stage_seconds", STAGE_DOC, stage="total"):
+            # 送り終えるまでは同じメッセージの編集・削除を待たせる
+            async with AsyncExitStack() as stack:
+                for message in unit.messages:
+                    await stack.enter_async_context(self.message_lock(message.id))
+                await self.relay_message(unit.messages, link["lang"], unit.texts, unit.dictionary_only)
+
+    @asynccontextmanager
+    async def message_lock(self, message_id: int):
+        """元メッセージごとの排他（送信 → 編集 → 削除の順を守る。使われなくなったロックは消える）"""
+        lock = self._message_locks.get(message_id)
+        if lock is None:
+            lock = self._message_locks[message_id] = asyncio.Lock()
+        async with lock:
+            yield
+
+    def count_webhook_errors(self, results: Dict[str, Optional[Exception]]):
+        for target_cid, error in results.items():
+            if error is not None:
+                self.metrics.counter(
+                    "webhook_errors_total", "Webhook send failures by target channel",
+                    target=target_cid, error=type(error).__name__
+                ).inc()
+
+    async def relay_message(
+        self, messages: List[discord.Message], src_lang: str, texts: List[str], dictionary_only: bool = False
+    ):
+        """
+        翻訳してリンク先チャンネルへ送る（各段階の所要時間を記録）
+        同じ作者の連投をまとめたユニットは、まとめた訳を送信先ごとに1通で送る
+        訳が揃った言語から送信を始め、最初の送信が終わるまでを first_delivery に記録する
+        MESSAGE_SYNC なら送ったメッセージと文ごとの訳を message_map に残す
+        """
+        started = time.perf_counter()
+        first = messages[0]
+        # 同じグループの別言語チャンネルだけ（送信先表はリンク変更時に作成済み）
+        routes: Dict[str, list] = {}
+        for route in self.links.routes(str(first.channel.id)):
+            routes.setdefault(route.lang, []).append(route)
+        sender = {"username": first.author.display_name, "avatar_url": first.author.display_avatar.url}
+        sent_ids = {} if MESSAGE_SYNC else None
+        delivered = False
+
+        async def send(targets: List[tuple]) -> dict:
+            nonlocal delivered
+            results = await self.fanout.send_all(targets, sent_ids, **sender)
+            if not delivered:
+                delivered = True
+                self.metrics.histogram(
+                    "translate_stage_seconds", STAGE_DOC, stage="first_delivery"
+                ).observe(time.perf_counter() - started)
+            return results
+
+        # ===== 自作モデル翻訳優先（足りない文だけGemini） =====
+        translations = {}
+        members = []
+        sends = []
+        try:
+            async for lang, content in self.translate_unit_stream(texts, src_lang, members, dictionary_only):
+                translations[lang] = content
+                targets = [(route.channel_id, route.webhook, content) for route in routes.get(lang, ())]
+                if targets:
+                    # Webhook送信失敗でも落ちない（送信先ごとの結果は fanout.stats に記録）
+                    sends.append(asyncio.ensure_future(send(targets)))
+            if not translations:
+                return
+
+            # ===== ログ保存 =====
+            with self.metrics.timer("translate_stage_seconds", STAGE_DOC, stage="log"):
+                for text, (parts, member_translations, complete) in zip(texts, members):
+                    if not complete:
+                        continue  # 原文のまま残した文がある（学習ログに原文を混ぜない）
+                    full_log = {src_lang: text}
+                    full_log.update(member_translations)
+                    self.save_translate_log(full_log)
+
+            # ===== ブロードキャスト =====
+            # 翻訳が終わった後に残っている送信を待つ
+            with self.metrics.timer("translate_stage_seconds", STAGE_DOC, stage="fanout"):
+                results = {}
+                for sent in await asyncio.gather(*sends):
+                    results.update(sent)
+            self.count_webhook_errors(results)
+        except asyncio.CancelledError:
+            # 終了時など。始めた送信も取り消す（届いた分は下で記録する）
+            for task in sends:
+                task.cancel()
+            raise
+        finally:
+            # 翻訳の途中で失敗・キャンセルされても、始めた送信は待って結果（例外）を回収し、
+            # 届いたメッセージは編集・削除を反映できるよう記録する
+            await asyncio.gather(*sends, return_exceptions=True)
+            if sent_ids:
+                self.record_sent(messages, texts, src_lang, members, translations, routes, sent_ids)
+
+    def record_sent(
+        self, messages: List[discord.Message], texts: List[str], src_lang: str, members: list,
+        translations: Dict[str, str], routes: Dict[str, list], sent_ids: Dict[str, int]
+    ):
+        """
+        送ったメッセージを message_map に残す
+        翻訳の途中で止まったときは members が揃っていないので、文ごとの訳の無い記録にする
+        （編集されたら全文を訳し直す）
+        """
+        by_target = {route.channel_id: route for lang_routes in routes.values() for route in lang_routes}
+        sent = {
+            target_cid: [by_target[target_cid].lang, by_target[target_cid].webhook, sent_id]
+            for target_cid, sent_id in sent_ids.items()
+        }
+        if len(members) < len(messages):
+            if len(messages) == 1:
+                members = [([], dict(translations), False)]
+            else:
+                members = members + [([], {}, False)] * (len(messages) - len(members))
+        unit = [message.id for message in messages]
+        for message, text, (parts, member_translations, _) in zip(messages, texts, members):
+            record = {
+                "channel_id": str(message.channel.id),
+                "src_lang": src_lang,
+                "text": text,
+                "parts": parts,
+                "translations": member_translations,
+                "sent": sent,
+            }
+            if len(unit) > 1:
+                # 送ったメッセージはメンバーの訳を改行でつないだもの
+                record["unit"] = unit
+                record["content"] = translations
+            self.message_map.put(message.id, record)
+
+    # =========================
+    # 編集・削除の反映
+    # =========================
+    @commands.Cog.listener()
+    async def on_raw_message_edit(self, payload: discord.RawMessageUpdateEvent):
+        # キャッシュに無い古いメッセージの編集も届くよう raw イベントで受ける
+        text = payload.data.get("content")
+        if text is None:
+            return  # 本文を含まない更新（本文が同じ更新は sync_edit で省く）
+        text = text.strip()
+        async with self.message_lock(payload.message_id):
+            if text and self.scheduler.update(payload.message_id, text):
+                return  # まだ待ち行列にいる（編集後の本文で訳す）
+            await self.sync_edit(payload.message_id, text)
+
+    @commands.Cog.listener()
+    async def on_raw_message_delete(self, payload: discord.RawMessageDeleteEvent):
+        await self.sync_delete(payload.message_id)
+
+    @commands.Cog.listener()
+    async def on_raw_bulk_message_delete(self, payload: discord.RawBulkMessageDeleteEvent):
+        await asyncio.gather(*(self.sync_delete(message_id) for message_id in payload.message_ids))
 
+    async def sync_edit(self, message_id: int, text: str):
+        """
+        編集後の本文で訳し直し、訳が変わった送信先のメッセージだけを書き換える
+        変わっていない文は前回の訳を使うので、Gemini に送るのは変わった文だけ
+        本文が前回と同じ更新（埋め込みの展開・ピン留めなど）は何もしない
+        """
+        record = self.message_map.get(message_id)
+        if record is None or not text:
+            return  # 送っていないメッセージ・本文が消えた（添付だけ残った）メッセージ
+        if text == record.get("text"):
+            return
+        src_lang = record["src_lang"]
+        translations, split, complete = await self.retranslate_message(record["parts"], text, src_lang)
         if not translations:
             return
 
-        # ===== ログ保存 =====
+        # 前回の訳に重ねない（編集後の本文で訳せなかった言語の古い訳を残すと、
+        # その言語の書き換えを飛ばしたり、まとめ直しで古い訳を送ったりする）
+        updated = {**record, "text": text, "parts": split, "translations": translations}
+        if updated["translations"] == record["translations"]:
+            self.message_map.put(message_id, updated)
+            return
+        unit = record.get("unit")
+        if unit is None:
+            self.message_map.put(message_id, updated)
+            await self.edit_sent(record["sent"], record["translations"], updated["translations"])
+        else:
+            async with self._unit_lock:
+                self.message_map.put(message_id, updated)
+                await self.sync_unit(unit)
+
+        if not complete:
+            return  # 原文のまま残した文がある（学習ログに原文を混ぜない）
         full_log = {src_lang: text}
         full_log.update(translations)
         self.save_translate_log(full_log)
 
-        # ===== ブロードキャスト =====
-        for target_cid, info in self.channel_links.items():
-            if info["lang"] == src_lang:
-                continue
-            content = translations.get(info["lang"])
-            if not content:
-                continue
-            try:
-                webhook = discord.Webhook.from_url(info["webhook"], session=self.session)
-                await webhook.send(
-                    content,
-                    username=message.author.display_name,
-                    avatar_url=message.author.display_avatar.url
-                )
-            except Exception:
-                pass  # Webhook送信失敗でも落ちない
+    async def sync_delete(self, message_id: int):
+        """元メッセージが消されたら送ったメッセージも消す"""
+        async with self.message_lock(message_id):
+            if self.scheduler.discard(message_id):
+                return  # まだ待ち行列にいた（送らずに終わる）
+            record = self.message_map.pop(message_id)
+        if record is None:
+            return
+        unit = record.get("unit")
+        if unit is not None and any(i != message_id and i in self.message_map for i in unit):
+            # まとめて送った他のメッセージは残っているので、残りだけで組み立て直す
+            async with self._unit_lock:
+                await self.sync_unit([i for i in unit if i != message_id])
+            return
+        targets = [(target_cid, url, sent_id) for target_cid, (_, url, sent_id) in record["sent"].items()]
+        self.metrics.counter("message_sync_total", "Edits and deletes mirrored to linked channels", action="delete").inc()
+        self.count_webhook_errors(await self.fanout.delete_all(targets))
+
+    async def sync_unit(self, unit: List[int]):
+        """まとめて送ったメッセージを、残っているメンバーの訳からつなぎ直して書き換える（_unit_lock の中で呼ぶ）"""
+        records = [(i, self.message_map.get(i)) for i in unit if i in self.message_map]
+        if not records:
+            return
+        first = records[0][1]
+        content = {
+            lang: "\n".join(r["translations"][lang] for _, r in records if r["translations"].get(lang))
+            for lang in first["content"]
+        }
+        members = [i for i, _ in records]
+        for i, r in records:
+            self.message_map.put(i, {**r, "unit": members, "content": content})
+        await self.edit_sent(first["sent"], first["content"], content)
+
+    async def edit_sent(self, sent: dict, old: Dict[str, str], new: Dict[str, str]):
+        """訳が変わった言語の送信先だけ書き換える"""
+        targets = [
+            (target_cid, url, sent_id, new[lang])
+            for target_cid, (lang, url, sent_id) in sent.items()
+            if new.get(lang) and new[lang] != old.get(lang)
+        ]
+        if not targets:
+            return
+        self.metrics.counter("message_sync_total", "Edits and deletes mirrored to linked channels", action="edit").inc()
+        self.count_webhook_errors(await self.fanout.edit_all(targets))
 
     # =========================
     # /setchat
     # =========================
     @app_commands.command(name="setchat", description="このチャンネルを翻訳連携に追加します")
-    async def setchat(self, interaction: discord.Interaction):
+    @app_commands.describe(
+        group="連携するグループ名（同じサーバーの同じグループのチャンネル同士だけで翻訳を送り合います）",
+        server="別サーバーのグループに入るときのサーバーID（相手が /share_group で許可したときだけ・管理者のみ）"
+    )
+    async def setchat(
+        self, interaction: discord.Interaction, group: Optional[str] = None, server: Optional[str] = None
+    ):
+        group = group.strip() if group else None
+        guild = str(interaction.guild_id) if interaction.guild_id else None
+        owner = server.strip() if server else None
+        if owner and owner != guild:
+            # 別サーバーへ流すのは、両方のサーバーの管理者が決めたときだけ
+            if not interaction.permissions.administrator:
+                await interaction.response.send_message("別サーバーとの連携は管理者だけが設定できます", ephemeral=True)
+                return
+            if not group or not self.links.is_shared(owner, group, guild):
+                await interaction.response.send_message(
+                    "そのサーバーのグループはこのサーバーに共有されていません（相手側で /share_group が必要です）",
+                    ephemeral=True
+                )
+                return
         options = [discord.SelectOption(label=name, value=code) for code, name in SUPPORTED_LANGS.items()]
         select = discord.ui.Select(placeholder="このチャンネルの言語を選択", options=options)
 
@@ -219,26 +757,56 @@ class TranslateCog(commands.Cog):
             lang = select.values[0]
             channel = inter.channel
             webhook = await channel.create_webhook(name=f"Translate-{lang}")
-            self.channel_links[str(channel.id)] = {"lang": lang, "webhook": webhook.url}
-            save_json(CHANNEL_LINK_PATH, self.channel_links)
-            await inter.response.send_message(f"✅ `{SUPPORTED_LANGS[lang]}` として設定しました", ephemeral=True)
+            old = self.links.set(str(channel.id), lang, webhook.url, group, guild, owner)
+            if old:
+                self.fanout.invalidate(old["webhook"])
+            await inter.response.send_message(
+                f"✅ `{SUPPORTED_LANGS[lang]}` として設定しました（グループ: `{self.links.group_of(str(channel.id))}`）",
+                ephemeral=True
+            )
 
         select.callback = callback
         view = discord.ui.View()
         view.add_item(select)
         await interaction.response.send_message("チャンネルの言語を選択してください", view=view, ephemeral=True)
 
+    # =========================
+    # /share_group
+    # =========================
+    @app_commands.command(name="share_group", description="このサーバーのグループに別サーバーのチャンネルが入るのを許可します")
+    @app_commands.describe(
+        group="共有するグループ名", server="許可するサーバーのID", allow="False で許可を取り消します"
+    )
+    @app_commands.default_permissions(administrator=True)
+    async def share_group(
+        self, interaction: discord.Interaction, group: str, server: str, allow: bool = True
+    ):
+        if not interaction.permissions.administrator:
+            await interaction.response.send_message("グループの共有は管理者だけが設定できます", ephemeral=True)
+            return
+        guild = str(interaction.guild_id) if interaction.guild_id else None
+        if guild is None or server.strip() == guild:
+            await interaction.response.send_message("別のサーバーのIDを指定してください", ephemeral=True)
+            return
+        if not self.links.share(guild, group.strip(), server.strip(), allow):
+            await interaction.response.send_message("このサーバーにそのグループはありません", ephemeral=True)
+            return
+        await interaction.response.send_message(
+            f"✅ グループ `{group.strip()}` をサーバー `{server.strip()}` と"
+            + ("共有しました" if allow else "共有するのをやめました"),
+            ephemeral=True
+        )
+
     # =========================
     # /delete_settings
     # =========================
     @app_commands.command(name="delete_settings", description="翻訳設定を解除します")
     async def delete_settings(self, interaction: discord.Interaction):
-        cid = str(interaction.channel.id)
-        if cid not in self.channel_links:
+        old = self.links.remove(str(interaction.channel.id))
+        if old is None:
             await interaction.response.send_message("このチャンネルは未登録です", ephemeral=True)
             return
-        del self.channel_links[cid]
-        save_json(CHANNEL_LINK_PATH, self.channel_links)
+        self.fanout.invalidate(old["webhook"])
         await interaction.response.send_message("🗑️ 翻訳設定を解除しました", ephemeral=True)
 
 
@@ -0,0 +1,182 @@
+import asyncio
+import gzip
+import json
+import os
+from typing import Iterator, List, Optional, Tuple
+
+DATA_DIR = "data"
+TRANSLATE_LOG_PATH = f"{DATA_DIR}/translate_logs.jsonl"
+LEGACY_LOG_PATH = f"{DATA_DIR}/translate_logs.json"  # 旧形式（JSON配列）
+
+# =========================
+# 読み込み・移行
+# =========================
+def open_log(path: str):
+    """ログをバイナリで開く（*.gz は日次ローテーション後の圧縮済みログとして展開）"""
+    if path.endswith(".gz"):
+        return gzip.open(path, "rb")
+    return open(path, "rb")
+
+def iter_log_records(path: str, end: Optional[int] = None) -> Iterator[dict]:
+    """
+    JSONLログを1行ずつ読む（壊れた行は飛ばす）
+    end: そのバイト位置までに収まる行だけを読む（追記中のログを途中で区切るとき）
+    """
+    if not os.path.exists(path):
+        return
+    offset = 0
+    with open_log(path) as f:
+        for line in f:
+            offset += len(line)
+            if end is not None and offset > end:
+                return
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line.decode("utf-8"))
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                continue
+
+def complete_size(path: str) -> int:
+    """最後の改行までのバイト数（書き込み途中の行を含めない）"""
+    if not os.path.exists(path):
+        return 0
+    with open(path, "rb") as f:
+        size = f.seek(0, os.SEEK_END)
+        while size > 0:
+            step = min(size, 64 * 1024)
+            f.seek(size - step)
+            chunk = f.read(step)
+            newline = chunk.rfind(b"\n")
+            if newline >= 0:
+                return size - step + newline + 1
+            size -= step
+    return 0
+
+def read_log_since(path: str, offset: int = 0, max_records: Optional[int] = None) -> Tuple[List[dict], int]:
+    """
+    バイトオフセット offset 以降に追記されたレコードを読む
+    書き込み途中（改行で終わらない）の行は次回に回す。
+    戻り値は (レコード, 次回のオフセット)
+    """
+    if not os.path.exists(path):
+        return [], 0
+    if os.path.getsize(path) < offset:
+        # ログが切り詰められた／差し替えられた場合は先頭から
+        offset = 0
+
+    records = []
+    with open(path, "rb") as f:
+        f.seek(offset)
+        for line in f:
+            if not line.endswith(b"\n"):
+                break
+            offset += len(line)
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                records.append(json.loads(line.decode("utf-8")))
+            except (json.JSONDecodeError, UnicodeDecodeError):
+                continue
+            if max_records is not None and len(records) >= max_records:
+                break
+    return records, offset
+
+def migrate_json_log(legacy_path: str = LEGACY_LOG_PATH, path: str = TRANSLATE_LOG_PATH) -> int:
+    """
+    旧形式のJSON配列ログをJSONLへ一度だけ移行する
+    移行後の旧ファイルは *.migrated にリネームして残す
+    JSONL が既にあるときは移行しない（前に差し込むと学習カーソルのバイト位置がずれ、
+    学習済みのレコードを学習し直す・未学習のレコードを飛ばすことになる）
+    """
+    if not os.path.exists(legacy_path):
+        return 0
+    if os.path.exists(path):
+        print(f"Legacy log not migrated: {path} already exists (merge {legacy_path} by hand and retrain)")
+        return 0
+    with open(legacy_path, "r", encoding="utf-8") as f:
+        logs = json.load(f)
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for log in logs:
+            f.write(json.dumps(log, ensure_ascii=False, separators=(",", ":")) + "\n")
+    os.replace(tmp_path, path)
+    os.replace(legacy_path, f"{legacy_path}.migrated")
+    return len(logs)
+
+# =========================
+# 書き込み
+# =========================
+class TranslateLogWriter:
+    """
+    翻訳ログをJSONL（1行1レコード）で追記するライター
+    on_message からはキューに積むだけで、件数か時間のしきい値で
+    まとめてスレッド上で書き込む
+    """
+    def __init__(self, path: str = TRANSLATE_LOG_PATH, batch_size: int = 100, flush_interval: float = 2.0):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    def write(self, record: dict):
+        """レコードをキューに積む（ブロックしない）"""
+        self._queue.put_nowait(record)
+
+    async def close(self):
+        """キューに残ったレコードを書き切って停止"""
+        if self._task is None:
+            return
+        self._queue.put_nowait(None)
+        await self._task
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            record = await self._queue.get()
+            if record is None:
+                return
+            batch = [record]
+            closing = False
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    record = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if record is None:
+                    closing = True
+                    break
+                batch.append(record)
+            await self._flush(batch)
+            if closing:
+                return
+
+    async def _flush(self, batch: List[dict]):
+        try:
+            await asyncio.to_thread(self._append, batch)
+        except Exception as e:
+            # ログ書き込み失敗でもBotは止めない
+            print("Translate log write failed:", e)
+
+    def _append(self, batch: List[dict]):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        lines = "".join(
+            json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n"
+            for record in batch
+        )
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(lines)
@@ -0,0 +1,200 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from cogs.lang_index import normalize_text
+from cogs.metrics import MetricsRegistry
+
+DATA_DIR = "data"
+CACHE_PATH = f"{DATA_DIR}/translation_cache.sqlite3"
+
+LOOKUP_DOC = "Translation cache lookups by result"
+EVICTION_DOC = "Translation cache entries evicted by reason"
+
+# =========================
+# 翻訳キャッシュ
+# =========================
+class TranslationCache:
+    """
+    Gemini 翻訳結果のキャッシュ
+    (src_lang, 正規化テキスト) をキーに、メモリ上は LRU + TTL で保持し、
+    SQLite に永続化して再起動後も使えるようにする。
+    ディスクへの書き込みは溜めておき、flush でまとめてスレッド上で行う
+    ヒット・ミス・追い出しの件数と件数・バイト数は metrics にも記録する
+    """
+    def __init__(
+        self, path: str = CACHE_PATH, max_bytes: int = 16 * 1024 * 1024,
+        ttl: float = 7 * 24 * 3600, flush_interval: float = 10.0,
+        metrics: Optional[MetricsRegistry] = None
+    ):
+        self.path = path
+        self.metrics = metrics or MetricsRegistry()
+        self.max_bytes = max_bytes  # キーと値のUTF-8長の合計で近似
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        self.hits = 0
+        self.misses = 0
+
+        self._items: "OrderedDict[tuple, tuple]" = OrderedDict()  # key → (expires_at, translations, size)
+        self._bytes = 0
+        self._pending_put: Dict[tuple, tuple] = {}
+        self._pending_delete = set()
+        self._pending_touch = set()  # ヒットしたキー（ディスク側の LRU 順を更新）
+        self._db: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    # =========================
+    # 起動・終了
+    # =========================
+    async def open(self):
+        await asyncio.to_thread(self._open_db)
+        self._task = asyncio.create_task(self._flush_loop())
+
+    async def close(self):
+        if self._task:
+            self._task.cancel()
+            self._task = None
+        await self.flush()
+        if self._db:
+            with self._db_lock:
+                self._db.close()
+            self._db = None
+
+    def _open_db(self):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        self._db = sqlite3.connect(self.path, check_same_thread=False)
+        with self._db_lock:
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                " src_lang TEXT NOT NULL, text TEXT NOT NULL,"
+                " translations TEXT NOT NULL, expires_at REAL NOT NULL,"
+                " last_used REAL NOT NULL,"
+                " PRIMARY KEY (src_lang, text))"
+            )
+            now = time.time()
+            self._db.execute("DELETE FROM cache WHERE expires_at <= ?", (now,))
+            self._db.commit()
+            rows = self._db.execute(
+                "SELECT src_lang, text, translations, expires_at FROM cache ORDER BY last_used"
+            ).fetchall()
+        for src_lang, text, raw, expires_at in rows:
+            self._store((src_lang, text), expires_at, json.loads(raw), persist=False)
+
+    # =========================
+    # 参照・登録
+    # =========================
+    def get(self, text: str, src_lang: str) -> Optional[Dict[str, str]]:
+        key = (src_lang, normalize_text(text))
+        item = self._items.get(key)
+        if item is None:
+            self._count("miss")
+            return None
+        expires_at, translations, _ = item
+        if expires_at <= time.time():
+            self._evict(key, reason="expired")
+            self._count("miss")
+            return None
+        self._items.move_to_end(key)
+        self._pending_touch.add(key)
+        self._count("hit")
+        return dict(translations)
+
+    def _count(self, result: str):
+        if result == "hit":
+            self.hits += 1
+        else:
+            self.misses += 1
+        self.metrics.counter("translation_cache_lookups_total", LOOKUP_DOC, result=result).inc()
+
+    def put(self, text: str, src_lang: str, translations: Dict[str, str]):
+        if not translations:
+            return
+        key = (src_lang, normalize_text(text))
+        self._store(key, time.time() + self.ttl, dict(translations), persist=True)
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "entries": len(self._items),
+            "bytes": self._bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def _store(self, key: tuple, expires_at: float, translations: dict, persist: bool):
+        if key in self._items:
+            self._evict(key, persist=False)
+        size = len(key[1].encode("utf-8")) + len(
+            json.dumps(translations, ensure_ascii=False).encode("utf-8")
+        )
+        self._items[key] = (expires_at, translations, size)
+        self._bytes += size
+        if persist:
+            self._pending_delete.discard(key)
+            self._pending_put[key] = (expires_at, translations)
+        while self._bytes > self.max_bytes and len(self._items) > 1:
+            oldest = next(iter(self._items))
+            self._evict(oldest, reason="size")
+        self._update_gauges()
+
+    def _evict(self, key: tuple, persist: bool = True, reason: Optional[str] = None):
+        _, _, size = self._items.pop(key)
+        self._bytes -= size
+        if persist:
+            self._pending_put.pop(key, None)
+            self._pending_delete.add(key)
+        if reason is not None:
+            self.metrics.counter("translation_cache_evictions_total", EVICTION_DOC, reason=reason).inc()
+            self._update_gauges()
+
+    def _update_gauges(self):
+        self.metrics.gauge("translation_cache_entries", "Entries held in the translation cache").set(len(self._items))
+        self.metrics.gauge(
+            "translation_cache_bytes", "Approximate UTF-8 size of the translation cache"
+        ).set(self._bytes)
+
+    # =========================
+    # 永続化
+    # =========================
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def flush(self):
+        if self._db is None or not (self._pending_put or self._pending_delete or self._pending_touch):
+            return
+        puts, self._pending_put = self._pending_put, {}
+        deletes, self._pending_delete = self._pending_delete, set()
+        touches, self._pending_touch = self._pending_touch - deletes - puts.keys(), set()
+        try:
+            await asyncio.to_thread(self._write, puts, deletes, touches)
+        except Exception as e:
+            # キャッシュの永続化失敗でもBotは止めない
+            print("Translation cache flush failed:", e)
+
+    def _write(self, puts: Dict[tuple, tuple], deletes: set, touches: set):
+        now = time.time()
+        with self._db_lock:
+            self._db.executemany(
+                "UPDATE cache SET last_used = ? WHERE src_lang = ? AND text = ?",
+                [(now, src_lang, text) for src_lang, text in touches]
+            )
+            self._db.executemany(
+                "DELETE FROM cache WHERE src_lang = ? AND text = ?", list(deletes)
+            )
+            self._db.executemany(
+                "INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?)",
+                [
+                    (src_lang, text, json.dumps(translations, ensure_ascii=False), expires_at, now)
+                    for (src_lang, text), (expires_at, translations) in puts.items()
+                ]
+            )
+            self._db.commit()
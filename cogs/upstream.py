@@ -0,0 +1,150 @@
+import asyncio
+import random
+import time
+from collections import deque
+from typing import Callable, Deque, Optional
+
+# =========================
+# 設定
+# =========================
+RETRY_BASE = 0.25  # 秒。n 回目の再試行は [0, min(RETRY_CAP, RETRY_BASE * 2**n)] のランダム
+RETRY_CAP = 4.0
+
+# =========================
+# 同時実行数（AIMD）
+# =========================
+class AdaptiveLimiter:
+    """
+    上流への同時リクエスト数の上限を AIMD で調整する
+      - 429 を受けたら上限を半分に（同じ時期に送った分の 429 では1回しか下げない）
+      - 成功するたびに 1/上限 ずつ増やす（上限ぶん成功すると +1）
+    空きが無いときは FIFO で待つ
+    """
+    def __init__(self, initial: int = 4, minimum: int = 1, maximum: int = 16):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.inflight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._last_decrease = 0.0
+
+    def has_capacity(self) -> bool:
+        return self.inflight < int(self.limit)
+
+    async def acquire(self) -> float:
+        """枠を1つ取る（戻り値は取得時刻。on_overload に渡す）"""
+        if self._waiters or not self.has_capacity():
+            future = asyncio.get_running_loop().create_future()
+            self._waiters.append(future)
+            try:
+                await future
+            except asyncio.CancelledError:
+                if future.done() and not future.cancelled():
+                    self.release()  # 枠を渡された直後に取り消された
+                raise
+        else:
+            self.inflight += 1
+        return time.monotonic()
+
+    def release(self):
+        self.inflight -= 1
+        self._wake()
+
+    def on_success(self):
+        self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+        self._wake()
+
+    def on_overload(self, started: float):
+        """429 を受けた（started は acquire の戻り値）"""
+        if started < self._last_decrease:
+            return  # 前回下げる前に送ったリクエスト
+        self.limit = max(self.minimum, self.limit / 2)
+        self._last_decrease = time.monotonic()
+
+    def _wake(self):
+        while self._waiters and self.has_capacity():
+            future = self._waiters.popleft()
+            if not future.done():
+                self.inflight += 1
+                future.set_result(None)
+
+# =========================
+# サーキットブレーカー
+# =========================
+class CircuitBreaker:
+    """
+    上流が不調なあいだは呼ばずにすぐ諦めるためのブレーカー
+      closed    : 通常
+      open      : failure_threshold 回続けて失敗した。reset_timeout 秒は呼ばない
+      half_open : 時間が経ったので1件だけ試す（成功で closed、失敗で open に戻る）
+    """
+    def __init__(
+        self, failure_threshold: int = 5, reset_timeout: float = 30.0,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.clock = clock
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self._probing = False
+
+    def available(self) -> bool:
+        """今呼べば allow() が通るか（状態は変えない）"""
+        if self.state == "closed":
+            return True
+        if self.state == "open":
+            return self.clock() - self.opened_at >= self.reset_timeout
+        return not self._probing
+
+    def allow(self) -> bool:
+        """呼んでよいか（half_open では1件だけ通す。通したら必ず結果を記録すること）"""
+        if self.state == "closed":
+            return True
+        if self.state == "open":
+            if self.clock() - self.opened_at < self.reset_timeout:
+                return False
+            self.state = "half_open"
+        if self._probing:
+            return False
+        self._probing = True
+        return True
+
+    def record_success(self):
+        self.state = "closed"
+        self.failures = 0
+        self._probing = False
+
+    def record_failure(self):
+        self._probing = False
+        self.failures += 1
+        if self.state == "half_open" or self.failures >= self.failure_threshold:
+            self.state = "open"
+            self.opened_at = self.clock()
+
+    def abandon(self):
+        """結果を待たずに取り消された（試行中の枠だけ返す）"""
+        self._probing = False
+
+# =========================
+# 再試行の待ち時間
+# =========================
+def backoff_delay(attempt: int, retry_after: Optional[float] = None) -> float:
+    """
+    attempt 回目（0始まり）の失敗後に待つ秒数（full jitter）
+    Retry-After があればそれより早くは送らない
+    """
+    delay = random.uniform(0, min(RETRY_CAP, RETRY_BASE * (2 ** attempt)))
+    if retry_after is not None:
+        delay = max(delay, retry_after)
+    return delay
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After ヘッダ（秒数のみ対応）"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
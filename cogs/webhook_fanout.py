@@ -0,0 +1,148 @@
+import asyncio
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+import aiohttp
+import discord
+
+# =========================
+# 設定
+# =========================
+# Discord の Webhook は1本あたりおおむね 2秒に5回まで
+WEBHOOK_LIMIT = 5        # WEBHOOK_PERIOD 秒あたりの送信回数
+WEBHOOK_PERIOD = 2.0     # 秒
+FANOUT_CONCURRENCY = 8   # 同時送信数の上限
+
+# =========================
+# スライディングウィンドウ
+# =========================
+class SlidingWindow:
+    """
+    ローカルのレート制限（直近 period 秒の送信を limit 回まで）
+    満杯から始まるトークンバケットと違い、最初のまとまった送信と補充分を合わせて上限を超えることがない
+    枠が無いときは一番古い送信が窓から出るまで待ってから送る（429を踏まない）
+    """
+    def __init__(self, limit: int, period: float):
+        self.limit = limit
+        self.period = period
+        self._sent: Deque[float] = deque()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                while self._sent and now - self._sent[0] >= self.period:
+                    self._sent.popleft()
+                if len(self._sent) < self.limit:
+                    self._sent.append(now)
+                    return
+                await asyncio.sleep(self.period - (now - self._sent[0]))
+
+# =========================
+# 並列ブロードキャスト
+# =========================
+class WebhookFanout:
+    """
+    翻訳結果を複数チャンネルの Webhook へ並列送信する
+      - Webhook オブジェクトは URL ごとに一度だけ作って使い回す
+      - 同時送信数は Semaphore で制限
+      - Webhook ごとのスライディングウィンドウでレート制限を守る
+      - 送信先ごとの成功／失敗を記録
+    """
+    def __init__(
+        self, session: aiohttp.ClientSession, concurrency: int = FANOUT_CONCURRENCY,
+        limit: int = WEBHOOK_LIMIT, period: float = WEBHOOK_PERIOD
+    ):
+        self.session = session
+        self.limit = limit
+        self.period = period
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._webhooks: Dict[str, discord.Webhook] = {}
+        self._buckets: Dict[str, SlidingWindow] = {}
+        self.stats: Dict[str, dict] = {}  # target_id → {"success", "failure", "last_error"}
+
+    def get_webhook(self, url: str) -> discord.Webhook:
+        webhook = self._webhooks.get(url)
+        if webhook is None:
+            webhook = discord.Webhook.from_url(url, session=self.session)
+            self._webhooks[url] = webhook
+            self._buckets[url] = SlidingWindow(self.limit, self.period)
+        return webhook
+
+    def invalidate(self, url: str):
+        """リンク解除・Webhook 再作成時にキャッシュを捨てる"""
+        self._webhooks.pop(url, None)
+        self._buckets.pop(url, None)
+
+    async def send_all(
+        self, targets: List[tuple], sent: Optional[Dict[str, int]] = None, **kwargs
+    ) -> Dict[str, Optional[Exception]]:
+        """
+        targets: [(target_id, webhook_url, content), ...]
+        sent: 渡すと送信できた target_id → Webhook メッセージID を入れる（応答を待って送る）
+        kwargs は webhook.send にそのまま渡す（username, avatar_url など）
+        戻り値は target_id → 失敗時の例外（成功なら None）
+        """
+        if sent is not None:
+            kwargs["wait"] = True
+
+        async def send(target_id: str, webhook: discord.Webhook, content: str):
+            message = await webhook.send(content, **kwargs)
+            if sent is not None:
+                sent[target_id] = message.id
+
+        results = await asyncio.gather(
+            *(self._call(target_id, url, send, content, sending=True) for target_id, url, content in targets)
+        )
+        return {target_id: error for (target_id, _, _), error in zip(targets, results)}
+
+    async def edit_all(self, targets: List[tuple]) -> Dict[str, Optional[Exception]]:
+        """
+        送信済みのメッセージを書き換える
+        targets: [(target_id, webhook_url, message_id, content), ...]
+        """
+        async def edit(target_id: str, webhook: discord.Webhook, message_id: int, content: str):
+            await webhook.edit_message(message_id, content=content)
+
+        results = await asyncio.gather(
+            *(self._call(target_id, url, edit, message_id, content) for target_id, url, message_id, content in targets)
+        )
+        return {target[0]: error for target, error in zip(targets, results)}
+
+    async def delete_all(self, targets: List[tuple]) -> Dict[str, Optional[Exception]]:
+        """
+        送信済みのメッセージを消す（既に消えていれば成功扱い）
+        targets: [(target_id, webhook_url, message_id), ...]
+        """
+        async def delete(target_id: str, webhook: discord.Webhook, message_id: int):
+            try:
+                await webhook.delete_message(message_id)
+            except discord.NotFound:
+                pass
+
+        results = await asyncio.gather(
+            *(self._call(target_id, url, delete, message_id) for target_id, url, message_id in targets)
+        )
+        return {target[0]: error for target, error in zip(targets, results)}
+
+    async def _call(self, target_id: str, url: str, op, *args, sending: bool = False) -> Optional[Exception]:
+        """op(target_id, webhook, *args) をレート制限と同時送信数の枠内で呼び、結果を記録する"""
+        stat = self.stats.setdefault(target_id, {"success": 0, "failure": 0, "last_error": None})
+        try:
+            webhook = self.get_webhook(url)
+            # レート待ちの間は同時送信枠を占有しない
+            await self._buckets[url].acquire()
+            async with self._semaphore:
+                await op(target_id, webhook, *args)
+        except Exception as e:
+            # Webhook送信失敗でも他の送信先は止めない
+            stat["failure"] += 1
+            stat["last_error"] = f"{type(e).__name__}: {e}"
+            if isinstance(e, discord.NotFound) and sending:
+                # Webhook が削除されている（編集時の NotFound はメッセージが消えただけのこともある）
+                self.invalidate(url)
+            return e
+        stat["success"] += 1
+        return None